@@ -10,8 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so that it times everything below it; inactive unless PROFILING_ENABLED
+    'mealkit.profiling.ProfilingMiddleware',
+    # Request latency per URL name and query counts for /metrics; off with METRICS_ENABLED
+    'mealkit.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,15 +87,143 @@ WSGI_APPLICATION = 'HomeChef.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Connection settings can be overridden from the environment. By default each
+# worker thread keeps its connection for DB_CONN_MAX_AGE seconds; DB_POOL_SIZE > 0
+# instead shares a pool of connections between threads (see mealkit/db/pool.py)
+
+
+# Read a boolean from the environment
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': 'HomeChefApiProject',
-        'USER': 'root',
-        'PASSWORD': '$Rajat@527$',
+        'ENGINE': 'mealkit.db.backends.mysql',
+        'NAME': os.environ.get('DB_NAME', 'HomeChefApiProject'),
+        'USER': os.environ.get('DB_USER', 'root'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', '$Rajat@527$'),
+        'HOST': os.environ.get('DB_HOST', ''),
+        'PORT': os.environ.get('DB_PORT', ''),
+        # Pooled connections go back to the pool at the end of every request
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': env_bool('DB_HEALTH_CHECKS', True),
+        'OPTIONS': {},
     }
 }
 
+if DB_POOL_SIZE:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'max_size': DB_POOL_SIZE,
+        # Seconds a request waits for a free connection
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        # Seconds before a connection is reopened, and before an idle one is dropped
+        'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800)),
+        'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        # Ping idle connections before reusing them
+        'check': env_bool('DB_HEALTH_CHECKS', True),
+    }
+
+# DB_ENGINE=sqlite runs against a local SQLite file instead, e.g. for the test
+# suite and the benchmark commands on a machine without MySQL
+DB_ENGINE = os.environ.get('DB_ENGINE', 'mysql')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DB_NAME') or BASE_DIR / 'db.sqlite3',
+    }
+elif DB_ENGINE != 'mysql':
+    raise ImproperlyConfigured(f'Unknown DB_ENGINE "{DB_ENGINE}", expected mysql or sqlite.')
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# Local memory by default; set REDIS_URL to share the cache between workers
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Response cache for the catalog endpoints (see mealkit/cache.py)
+API_CACHE_ENABLED = True
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# innodb_ft_min_token_size of the MySQL server; shorter search terms are ignored
+# as the FULLTEXT indexes do not hold them (see mealkit/search.py)
+MYSQL_FT_MIN_TOKEN_SIZE = int(os.environ.get('MYSQL_FT_MIN_TOKEN_SIZE', 3))
+
+# Seconds a process may keep serving a catalog feed snapshot after a newer one
+# was published, when the cache above is not shared (see mealkit/catalog.py)
+CATALOG_FEED_VERSION_TIMEOUT = 30
+
+
+# Password hashing
+# PBKDF2 with a work factor tunable from the environment; existing hashes are
+# re-encoded with the new factor on the next successful login
+
+PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 1_000_000))
+
+PASSWORD_HASHERS = [
+    'mealkit.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Outstanding refresh tokens issued at login are inserted in batches of this
+# size, or after this many seconds (1 writes every token immediately)
+LOGIN_TOKEN_BATCH_SIZE = int(os.environ.get('LOGIN_TOKEN_BATCH_SIZE', 50))
+LOGIN_TOKEN_FLUSH_INTERVAL = float(os.environ.get('LOGIN_TOKEN_FLUSH_INTERVAL', 1.0))
+
+
+# Background jobs (see mealkit/jobs.py)
+# 'database' queues jobs for `manage.py run_jobs` workers; 'sync' runs them in
+# process when the transaction commits, which the tests rely on
+
+JOB_QUEUE_MODE = os.environ.get('JOB_QUEUE_MODE', 'sync' if 'test' in sys.argv else 'database')
+
+# Request profiling (see mealkit/profiling.py)
+# Off by default; when on, a PROFILING_SAMPLE_RATE share of requests get a
+# Server-Timing header and a line in the rotating log read by `profile_report`
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 1.0))
+PROFILING_LOG_PATH = os.environ.get('PROFILING_LOG_PATH', BASE_DIR / 'logs' / 'profile.log')
+PROFILING_LOG_MAX_BYTES = 10 * 1024 * 1024
+PROFILING_LOG_BACKUPS = 5
+
+# Prometheus metrics served at /metrics (see mealkit/metrics.py)
+# With several worker processes (gunicorn), point METRICS_DIR at a directory
+# shared by them and emptied on each deploy: every worker writes its values there
+# every METRICS_FLUSH_INTERVAL seconds and /metrics adds them up. A non-empty
+# METRICS_TOKEN must be sent by the scraper as a Bearer token
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5.0))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Render the order and payment lists from values_list() rows instead of model
+# instances (see mealkit/fastpath.py); the JSON is the same either way
+FAST_SERIALIZATION_ENABLED = True
+
+# (latitude, longitude) delivery routes start from; None starts each route at
+# its northernmost stop (see mealkit/dispatch.py)
+DISPATCH_DEPOT = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -140,6 +276,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Report many=True validation errors as {index: errors}
+    'LIST_SERIALIZER_ERRORS_AS_DICT': True,
 }
 
 # Optionally, you can configure the JWT settings
@@ -151,6 +289,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Check the blacklist through the in-process revocation cache (mealkit/tokens.py)
+    'TOKEN_REFRESH_SERIALIZER': 'mealkit.tokens.CachedTokenRefreshSerializer',
     # 'ALGORITHM': 'HS256',
     # 'SIGNING_KEY': settings.SECRET_KEY,
     # 'VERIFYING_KEY': None,
@@ -164,3 +304,6 @@ SIMPLE_JWT = {
 
 AUTH_USER_MODEL = 'mealkit.User'
 
+# Seconds a refresh may trust a cached "not revoked" answer. Only safe when the
+# cache is shared by every worker, so that all of them see each revocation
+TOKEN_REVOCATION_CACHE_TIMEOUT = 300 if os.environ.get('REDIS_URL') else 0
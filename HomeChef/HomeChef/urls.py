@@ -16,8 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
+from mealkit.views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('mealkit.urls')),
+    # Prometheus scrape endpoint
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
@@ -51,7 +51,7 @@ class ChefKartServiceAdmin(admin.ModelAdmin):
 
 # Customize the ChefServiceBooking model admin interface
 class ChefServiceBookingAdmin(admin.ModelAdmin):
-    list_display = ('customer', 'service', 'event_type', 'booking_date', 'service_date', 'status', 'total_price')
+    list_display = ('customer', 'service', 'event_type', 'booking_date', 'service_date', 'service_end', 'status', 'total_price')
     search_fields = ('customer__user__username', 'service__service_type')
     list_filter = ('status', 'booking_date', 'service_date')
 
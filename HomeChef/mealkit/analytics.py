@@ -0,0 +1,244 @@
+# Import the modules needed to aggregate sales in SQL and maintain the daily rollup
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Min, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import ChefServiceBooking, Order, Payment, SalesRollup, SalesRollupDirtyDay, Subscription
+
+# Days rebuilt per transaction by the refresh
+REFRESH_BATCH_DAYS = 31
+
+# Rows written per INSERT by the refresh
+ROLLUP_BATCH_SIZE = 1000
+
+# Time buckets and dimensions results can be grouped by
+PERIODS = ('day', 'week', 'month')
+DIMENSIONS = ('status', 'meal_kit', 'chef', 'company')
+
+# Column of the rollup table holding each dimension
+ROLLUP_COLUMNS = {'status': 'status', 'meal_kit': 'meal_kit_id', 'chef': 'chef_id', 'company': 'company_id'}
+
+# How a source table is aggregated: its model, date column, the expression behind
+# each dimension (None when the source has no such dimension) and the summed columns
+SalesSource = namedtuple('SalesSource', ['model', 'date', 'dimensions', 'quantity', 'amount'])
+
+SALES_SOURCES = {
+    SalesRollup.ORDER: SalesSource(
+        Order, 'order_date',
+        {'status': F('status'), 'meal_kit': F('meal_kit_id'), 'chef': F('meal_kit__chef_id'), 'company': None},
+        'quantity', 'total_amount',
+    ),
+    SalesRollup.PAYMENT: SalesSource(
+        Payment, 'payment_date',
+        {'status': F('status'), 'meal_kit': F('order__meal_kit_id'), 'chef': F('order__meal_kit__chef_id'), 'company': None},
+        'order__quantity', 'amount',
+    ),
+    SalesRollup.BOOKING: SalesSource(
+        ChefServiceBooking, 'booking_date',
+        {'status': F('status'), 'meal_kit': None, 'chef': F('service__chef_id'), 'company': None},
+        None, 'total_price',
+    ),
+    # Companies only sell subscription plans, so they only appear here
+    SalesRollup.SUBSCRIPTION: SalesSource(
+        Subscription, 'start_date',
+        {
+            'status': Case(When(is_active=True, then=Value('active')), default=Value('inactive')),
+            'meal_kit': None, 'chef': None, 'company': F('plan__company_id'),
+        },
+        None, 'plan__price',
+    ),
+}
+
+# A parsed analytics request
+SalesQuery = namedtuple('SalesQuery', ['source', 'group_by', 'start', 'end', 'live'])
+
+
+# Alias of a grouped column; annotations may not reuse the model's field names
+def _label(name):
+    return f'by_{name}'
+
+
+# Start of a local day as an aware datetime, matching TruncDate's time zone
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+# The local day of a stored datetime
+def local_day(value):
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+# Group, count and sum a source table straight from its rows
+def live_sales(source, group_by, start=None, end=None):
+    spec = SALES_SOURCES[source]
+    queryset = spec.model._default_manager.all()
+    if start is not None:
+        queryset = queryset.filter(**{f'{spec.date}__gte': day_start(start)})
+    if end is not None:
+        queryset = queryset.filter(**{f'{spec.date}__lt': day_start(end + timedelta(days=1))})
+
+    day = TruncDate(spec.date)
+    periods = {'day': day, 'week': TruncWeek(day), 'month': TruncMonth(day)}
+    groups = {}
+    for name in group_by:
+        if name in periods:
+            groups[_label(name)] = periods[name]
+        elif spec.dimensions[name] is not None:
+            groups[_label(name)] = spec.dimensions[name]
+        else:
+            groups[_label(name)] = Value(None, output_field=IntegerField())
+    return queryset.values(**groups).annotate(
+        count=Count('pk'),
+        quantity=Coalesce(Sum(spec.quantity), 0) if spec.quantity else Value(0),
+        amount=Coalesce(Sum(spec.amount), Value(Decimal(0)), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ).order_by(*groups)
+
+
+# Group and sum the daily rollup rows of a source
+def rollup_sales(source, group_by, start=None, end=None):
+    queryset = SalesRollup.objects.filter(source=source)
+    if start is not None:
+        queryset = queryset.filter(day__gte=start)
+    if end is not None:
+        queryset = queryset.filter(day__lte=end)
+
+    periods = {'day': F('day'), 'week': TruncWeek('day'), 'month': TruncMonth('day')}
+    groups = {_label(name): periods[name] if name in periods else F(ROLLUP_COLUMNS[name]) for name in group_by}
+    return queryset.values(**groups).annotate(
+        count=Sum('count'),
+        quantity=Sum('quantity'),
+        amount=Sum('amount'),
+    ).order_by(*groups)
+
+
+# Run a parsed query; returns the grouped rows and their totals
+def sales_report(query):
+    aggregate = live_sales if query.live else rollup_sales
+    results = []
+    totals = {'count': 0, 'quantity': 0, 'amount': Decimal(0)}
+    for row in aggregate(query.source, query.group_by, query.start, query.end):
+        result = {name: row[_label(name)] for name in query.group_by}
+        for key in totals:
+            result[key] = row[key] or 0
+            totals[key] += result[key]
+        results.append(result)
+    return results, totals
+
+
+# Read the inclusive ?start= and ?end= days (YYYY-MM-DD) of a request
+def parse_date_range(params):
+    days = {}
+    for name in ('start', 'end'):
+        try:
+            days[name] = date.fromisoformat(params[name]) if params.get(name) else None
+        except ValueError:
+            raise serializers.ValidationError({name: ['Use the YYYY-MM-DD format.']})
+    return days['start'], days['end']
+
+
+# Read ?source=, ?group_by=, ?start=, ?end= and ?live= from a request
+def parse_sales_query(params):
+    source = params.get('source', SalesRollup.ORDER)
+    if source not in SALES_SOURCES:
+        raise serializers.ValidationError({'source': [f'Choose one of: {", ".join(SALES_SOURCES)}.']})
+
+    group_by = [name.strip() for name in params.get('group_by', 'day').split(',') if name.strip()]
+    for name in group_by:
+        if name not in PERIODS + DIMENSIONS:
+            raise serializers.ValidationError({'group_by': [f'Unknown grouping "{name}".']})
+        if name in DIMENSIONS and SALES_SOURCES[source].dimensions[name] is None:
+            raise serializers.ValidationError({'group_by': [f'{source} sales can not be grouped by {name}.']})
+
+    start, end = parse_date_range(params)
+    live = params.get('live', '').lower() in ('1', 'true', 'yes')
+    return SalesQuery(source, list(dict.fromkeys(group_by)), start, end, live)
+
+
+# Record that the sales of these instances' days must be recomputed
+def mark_sales_dirty(model, instances):
+    spec = next((spec for spec in SALES_SOURCES.values() if spec.model is model), None)
+    if spec is None:
+        return
+    days = {local_day(getattr(instance, spec.date)) for instance in instances if getattr(instance, spec.date, None)}
+    if days:
+        SalesRollupDirtyDay.objects.bulk_create([SalesRollupDirtyDay(day=day) for day in days], ignore_conflicts=True)
+
+
+# Split sorted days into runs of consecutive days, as (first, last) pairs
+def iter_day_ranges(days):
+    first = last = None
+    for day in sorted(days):
+        if last is not None and day == last + timedelta(days=1):
+            last = day
+            continue
+        if first is not None:
+            yield first, last
+        first = last = day
+    if first is not None:
+        yield first, last
+
+
+# Replace the rollup rows of `days` with totals computed from the source tables
+def rebuild_days(days):
+    days = set(days)
+    rows = []
+    with transaction.atomic():
+        SalesRollup.objects.filter(day__in=days).delete()
+        for first, last in iter_day_ranges(days):
+            for source in SALES_SOURCES:
+                for row in live_sales(source, ('day',) + DIMENSIONS, first, last):
+                    rows.append(SalesRollup(
+                        day=row[_label('day')],
+                        source=source,
+                        status=row[_label('status')] or '',
+                        meal_kit_id=row[_label('meal_kit')],
+                        chef_id=row[_label('chef')],
+                        company_id=row[_label('company')],
+                        count=row['count'],
+                        quantity=row['quantity'] or 0,
+                        amount=row['amount'] or 0,
+                    ))
+        SalesRollup.objects.bulk_create(rows, batch_size=ROLLUP_BATCH_SIZE)
+    return len(rows)
+
+
+# Every day from the oldest sale until today
+def all_sales_days():
+    oldest = [
+        spec.model._default_manager.aggregate(oldest=Min(spec.date))['oldest']
+        for spec in SALES_SOURCES.values()
+    ]
+    oldest = [local_day(value) for value in oldest if value is not None]
+    if not oldest:
+        return []
+    first, today = min(oldest), timezone.localdate()
+    return [first + timedelta(days=offset) for offset in range((today - first).days + 1)]
+
+
+# Rebuild the dirty days (and any extra `days`), `batch_days` per transaction;
+# returns the number of (days, rows) rebuilt
+def refresh_sales_rollup(days=(), batch_days=REFRESH_BATCH_DAYS):
+    rebuilt_days = rebuilt_rows = 0
+    days = sorted(set(days))
+    for index in range(0, len(days), batch_days):
+        batch = days[index:index + batch_days]
+        rebuilt_rows += rebuild_days(batch)
+        rebuilt_days += len(batch)
+
+    while True:
+        with transaction.atomic():
+            # Locking the marks makes concurrent writers of these days wait
+            # and mark them again, so no sale is left out of the rollup
+            dirty = list(SalesRollupDirtyDay.objects.select_for_update().order_by('day')[:batch_days])
+            if not dirty:
+                break
+            SalesRollupDirtyDay.objects.filter(pk__in=[mark.pk for mark in dirty]).delete()
+            rebuilt_rows += rebuild_days(mark.day for mark in dirty)
+            rebuilt_days += len(dirty)
+    return rebuilt_days, rebuilt_rows
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MealkitConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mealkit'
+
+    def ready(self):
+        # Connect the model signal handlers
+        from . import signals
+        # Register the background jobs the signals queue
+        from . import tasks
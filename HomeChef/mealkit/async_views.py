@@ -0,0 +1,224 @@
+# Import the modules needed to serve the read-heavy catalog from async views under ASGI
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import InvalidPage, Page
+from django.http import Http404, HttpResponse
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import CachedResponseMixin, cached_response, get_response_cache, make_cache_entry
+from .facets import FacetedListMixin, get_requested_facets
+from .metrics import CACHE_REQUESTS
+from .pagination import COUNT_EXACT, get_count_mode
+from .views import (
+    ChefProfileDetailView, ChefProfileListCreateView, CompanyDetailView, CompanyListCreateView,
+    MealKitDetailView, MealKitListView, SubscriptionPlanDetailView, SubscriptionPlanListView,
+)
+
+
+# JWT authentication that looks the user up with the async ORM
+class AsyncJWTAuthentication(JWTAuthentication):
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    # Same checks as JWTAuthentication.get_user
+    async def aget_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('User not found'), code='user_not_found')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise exceptions.AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+
+# Async GET for a sync DRF catalog view: reuses its queryset, eager loading, filters,
+# serializer, pagination, permissions and response cache, but reads the database
+# with the async ORM so that an ASGI worker is not held by a thread per request
+class AsyncCatalogView(View):
+    # The DRF view this view serves asynchronously
+    sync_view = None
+    # Whether the view renders one object looked up by `pk` instead of a page
+    detail = False
+    # Only reads are served asynchronously
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            drf_request, view = await self.initialize(request, args, kwargs)
+            if not self.detail and not self.is_async_page(drf_request, view):
+                # Cursor pages and estimated counts are served by the sync view in a thread
+                return await sync_to_async(self.sync_view.as_view())(request, *args, **kwargs)
+            if isinstance(view, CachedResponseMixin) and view.is_cacheable(drf_request):
+                return await self.get_cached(drf_request, view)
+            data = await self.get_data(drf_request, view)
+            return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+        except Exception as exc:
+            return self.handle_exception(request, exc)
+
+    async def initialize(self, request, args, kwargs):
+        drf_request = Request(request)
+        authenticated = await AsyncJWTAuthentication().aauthenticate(request)
+        drf_request.user, drf_request.auth = authenticated or (AnonymousUser(), None)
+        drf_request.accepted_renderer = JSONRenderer()
+        drf_request.accepted_media_type = JSONRenderer.media_type
+
+        view = self.sync_view(request=drf_request, args=args, kwargs=kwargs, format_kwarg=None, headers={})
+        try:
+            view.check_permissions(drf_request)
+        except exceptions.PermissionDenied:
+            # DRF answers anonymous requests with 401 when an authenticator could have helped
+            if drf_request.user.is_authenticated:
+                raise
+            raise exceptions.NotAuthenticated()
+        return drf_request, view
+
+    def is_async_page(self, drf_request, view):
+        paginator = view.paginator
+        return (
+            paginator.get_pagination_mode(drf_request, view) == 'page'
+            and get_count_mode(drf_request, paginator.count_query_param, paginator.default_count_mode) == COUNT_EXACT
+        )
+
+    async def get_cached(self, drf_request, view):
+        # The version lookups are plain cache reads, safe to run off the event loop
+        key = await sync_to_async(view.get_cache_key, thread_sensitive=False)(drf_request)
+        cache = get_response_cache()
+        entry = await cache.aget(key)
+        CACHE_REQUESTS.inc('miss' if entry is None else 'hit')
+        if entry is None:
+            entry = make_cache_entry(await self.get_data(drf_request, view))
+            await cache.aset(key, entry, view.get_cache_timeout())
+        return cached_response(drf_request, entry)
+
+    async def get_data(self, drf_request, view):
+        queryset = view.get_queryset()
+        if view.filter_backends:
+            # Filter validation and the search index may read the database
+            queryset = await sync_to_async(view.filter_queryset)(queryset)
+        if self.detail:
+            return await self.get_object_data(drf_request, view, queryset)
+        return await self.get_page_data(drf_request, view, queryset)
+
+    async def get_object_data(self, drf_request, view, queryset):
+        lookup = view.lookup_url_kwarg or view.lookup_field
+        try:
+            instance = await queryset.aget(**{view.lookup_field: view.kwargs[lookup]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        view.check_object_permissions(drf_request, instance)
+        return view.get_serializer(instance).data
+
+    async def get_page_data(self, drf_request, view, queryset):
+        # Facets named by ?facets= are checked before the page is read, as by the sync view
+        requested = get_requested_facets(drf_request, view.facets) if isinstance(view, FacetedListMixin) else None
+        paginator = view.paginator
+        page_size = paginator.get_page_size(drf_request)
+        page_number = drf_request.query_params.get(paginator.page_query_param) or 1
+        django_paginator = paginator.django_paginator_class(queryset, page_size)
+
+        if page_number in paginator.last_page_strings:
+            django_paginator.count = await queryset.acount()
+            page_number = django_paginator.num_pages
+        try:
+            offset = (int(page_number) - 1) * page_size
+        except (TypeError, ValueError):
+            offset = None
+
+        # Count the rows and fetch the page at the same time
+        async def fetch_page():
+            if offset is None or offset < 0:
+                return []
+            return [row async for row in queryset[offset:offset + page_size].aiterator(chunk_size=page_size)]
+
+        count, rows = await asyncio.gather(queryset.acount(), fetch_page())
+        django_paginator.count = count
+        try:
+            number = django_paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise exceptions.NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        # Render the page through the view's own paginator for identical links
+        paginator.request = drf_request
+        paginator.page = Page(rows, number, django_paginator)
+        paginator.keyset = None
+        paginator.count_mode = COUNT_EXACT
+        serializer = view.get_serializer(rows, many=True)
+        data = paginator.get_paginated_response(serializer.data).data
+        if requested:
+            # The filters and the counting query run in a thread, like the filters above
+            data['facets'] = await sync_to_async(view.get_facet_counts)(requested)
+        return data
+
+    def handle_exception(self, request, exc):
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = AsyncJWTAuthentication().authenticate_header(request)
+        response = exception_handler(exc, {})
+        if response is None:
+            raise exc
+        rendered = HttpResponse(JSONRenderer().render(response.data), status=response.status_code, content_type='application/json')
+        for header, value in response.headers.items():
+            if header.lower() != 'content-type':
+                rendered[header] = value
+        return rendered
+
+
+# Async Meal Kit List View
+class AsyncMealKitListView(AsyncCatalogView):
+    sync_view = MealKitListView
+
+# Async Meal Kit Detail View
+class AsyncMealKitDetailView(AsyncCatalogView):
+    sync_view = MealKitDetailView
+    detail = True
+
+# Async ChefProfile List View
+class AsyncChefProfileListView(AsyncCatalogView):
+    sync_view = ChefProfileListCreateView
+
+# Async ChefProfile Detail View
+class AsyncChefProfileDetailView(AsyncCatalogView):
+    sync_view = ChefProfileDetailView
+    detail = True
+
+# Async Company List View
+class AsyncCompanyListView(AsyncCatalogView):
+    sync_view = CompanyListCreateView
+
+# Async Company Detail View
+class AsyncCompanyDetailView(AsyncCatalogView):
+    sync_view = CompanyDetailView
+    detail = True
+
+# Async Subscription Plan List View
+class AsyncSubscriptionPlanListView(AsyncCatalogView):
+    sync_view = SubscriptionPlanListView
+
+# Async Subscription Plan Detail View
+class AsyncSubscriptionPlanDetailView(AsyncCatalogView):
+    sync_view = SubscriptionPlanDetailView
+    detail = True
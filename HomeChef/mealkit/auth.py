@@ -0,0 +1,144 @@
+# Import the modules needed for the login pipeline
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .metrics import LOGINS
+from .models import User
+from .tokens import SESSION_CLAIM, SessionRefreshToken
+
+logger = logging.getLogger(__name__)
+
+# Columns the login needs: the password and the user type flags
+LOGIN_USER_FIELDS = ('id', 'username', 'password', 'is_active', 'is_customer', 'is_company', 'is_chef')
+
+
+# Find the user and verify the password with one single-row query; returns None
+# when the credentials are invalid
+def authenticate_login(username, password):
+    user = User.objects.only(*LOGIN_USER_FIELDS).filter(username=username).first() if username else None
+    if user is None:
+        # Hash anyway so that response times do not reveal which usernames exist
+        User().set_password(password)
+        LOGINS.inc('failure')
+        return None
+    if not user.is_active or not user.check_password(password):
+        LOGINS.inc('failure')
+        return None
+    LOGINS.inc('success')
+    return user
+
+
+# The user type reported by the login, resolved from the already loaded flags
+def get_login_user_type(user):
+    if user.is_customer:
+        return 'customer'
+    if user.is_company:
+        return 'company'
+    if user.is_chef:
+        return 'chef'
+    return None
+
+
+# Collects the OutstandingToken rows of issued refresh tokens and inserts them
+# with one bulk INSERT per batch, or after LOGIN_TOKEN_FLUSH_INTERVAL seconds.
+# Rows still buffered are lost when the worker is killed without running its
+# exit handlers (e.g. SIGKILL); such tokens still work but can only be revoked
+# by presenting them, which writes their row
+class OutstandingTokenBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.timer = None
+
+    def add(self, token, user, encoded):
+        row = OutstandingToken(
+            user_id=user.pk,
+            jti=token[api_settings.JTI_CLAIM],
+            token=encoded,
+            created_at=token.current_time,
+            expires_at=datetime_from_epoch(token['exp']),
+        )
+        batch_size = getattr(settings, 'LOGIN_TOKEN_BATCH_SIZE', 1)
+        if batch_size <= 1:
+            row.save()
+            return
+        with self.lock:
+            self.pending.append(row)
+            full = len(self.pending) >= batch_size
+            if not full and self.timer is None:
+                self.timer = threading.Timer(getattr(settings, 'LOGIN_TOKEN_FLUSH_INTERVAL', 1.0), self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self.flush()
+
+    # Write every pending row now; returns the number of rows written
+    def flush(self):
+        with self.lock:
+            rows, self.pending = self.pending, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if rows:
+            OutstandingToken.objects.bulk_create(rows, ignore_conflicts=True)
+        return len(rows)
+
+    def flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not write outstanding tokens')
+        finally:
+            # The timer thread's connections are not closed by any request
+            connections.close_all()
+
+
+# Buffer shared by every login of this process; flushed on exit
+outstanding_tokens = OutstandingTokenBuffer()
+atexit.register(outstanding_tokens.flush)
+
+
+# Refresh token whose outstanding-token row goes through `outstanding_tokens`
+# instead of an INSERT inside the login request
+class BatchedRefreshToken(SessionRefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        # Skip BlacklistMixin.for_user, which writes the row immediately
+        return super(BlacklistMixin, cls).for_user(user)
+
+
+# Issue a refresh/access token pair; returns the encoded (refresh, access)
+def issue_tokens(user):
+    refresh = BatchedRefreshToken.for_user(user)
+    encoded = str(refresh)
+    outstanding_tokens.add(refresh, user, encoded)
+    return encoded, str(refresh.access_token)
+
+
+# Blacklist the refresh token of the session `access` belongs to, or the user's
+# newest stored one for access tokens issued without SESSION_CLAIM
+def revoke_session(user, access):
+    outstanding_tokens.flush()
+    jti = access.get(SESSION_CLAIM) if access is not None else None
+    if jti is None:
+        token = OutstandingToken.objects.filter(user=user).latest('created_at')
+    else:
+        # Another worker may still buffer the row; the row written here makes its
+        # insert a no-op. The expiry is an upper bound: the refresh token was issued
+        # before this access token
+        issued_at = datetime_from_epoch(access['iat'])
+        token, _ = OutstandingToken.objects.get_or_create(jti=jti, defaults={
+            'user_id': user.pk,
+            'token': '',
+            'created_at': issued_at,
+            'expires_at': issued_at + api_settings.REFRESH_TOKEN_LIFETIME,
+        })
+    BlacklistedToken.objects.get_or_create(token=token)
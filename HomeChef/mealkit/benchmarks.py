@@ -0,0 +1,421 @@
+# Import the modules needed to seed a synthetic dataset and benchmark the API
+import asyncio
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import *
+from .ratings import rebuild_rating_aggregates
+
+# Page sizes requested from every paginated list endpoint
+PAGE_SIZES = (2, 5, 10)
+
+# Default size of the synthetic dataset
+DEFAULT_SCALE = {
+    'companies': 50,
+    'customers': 2000,
+    'chefs': 200,
+    'meal_kits': 1000,
+    'orders': 3000,
+    'reviews': 2000,
+    'gift_cards': 100,
+    'cart_items': 1000,
+    'subscriptions': 500,
+}
+
+# A single endpoint route from mealkit/urls.py
+Route = namedtuple('Route', ['name', 'url', 'is_list'])
+
+# The measurements recorded for one endpoint and page size
+EndpointResult = namedtuple('EndpointResult', ['name', 'url', 'page_size', 'status', 'queries', 'p50', 'p95', 'bytes'])
+
+# Throughput of one catalog endpoint served through one interface
+ThroughputResult = namedtuple('ThroughputResult', ['path', 'interface', 'concurrency', 'requests', 'per_second', 'p50', 'p95', 'errors'])
+
+# Catalog paths served both by the sync views and, under async/, by the async views
+CATALOG_PATHS = ('meal-kits/', 'chef-profiles/', 'companies/', 'subscription-plans/')
+
+# Rows rendered per second by one serialization engine of a list endpoint
+SerializationResult = namedtuple('SerializationResult', ['path', 'engine', 'rows', 'per_second', 'identical'])
+
+# List endpoints rendered through the values_list() fast path (see mealkit/fastpath.py)
+FAST_PATH_ROUTES = ('order-list', 'payment-list')
+
+# Login throughput for one password work factor and token batch size
+LoginResult = namedtuple('LoginResult', ['iterations', 'batch_size', 'logins', 'per_second', 'p50', 'p95', 'queries'])
+
+
+# Create every row in one INSERT per batch and return the primary keys in order
+def _bulk_create(model, objects):
+    model.objects.bulk_create(objects, batch_size=500)
+    return list(model.objects.order_by('pk').values_list('pk', flat=True))
+
+
+# Seed a synthetic dataset covering every model served by the API
+def seed_dataset(seed=0, **scale):
+    counts = dict(DEFAULT_SCALE, **scale)
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    company_ids = _bulk_create(Company, [
+        Company(
+            company_name=f'Company {i}',
+            email=f'company{i}@example.com',
+            food_type=rng.choice([Company.VEG, Company.NON_VEG, Company.BOTH]),
+            category=rng.choice([Company.BREAKFAST, Company.LUNCH, Company.DINNER]),
+        )
+        for i in range(counts['companies'])
+    ])
+    plan_ids = _bulk_create(SubscriptionPlan, [
+        SubscriptionPlan(
+            plan_name=rng.choice(['2peopleperweek', '4peopleperweek']),
+            description=f'Plan for company {company_id}',
+            price=Decimal(rng.randint(50, 300)),
+            duration=timedelta(weeks=4),
+            meals_per_week=rng.randint(2, 7),
+            company_id=company_id,
+        )
+        for company_id in company_ids
+    ])
+    customer_ids = _bulk_create(Customer, [
+        Customer(
+            customer_name=f'Customer {i}',
+            gender=rng.choice(['male', 'female', 'other']),
+            age=rng.randint(18, 80),
+            mobile=f'{rng.randint(0, 9999999999):010d}',
+            address=f'{i} Main Street',
+        )
+        for i in range(counts['customers'])
+    ])
+    chef_ids = _bulk_create(ChefProfile, [
+        ChefProfile(
+            chef_name=f'Chef {i}',
+            bio='Home cook with a passion for regional food.',
+            cooking_experience=rng.randint(1, 30),
+            speciality=rng.choice(['Italian', 'Indian', 'Thai', 'Mexican', 'Vegan']),
+        )
+        for i in range(counts['chefs'])
+    ])
+    meal_kit_ids = _bulk_create(MealKit, [
+        MealKit(
+            chef_id=rng.choice(chef_ids),
+            meal_name=f'Meal kit {i}',
+            description='A balanced meal for the whole family.',
+            price=Decimal(rng.randint(5, 60)),
+            preparation_time=timedelta(minutes=rng.randint(10, 90)),
+            servings=rng.choice([2, 4]),
+            ingredients='rice, lentils, onion, tomato, spices',
+        )
+        for i in range(counts['meal_kits'])
+    ])
+    order_ids = _bulk_create(Order, [
+        Order(
+            customer_id=rng.choice(customer_ids),
+            meal_kit_id=rng.choice(meal_kit_ids),
+            quantity=rng.randint(1, 4),
+            total_amount=Decimal(rng.randint(5, 240)),
+            status=rng.choice([Order.PENDING, Order.COMPLETED]),
+        )
+        for i in range(counts['orders'])
+    ])
+    _bulk_create(Payment, [
+        Payment(order_id=order_id, amount=Decimal(rng.randint(5, 240)), payment_method='card')
+        for order_id in order_ids
+    ])
+    _bulk_create(Delivery, [
+        Delivery(
+            order_id=order_id,
+            delivery_date=now + timedelta(days=rng.randint(0, 14)),
+            delivery_address=f'{order_id} Delivery Road',
+            delivery_status=rng.choice(['pending', 'in_progress', 'completed']),
+        )
+        for order_id in order_ids
+    ])
+    _bulk_create(Review, [
+        Review(
+            customer_id=rng.choice(customer_ids),
+            meal_kit_id=rng.choice(meal_kit_ids),
+            rating=rng.randint(1, 5),
+            comment='Tasty and easy to cook.',
+            review_date=now - timedelta(days=rng.randint(0, 365)),
+        )
+        for i in range(counts['reviews'])
+    ])
+    # bulk_create skips the review signals, so compute the ratings in one pass
+    rebuild_rating_aggregates()
+    gift_card_ids = _bulk_create(GiftCard, [
+        GiftCard(gift_amount=rng.choice([70, 100, 150]), expiry_date=now + timedelta(days=365))
+        for i in range(counts['gift_cards'])
+    ])
+    _bulk_create(CartItem, [
+        CartItem(
+            customer_id=rng.choice(customer_ids),
+            meal_kit_id=rng.choice(meal_kit_ids),
+            quantity=rng.randint(1, 3),
+            gift_card_id=rng.choice(gift_card_ids + [None]),
+        )
+        for i in range(counts['cart_items'])
+    ])
+    _bulk_create(Subscription, [
+        Subscription(
+            customer_name_id=rng.choice(customer_ids),
+            plan_id=rng.choice(plan_ids),
+            end_date=now + timedelta(weeks=4),
+        )
+        for i in range(counts['subscriptions'])
+    ])
+    return counts
+
+
+# Never touch the configured database: use a fresh test database instead
+@contextmanager
+def test_database():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+# A fresh test database seeded with the synthetic dataset
+@contextmanager
+def seeded_test_database(**scale):
+    with test_database():
+        seed_dataset(**scale)
+        yield
+
+
+# Collect the list and detail routes of mealkit/urls.py with a URL to request
+def discover_routes():
+    from . import urls
+
+    routes = []
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        view_class = getattr(pattern.callback, 'view_class', None)
+        queryset = getattr(view_class, 'queryset', None)
+        if queryset is None:
+            continue
+        if pattern.name.endswith('-list'):
+            routes.append(Route(pattern.name, reverse(pattern.name), True))
+        elif pattern.name.endswith('-detail'):
+            pk = queryset.model.objects.order_by('pk').values_list('pk', flat=True).first()
+            if pk is not None:
+                routes.append(Route(pattern.name, reverse(pattern.name, kwargs={'pk': pk}), False))
+    return routes
+
+
+# Return the given percentile of a list of timings
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# Request an endpoint `repeat` times and record query count, latency and size
+def benchmark_endpoint(client, route, page_size=None, repeat=5):
+    params = {'page_size': page_size} if page_size is not None else {}
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(route.url, params)
+            timings.append((time.perf_counter() - started) * 1000)
+    return EndpointResult(
+        name=route.name,
+        url=route.url,
+        page_size=page_size,
+        status=response.status_code,
+        queries=len(queries),
+        p50=_percentile(timings, 50),
+        p95=_percentile(timings, 95),
+        bytes=len(response.content),
+    )
+
+
+# Benchmark every route, list routes once per page size
+def run_benchmarks(client, page_sizes=PAGE_SIZES, repeat=5):
+    results = []
+    for route in discover_routes():
+        sizes = page_sizes if route.is_list else (None,)
+        for page_size in sizes:
+            results.append(benchmark_endpoint(client, route, page_size, repeat))
+    return results
+
+
+# Return the names of list routes whose query count changes with the page size
+def find_query_regressions(results):
+    counts = {}
+    for result in results:
+        counts.setdefault(result.name, set()).add(result.queries)
+    return sorted(name for name, values in counts.items() if len(values) > 1)
+
+
+# Create login users whose passwords are hashed with the current work factor
+def create_login_users(count, prefix='login'):
+    users = [User(username=f'{prefix}{i}', is_customer=True) for i in range(count)]
+    password = 'benchmark-password'
+    # Hash once and share it: every user then costs the same to verify
+    users[0].set_password(password)
+    for user in users:
+        user.password = users[0].password
+    User.objects.bulk_create(users)
+    return [(user.username, password) for user in users]
+
+
+# Log in `logins` times round-robin over `credentials` and measure throughput
+def benchmark_logins(client, credentials, logins=50):
+    from .auth import outstanding_tokens
+
+    timings, queries = [], 0
+    for i in range(logins):
+        username, password = credentials[i % len(credentials)]
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.post(reverse('login'), {'username': username, 'password': password}, format='json')
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'Login failed with status {response.status_code}: {response.content[:200]!r}')
+        queries += len(captured)
+    # Include the deferred token writes in the measured time
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        outstanding_tokens.flush()
+        flush_ms = (time.perf_counter() - started) * 1000
+    total_ms = sum(timings) + flush_ms
+    return (
+        logins * 1000 / total_ms,
+        _percentile(timings, 50),
+        _percentile(timings, 95),
+        (queries + len(captured)) / logins,
+    )
+
+
+# Summarize (status, milliseconds) samples taken over `elapsed` seconds
+def _throughput(path, interface, concurrency, samples, elapsed):
+    timings = [ms for _, ms in samples]
+    return ThroughputResult(
+        path=path,
+        interface=interface,
+        concurrency=concurrency,
+        requests=len(samples),
+        per_second=len(samples) / elapsed if elapsed else 0.0,
+        p50=_percentile(timings, 50),
+        p95=_percentile(timings, 95),
+        errors=sum(1 for status, _ in samples if status != 200),
+    )
+
+
+# Run `request()` `requests` times from `concurrency` threads
+def _run_threads(request, requests, concurrency):
+    def worker(count):
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            status = request()
+            samples.append((status, (time.perf_counter() - started) * 1000))
+        return samples
+
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        samples = [sample for chunk in pool.map(worker, counts) for sample in chunk]
+    return samples, time.perf_counter() - started
+
+
+# Requests through the in-process WSGI handler, one test client per thread
+def benchmark_wsgi(path, headers, requests=200, concurrency=8):
+    clients = {}
+
+    def request():
+        client = clients.setdefault(threading.get_ident(), Client(headers=headers))
+        return client.get(path).status_code
+
+    samples, elapsed = _run_threads(request, requests, concurrency)
+    return _throughput(path, 'wsgi', concurrency, samples, elapsed)
+
+
+# Requests through the in-process ASGI handler from `concurrency` coroutines
+def benchmark_asgi(path, headers, requests=200, concurrency=8):
+    async def worker(client, count):
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            samples.append((response.status_code, (time.perf_counter() - started) * 1000))
+        return samples
+
+    async def run():
+        client = AsyncClient()
+        counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        return await asyncio.gather(*(worker(client, count) for count in counts))
+
+    started = time.perf_counter()
+    chunks = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    return _throughput(path, 'asgi', concurrency, [sample for chunk in chunks for sample in chunk], elapsed)
+
+
+# Requests over HTTP to a running server, e.g. uvicorn or gunicorn
+def benchmark_http(url, headers, requests=200, concurrency=8, interface='http'):
+    def request():
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+    samples, elapsed = _run_threads(request, requests, concurrency)
+    return _throughput(url, interface, concurrency, samples, elapsed)
+
+
+# Render the first `rows` rows of a list view to JSON `repeat` times with its
+# serializer, then with its row plan; the first result is the previous behaviour
+def benchmark_serialization(route_name, rows=1000, repeat=5):
+    from . import urls
+    from .fastpath import get_row_plan
+    from .mixins import optimize_queryset
+
+    pattern = next(pattern for pattern in urls.urlpatterns if getattr(pattern, 'name', None) == route_name)
+    view_class = pattern.callback.view_class
+    serializer_class = view_class.serializer_class
+    # The queryset the view loads, with its joins
+    queryset = optimize_queryset(view_class.queryset.order_by('pk'), serializer_class)
+    plan = get_row_plan(serializer_class)
+    renderer = JSONRenderer()
+    engines = {
+        'serializer': lambda: renderer.render(serializer_class(list(queryset[:rows]), many=True).data),
+        'fast-path': lambda: renderer.render(plan.render_rows(plan.apply(queryset)[:rows])),
+    }
+
+    count = queryset[:rows].count()
+    outputs, timings = {}, {}
+    for engine, render in engines.items():
+        timings[engine] = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            outputs[engine] = render()
+            timings[engine].append(time.perf_counter() - started)
+    identical = outputs['fast-path'] == outputs['serializer']
+    return [
+        SerializationResult(reverse(route_name), engine, count, count / _percentile(timings[engine], 50), identical)
+        for engine in engines
+    ]
@@ -0,0 +1,186 @@
+# Import the modules needed to book chefs without double booking and to search their availability
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from .analytics import day_start
+from .models import ChefKartService, ChefProfile, ChefServiceBooking
+
+# Bookings that keep a chef busy; cancelled ones free the time again
+BUSY_STATUSES = ('pending', 'confirmed', 'completed')
+
+# Services returned by an availability search at most
+AVAILABILITY_LIMIT = 100
+
+
+# Raised when a booking would overlap another booking of the same chef
+class BookingConflict(Exception):
+    pass
+
+
+# Static interval tree over half-open [start, end) ranges, for checking many ranges
+# against a schedule: each node keeps the intervals containing its center, sorted
+# by start and by end, so a query only visits the nodes its range can reach
+class IntervalTree:
+    # One node: its center, the intervals containing it and the subtrees around it
+    Node = namedtuple('Node', ['center', 'by_start', 'by_end', 'left', 'right'])
+
+    def __init__(self, intervals=()):
+        # (start, end, value) triples; empty ranges can not overlap anything
+        intervals = [interval for interval in intervals if interval[0] < interval[1]]
+        self.size = len(intervals)
+        self.root = self._build(sorted(intervals, key=lambda interval: interval[:2]))
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def _build(cls, intervals):
+        if not intervals:
+            return None
+        center = intervals[len(intervals) // 2][0]
+        here, left, right = [], [], []
+        for interval in intervals:
+            if interval[1] <= center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+        # `intervals` is sorted by start, and so are the partitions
+        return cls.Node(
+            center, here, sorted(here, key=lambda interval: interval[1], reverse=True),
+            cls._build(left), cls._build(right),
+        )
+
+    # The (start, end, value) intervals overlapping [start, end)
+    def overlapping(self, start, end):
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end <= node.center:
+                # Only the intervals here that start before the range ends
+                for interval in node.by_start:
+                    if interval[0] >= end:
+                        break
+                    found.append(interval)
+                stack.append(node.left)
+            elif start > node.center:
+                # Only the intervals here that end after the range starts
+                for interval in node.by_end:
+                    if interval[1] <= start:
+                        break
+                    found.append(interval)
+                stack.append(node.right)
+            else:
+                # The range contains the center, and so overlaps everything here
+                found.extend(node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return sorted(found, key=lambda interval: interval[:2])
+
+
+# Busy bookings of the chefs overlapping [start, end), served by booking_chef_range_idx
+def busy_bookings(chef_ids, start, end):
+    return ChefServiceBooking.objects.filter(
+        chef__in=chef_ids, status__in=BUSY_STATUSES, service_date__lt=end, service_end__gt=start,
+    )
+
+
+# An interval tree of each chef's busy bookings overlapping [start, end), from one query
+def chef_schedules(chef_ids, start, end):
+    intervals = defaultdict(list)
+    for pk, chef_id, booked_start, booked_end in busy_bookings(chef_ids, start, end).values_list(
+        'pk', 'chef_id', 'service_date', 'service_end',
+    ):
+        intervals[chef_id].append((booked_start, booked_end, pk))
+    return defaultdict(IntervalTree, {chef_id: IntervalTree(items) for chef_id, items in intervals.items()})
+
+
+# The free parts of [start, end) between the busy (start, end, value) intervals
+def free_ranges(busy, start, end):
+    free = []
+    cursor = start
+    for busy_start, busy_end, _ in sorted(busy, key=lambda interval: interval[:2]):
+        if busy_start > cursor:
+            free.append((cursor, min(busy_start, end)))
+        cursor = max(cursor, busy_end)
+        if cursor >= end:
+            break
+    if cursor < end:
+        free.append((cursor, end))
+    return free
+
+
+# Book `service` for the customer from `service_date` for the service's duration;
+# the chef's row is locked, so concurrent bookings of one chef are checked one at a time
+def book_service(customer, service, service_date, event_type):
+    service_end = service_date + service.duration
+    with transaction.atomic():
+        ChefProfile.objects.select_for_update().filter(pk=service.chef_id).first()
+        conflict = busy_bookings([service.chef_id], service_date, service_end).order_by('service_date').first()
+        if conflict is not None:
+            raise BookingConflict(conflict)
+        return ChefServiceBooking.objects.create(
+            customer=customer,
+            service=service,
+            event_type=event_type,
+            service_date=service_date,
+            total_price=service.price,
+            status='pending',
+        )
+
+
+# Read ?service_type= and either ?start= (an ISO 8601 date and time: the service must
+# fit from then on) or ?date= (YYYY-MM-DD: the service must fit somewhere that day)
+def parse_availability_query(params):
+    service_type = params.get('service_type')
+    choices = [value for value, _ in ChefKartService.SERVICE_TYPE_CHOICES]
+    if service_type not in choices:
+        raise serializers.ValidationError({'service_type': [f'Choose one of: {", ".join(choices)}.']})
+
+    if params.get('start'):
+        start = parse_datetime(params['start'])
+        if start is None:
+            raise serializers.ValidationError({'start': ['Use the ISO 8601 date and time format.']})
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        return service_type, start, None
+    try:
+        day = date.fromisoformat(params.get('date', ''))
+    except ValueError:
+        raise serializers.ValidationError({'date': ['Give a day as YYYY-MM-DD, or a ?start= time.']})
+    return service_type, day_start(day), day_start(day + timedelta(days=1))
+
+
+# Available services of a type whose chef is free long enough: from `start` for the
+# service's duration, or at some point before `end` when it is given. Two queries:
+# the services, then the busy bookings of their chefs, checked in interval trees
+def available_services(service_type, start, end=None, limit=AVAILABILITY_LIMIT):
+    services = list(
+        ChefKartService.objects.filter(service_type=service_type, available=True)
+        .select_related('chef').order_by('price', 'pk')
+    )
+    if not services:
+        return []
+    window_end = end or start + max(service.duration for service in services)
+    schedules = chef_schedules({service.chef_id for service in services}, start, window_end)
+
+    results = []
+    for service in services:
+        service_end = end or start + service.duration
+        busy = schedules[service.chef_id].overlapping(start, service_end)
+        slots = [(slot_start, slot_end) for slot_start, slot_end in free_ranges(busy, start, service_end)
+                 if slot_end - slot_start >= service.duration]
+        if slots:
+            results.append((service, slots))
+            if len(results) == limit:
+                break
+    return results
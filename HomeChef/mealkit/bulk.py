@@ -0,0 +1,187 @@
+# Import the modules needed for bulk create/update endpoints
+from django.db import transaction
+from rest_framework import generics, serializers, status
+from rest_framework.response import Response
+from rest_framework.validators import UniqueValidator
+
+from .checkout import bulk_create_returning_ids
+from .signals import post_bulk_save
+
+# Rows written per INSERT/UPDATE statement
+BULK_BATCH_SIZE = 500
+
+
+# Primary key field that resolves ids from objects preloaded for the whole list
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        objects = self.context.get('bulk_related', {}).get(self.field_name)
+        if objects is None:
+            return super().to_internal_value(data)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except Exception:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in objects:
+            self.fail('does_not_exist', pk_value=data)
+        return objects[pk]
+
+
+# List serializer that validates in one pass and writes with bulk_create/bulk_update
+class BulkListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.preload_related(data)
+        return super().to_internal_value(data)
+
+    def preload_related(self, data):
+        # One query per foreign key instead of one per item
+        related = self._context.setdefault('bulk_related', {})
+        for name, field in self.child.fields.items():
+            if not isinstance(field, BulkPrimaryKeyRelatedField) or field.read_only:
+                continue
+            pk_field = field.get_queryset().model._meta.pk
+            ids = set()
+            for item in data:
+                if isinstance(item, dict) and item.get(name) is not None:
+                    try:
+                        ids.add(pk_field.to_python(item[name]))
+                    except Exception:
+                        pass
+            related[name] = field.get_queryset().in_bulk(ids)
+
+    def run_child_validation(self, data):
+        # Updates validate each item against the instance with the same id
+        if self.instance is not None:
+            self.child.instance = self.instances_by_id.get(data.get('id')) if isinstance(data, dict) else None
+        return super().run_child_validation(data)
+
+    @property
+    def instances_by_id(self):
+        if not hasattr(self, '_instances_by_id'):
+            self._instances_by_id = {instance.pk: instance for instance in self.instance}
+        return self._instances_by_id
+
+    def validate(self, attrs):
+        # Unique columns are checked with one query per field for the whole list
+        model = self.child.Meta.model
+        instances = list(self.instance) if self.instance is not None else [None] * len(attrs)
+        errors = {}
+        for name in self.child.bulk_unique_fields:
+            seen = {}
+            for index, item in enumerate(attrs):
+                if name not in item:
+                    continue
+                value = item[name]
+                key = value.pk if hasattr(value, 'pk') else value
+                if key in seen:
+                    errors.setdefault(index, {})[name] = ['Duplicate value in this request.']
+                seen.setdefault(key, index)
+            if not seen:
+                continue
+            own_ids = {instance.pk for instance in instances if instance is not None}
+            taken = model._default_manager.filter(**{f'{name}__in': list(seen)}).exclude(pk__in=own_ids)
+            for key in taken.values_list(model._meta.get_field(name).attname, flat=True):
+                errors.setdefault(seen[key], {})[name] = [f'{model._meta.verbose_name} with this {name} already exists.']
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        instances = [model(**attrs) for attrs in validated_data]
+        # The ids are set on MySQL too, for the response and the signal's receivers
+        for start in range(0, len(instances), BULK_BATCH_SIZE):
+            bulk_create_returning_ids(model, instances[start:start + BULK_BATCH_SIZE])
+        post_bulk_save.send(sender=model, instances=instances, created=True)
+        return instances
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                fields.add(name)
+        if fields:
+            model._default_manager.bulk_update(instances, sorted(fields), batch_size=BULK_BATCH_SIZE)
+        post_bulk_save.send(sender=model, instances=instances, created=False)
+        return instances
+
+
+# Base serializer for bulk writes; set Meta.list_serializer_class = BulkListSerializer
+class BulkModelSerializer(serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Replace per-item UniqueValidator queries with the list-wide check
+        self.bulk_unique_fields = []
+        for name, field in fields.items():
+            unique = [validator for validator in field.validators if isinstance(validator, UniqueValidator)]
+            if unique:
+                field.validators = [validator for validator in field.validators if validator not in unique]
+                self.bulk_unique_fields.append(name)
+        return fields
+
+
+# Return list serializer errors as {index: errors} for the failing items only
+def get_item_errors(errors):
+    if isinstance(errors, list):
+        return {index: error for index, error in enumerate(errors) if error}
+    return errors
+
+
+# POST a JSON array to create, PATCH a JSON array of objects with `id` to update;
+# all items are validated first and written in a single transaction
+class BulkCreateUpdateAPIView(generics.GenericAPIView):
+    # Maximum number of items accepted per request
+    bulk_max_items = 1000
+
+    def get_bulk_serializer(self, *args, **kwargs):
+        kwargs.update(many=True, max_length=self.bulk_max_items, allow_empty=False)
+        return self.get_serializer(*args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_bulk_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'errors': get_item_errors(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            instances = serializer.save()
+        return Response({'count': len(instances), 'results': serializer.data}, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'errors': {'non_field_errors': ['Expected a list of items.']}}, status=status.HTTP_400_BAD_REQUEST)
+
+        pk_field = self.get_queryset().model._meta.pk
+        ids, seen, errors = [], set(), {}
+        for index, item in enumerate(items):
+            try:
+                pk = pk_field.to_python(item['id'])
+            except Exception:
+                pk = None
+            if pk is None:
+                errors[index] = {'id': ['A valid id is required.']}
+            elif pk in seen:
+                errors[index] = {'id': ['Duplicate id in this request.']}
+            ids.append(pk)
+            seen.add(pk)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        items = [dict(item, id=pk) for item, pk in zip(items, ids)]
+
+        with transaction.atomic():
+            # Lock every row being updated with one query
+            instances = self.get_queryset().select_for_update().in_bulk(ids)
+            for index, pk in enumerate(ids):
+                if pk not in instances:
+                    errors[index] = {'id': [f'Object with id={pk} does not exist.']}
+            if errors:
+                return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = self.get_bulk_serializer([instances[pk] for pk in ids], data=items, partial=True)
+            if not serializer.is_valid():
+                return Response({'errors': get_item_errors(serializer.errors)}, status=status.HTTP_400_BAD_REQUEST)
+            instances = serializer.save()
+        return Response({'count': len(instances), 'results': serializer.data}, status=status.HTTP_200_OK)
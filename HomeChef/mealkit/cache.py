@@ -0,0 +1,125 @@
+# Import the modules needed to cache rendered API responses
+import hashlib
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import CACHE_REQUESTS
+
+# Prefix of every key written by the response cache
+CACHE_KEY_PREFIX = 'api-response'
+
+
+# Return the cache backend used for API responses
+def get_response_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+# Key holding the current version of a model's cached responses
+def _version_key(model):
+    return f'{CACHE_KEY_PREFIX}:version:{model._meta.label_lower}'
+
+
+# Return the current version of each model, creating missing versions.
+# A missing (e.g. evicted) version gets a fresh random value, so older
+# entries can never be served again.
+def get_versions(models):
+    cache = get_response_cache()
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+# Move a model's responses to a new version so that cached entries are skipped
+def invalidate_model(model):
+    cache = get_response_cache()
+    cache.set(_version_key(model), uuid4().hex, None)
+    # Invalidate again once the write is visible, in case a concurrent
+    # request re-cached the old rows in between
+    transaction.on_commit(lambda: cache.set(_version_key(model), uuid4().hex, None))
+
+
+# Describe the requesting user for the cache key
+def get_user_type(user):
+    if not user or not user.is_authenticated:
+        return 'anonymous'
+    if user.is_staff:
+        return 'staff'
+    if user.is_customer:
+        return 'customer'
+    if user.is_company:
+        return 'company'
+    if user.is_chef:
+        return 'chef'
+    return 'user'
+
+
+# Render response data into a cache entry: (JSON content, ETag)
+def make_cache_entry(data):
+    content = JSONRenderer().render(data)
+    return (content, quote_etag(hashlib.md5(content).hexdigest()))
+
+
+# Serve a cache entry, answering a matching If-None-Match with 304
+def cached_response(request, entry):
+    content, etag = entry
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept', 'Authorization'])
+    return response
+
+
+# Mixin for read-heavy views: caches rendered GET responses per path,
+# query string and user type, and answers If-None-Match with 304
+class CachedResponseMixin:
+    # Models whose changes invalidate this view's responses
+    cache_models = ()
+    # Seconds a cached response stays valid (defaults to API_CACHE_TIMEOUT)
+    cache_timeout = None
+
+    def get_cache_key(self, request):
+        query = '&'.join(f'{key}={value}' for key, value in sorted(request.query_params.lists()))
+        versions = ':'.join(get_versions(self.get_cache_models()))
+        raw = f'{request.path}?{query}|{get_user_type(request.user)}|{versions}'
+        return f'{CACHE_KEY_PREFIX}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def get_cache_models(self):
+        return self.cache_models or (self.get_queryset().model,)
+
+    def get_cache_timeout(self):
+        if self.cache_timeout is not None:
+            return self.cache_timeout
+        return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+    def is_cacheable(self, request):
+        # Only JSON responses are cached; the browsable API is rendered per request
+        return getattr(settings, 'API_CACHE_ENABLED', True) and request.accepted_renderer.format == 'json'
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        CACHE_REQUESTS.inc('miss' if cached is None else 'hit')
+        if cached is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = make_cache_entry(response.data)
+            cache.set(key, cached, self.get_cache_timeout())
+        return cached_response(request, cached)
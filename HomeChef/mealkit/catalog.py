@@ -0,0 +1,200 @@
+# Import the modules needed to build and serve the precomputed catalog feed
+import gzip
+import hashlib
+import json
+import re
+from collections import namedtuple
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.http import parse_etags
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_response_cache
+from .jobs import enqueue
+from .models import CatalogFeedDirty, CatalogFeedRow, CatalogSnapshot, MealKit, SubscriptionPlan
+
+# Older snapshots kept besides the newest one
+SNAPSHOTS_KEPT = 3
+
+# Meal kits rendered per query while rebuilding rows
+REBUILD_BATCH_SIZE = 500
+
+# Shared cache key holding the newest snapshot version
+VERSION_CACHE_KEY = 'catalog-feed-version'
+
+# Job building the first snapshot, and the shared cache key set for FIRST_BUILD_TIMEOUT
+# seconds once it is queued, so that concurrent first requests queue it once
+FIRST_BUILD_JOB = 'catalog_first_build'
+FIRST_BUILD_CACHE_KEY = 'catalog-feed-first-build'
+FIRST_BUILD_TIMEOUT = 300
+
+# Seconds a client is told to wait while the first snapshot is being built
+FIRST_BUILD_RETRY_AFTER = 10
+
+# gzip level of the stored feed; each version is compressed once
+COMPRESS_LEVEL = 6
+
+# Accept-Encoding values allowing a gzip response (as in GZipMiddleware)
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+# What one refresh did: rows rendered and the published version
+RefreshResult = namedtuple('RefreshResult', ['rows', 'version'])
+
+
+# Record that catalog rows must be rebuilt: those of `meal_kit_ids`, of every meal
+# kit of `chef_ids`, and with `plans` the subscription plans; returns whether any was
+def mark_catalog_dirty(meal_kit_ids=(), chef_ids=(), plans=False):
+    marks = [CatalogFeedDirty(meal_kit_id=pk) for pk in set(meal_kit_ids) if pk is not None]
+    marks += [CatalogFeedDirty(chef_id=pk) for pk in set(chef_ids) if pk is not None]
+    if plans:
+        marks.append(CatalogFeedDirty())
+    if marks:
+        CatalogFeedDirty.objects.bulk_create(marks)
+    return bool(marks)
+
+
+# Render the feed rows of the meal kits in `queryset`, `batch_size` per query;
+# returns the number of rows written
+def rebuild_rows(queryset, batch_size=REBUILD_BATCH_SIZE):
+    # The serializers import the model signals, which import this module
+    from .serializers import CatalogFeedRowSerializer
+
+    renderer = JSONRenderer()
+    written = 0
+    last = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last).select_related('chef').order_by('pk')[:batch_size])
+        if not batch:
+            return written
+        last = batch[-1].pk
+        data = CatalogFeedRowSerializer(batch, many=True).data
+        CatalogFeedRow.objects.bulk_create([
+            CatalogFeedRow(meal_kit_id=meal_kit.pk, chef_id=meal_kit.chef_id, content=renderer.render(item).decode())
+            for meal_kit, item in zip(batch, data)
+        ])
+        written += len(batch)
+
+
+# Assemble a new snapshot from the stored rows and the active plans, compress it
+# once and drop all but the newest SNAPSHOTS_KEPT older ones
+def publish_snapshot():
+    from .serializers import SubscriptionPlanSerializer
+
+    snapshot = CatalogSnapshot.objects.create(content=b'', etag='')
+    rows = list(CatalogFeedRow.objects.order_by('meal_kit_id').values_list('content', flat=True))
+    plans = SubscriptionPlan.objects.filter(is_active=True).select_related('company').order_by('pk')
+    body = ''.join([
+        '{"version":', str(snapshot.pk),
+        ',"generated_at":', json.dumps(serializers.DateTimeField().to_representation(snapshot.created_at)),
+        ',"meal_kits":[', ','.join(rows), ']',
+        ',"subscription_plans":', JSONRenderer().render(SubscriptionPlanSerializer(plans, many=True).data).decode(),
+        '}',
+    ]).encode()
+
+    snapshot.meal_kit_count = len(rows)
+    snapshot.size = len(body)
+    # mtime=0 keeps the compressed bytes a function of the content alone
+    snapshot.content = gzip.compress(body, compresslevel=COMPRESS_LEVEL, mtime=0)
+    snapshot.etag = hashlib.sha256(body).hexdigest()[:32]
+    snapshot.save(update_fields=['meal_kit_count', 'size', 'content', 'etag'])
+
+    old = list(CatalogSnapshot.objects.filter(pk__lt=snapshot.pk).order_by('-pk').values_list('pk', flat=True)[SNAPSHOTS_KEPT:])
+    if old:
+        CatalogSnapshot.objects.filter(pk__in=old).delete()
+    # Point every process at the new version once it is visible to them
+    transaction.on_commit(partial(
+        get_response_cache().set, VERSION_CACHE_KEY, snapshot.pk, getattr(settings, 'CATALOG_FEED_VERSION_TIMEOUT', 30),
+    ))
+    return snapshot
+
+
+# Rebuild the rows marked dirty (or every row with `full`, or before the first
+# snapshot) and publish a new snapshot; returns None when nothing changed since the last one
+def refresh_catalog_feed(full=False):
+    full = full or not CatalogSnapshot.objects.exists()
+    with transaction.atomic():
+        # Locking the marks makes concurrent writers of these rows wait and mark
+        # them again, so no change is left out of the feed
+        marks = list(CatalogFeedDirty.objects.select_for_update())
+        if not marks and not full:
+            return None
+        CatalogFeedDirty.objects.filter(pk__in=[mark.pk for mark in marks]).delete()
+
+        if full:
+            stale = CatalogFeedRow.objects.all()
+            meal_kits = MealKit.objects.all()
+        else:
+            meal_kit_ids = {mark.meal_kit_id for mark in marks if mark.meal_kit_id is not None}
+            chef_ids = {mark.chef_id for mark in marks if mark.chef_id is not None}
+            # Rows of deleted meal kits are dropped and not rendered again
+            stale = CatalogFeedRow.objects.filter(Q(meal_kit_id__in=meal_kit_ids) | Q(chef_id__in=chef_ids))
+            meal_kits = MealKit.objects.filter(Q(pk__in=meal_kit_ids) | Q(chef_id__in=chef_ids))
+        stale.delete()
+        rows = rebuild_rows(meal_kits)
+        snapshot = publish_snapshot()
+    return RefreshResult(rows, snapshot.pk)
+
+
+# A snapshot as served by this process; decompressed on demand for clients
+# that do not accept gzip
+class LoadedSnapshot:
+    def __init__(self, version, compressed, etag):
+        self.version = version
+        self.compressed = compressed
+        self.etag = etag
+
+    @cached_property
+    def content(self):
+        return gzip.decompress(self.compressed)
+
+
+# The newest snapshot loaded by this process
+_loaded = None
+
+
+# Version of the newest snapshot, from the shared cache when it holds it
+def get_current_version():
+    cache = get_response_cache()
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        version = CatalogSnapshot.objects.order_by('-pk').values_list('pk', flat=True).first()
+        if version is not None:
+            cache.set(VERSION_CACHE_KEY, version, getattr(settings, 'CATALOG_FEED_VERSION_TIMEOUT', 30))
+    return version
+
+
+# Queue the first build in the job worker, once per FIRST_BUILD_TIMEOUT seconds
+def queue_first_build():
+    if get_response_cache().add(FIRST_BUILD_CACHE_KEY, True, FIRST_BUILD_TIMEOUT):
+        enqueue(FIRST_BUILD_JOB)
+
+
+# The newest snapshot, loaded from the database once per version; None while
+# there is none yet, the first one being built by a job rather than the request
+def get_catalog_snapshot():
+    global _loaded
+    version = get_current_version()
+    if version is None:
+        queue_first_build()
+        return None
+    loaded = _loaded
+    if loaded is None or loaded.version < version:
+        # The newest at or after `version`, which may have been dropped since
+        row = CatalogSnapshot.objects.filter(pk__gte=version).order_by('-pk').values_list('pk', 'content', 'etag').first()
+        loaded = _loaded = LoadedSnapshot(row[0], bytes(row[1]), row[2])
+    return loaded
+
+
+# Whether an If-None-Match header names the snapshot; the ETag is weak as the
+# same snapshot is sent with and without gzip
+def etag_matches(header, etag):
+    return any(tag == '*' or tag.removeprefix('W/') == f'"{etag}"' for tag in parse_etags(header))
+
+
+def accepts_gzip(request):
+    return bool(ACCEPTS_GZIP.search(request.headers.get('Accept-Encoding', '')))
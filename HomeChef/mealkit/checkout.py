@@ -0,0 +1,128 @@
+# Import the modules needed to turn a customer's cart into orders in one transaction
+from collections import namedtuple
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework import serializers
+
+from .models import CartItem, Delivery, GiftCard, Order, Payment
+from .signals import post_bulk_save
+
+# Days between checkout and delivery when the client does not choose a date
+DEFAULT_DELIVERY_DAYS = 2
+
+# What a checkout created, and the gift card credit it used
+CheckoutResult = namedtuple('CheckoutResult', ['orders', 'payments', 'deliveries', 'total_amount', 'gift_card_credit'])
+
+
+# Raised when the ids of the new orders can not be read back unambiguously
+class CheckoutConflict(Exception):
+    pass
+
+
+# bulk_create that also sets the primary keys on backends whose INSERT can not
+# return them (MySQL), by reading back the rows created after the newest in `scope`
+def bulk_create_returning_ids(model, objects, **scope):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model._default_manager.bulk_create(objects)
+    queryset = model._default_manager.filter(**scope)
+    last = queryset.aggregate(last=Max('pk'))['last'] or 0
+    model._default_manager.bulk_create(objects)
+    ids = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True))
+    if len(ids) != len(objects):
+        raise CheckoutConflict(f'Expected {len(objects)} new {model._meta.verbose_name_plural}, found {len(ids)}.')
+    for instance, pk in zip(objects, ids):
+        instance.pk = pk
+        instance._state.adding = False
+    return objects
+
+
+# Balance a gift card can pay with at checkout, or 0 when it is inactive or expired
+def gift_card_balance(gift_card, now):
+    if gift_card is None or not gift_card.is_active:
+        return Decimal(0)
+    if gift_card.expiry_date is not None and gift_card.expiry_date <= now:
+        return Decimal(0)
+    return Decimal(gift_card.gift_amount * gift_card.quantity)
+
+
+# Check out every item in the customer's cart: one order, payment and delivery per
+# item, priced at the current meal kit price less the item's gift card; gift cards
+# are used up and the cart is emptied, all or nothing
+def checkout_cart(customer, payment_method, delivery_address=None, delivery_date=None):
+    now = timezone.now()
+    delivery_address = delivery_address or customer.address
+    if not delivery_address:
+        raise serializers.ValidationError({'delivery_address': ['The customer has no address on file.']})
+    delivery_date = delivery_date or now + timedelta(days=DEFAULT_DELIVERY_DAYS)
+
+    with transaction.atomic():
+        # Lock the cart and its gift cards and read the prices in one query; the
+        # meal kits are not locked, so checkouts do not queue behind each other
+        lock = {'of': ('self', 'gift_card')} if connection.features.has_select_for_update_of else {}
+        items = list(
+            CartItem.objects.select_for_update(**lock)
+            .filter(customer=customer)
+            .select_related('meal_kit', 'gift_card')
+            .order_by('pk')
+        )
+        if not items:
+            raise serializers.ValidationError({'cart': ['The cart is empty.']})
+
+        errors = {}
+        for item in items:
+            if item.meal_kit is None:
+                errors[item.pk] = ['This item has no meal kit.']
+            elif not item.meal_kit.is_available:
+                errors[item.pk] = [f'{item.meal_kit.meal_name} is not available.']
+        if errors:
+            raise serializers.ValidationError({'items': errors})
+
+        # A gift card pays for the items it is applied to, in cart order, until it runs out
+        balances, starting = {}, {}
+        orders = []
+        credit = Decimal(0)
+        for item in items:
+            quantity = item.quantity or 1
+            price = item.meal_kit.price * quantity
+            if item.gift_card_id is not None:
+                if item.gift_card_id not in balances:
+                    balances[item.gift_card_id] = starting[item.gift_card_id] = gift_card_balance(item.gift_card, now)
+                used = min(balances[item.gift_card_id], price)
+                balances[item.gift_card_id] -= used
+                credit += used
+                price -= used
+            orders.append(Order(
+                customer=customer,
+                meal_kit=item.meal_kit,
+                quantity=quantity,
+                total_amount=price,
+                status=Order.PENDING,
+                payment_status=Order.PAYMENT_PENDING,
+            ))
+
+        bulk_create_returning_ids(Order, orders, customer=customer)
+        payments = bulk_create_returning_ids(Payment, [
+            Payment(order=order, amount=order.total_amount, payment_method=payment_method)
+            for order in orders
+        ], order__in=orders)
+        deliveries = bulk_create_returning_ids(Delivery, [
+            Delivery(order=order, delivery_date=delivery_date, delivery_address=delivery_address)
+            for order in orders
+        ], order__in=orders)
+
+        # Gift cards have no balance column, so a card that paid for anything is used up
+        used_cards = [pk for pk in balances if balances[pk] < starting[pk]]
+        if used_cards:
+            GiftCard.objects.filter(pk__in=used_cards).update(is_active=False)
+        CartItem.objects.filter(pk__in=[item.pk for item in items]).delete()
+
+        # bulk_create skips post_save; keep the analytics rollup informed
+        post_bulk_save.send(sender=Order, instances=orders, created=True)
+        post_bulk_save.send(sender=Payment, instances=payments, created=True)
+        post_bulk_save.send(sender=Delivery, instances=deliveries, created=True)
+
+    return CheckoutResult(orders, payments, deliveries, sum(order.total_amount for order in orders), credit)
@@ -0,0 +1 @@
+# Database helpers: connection pooling and the pooled MySQL backend
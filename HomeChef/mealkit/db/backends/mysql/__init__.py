@@ -0,0 +1 @@
+# MySQL backend that checks connections out of mealkit.db.pool
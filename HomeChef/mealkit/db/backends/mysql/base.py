@@ -0,0 +1,56 @@
+# Import the modules needed for a MySQL backend with optional connection pooling
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.mysql import base
+
+from mealkit.db.pool import ConnectionPool, PoolTimeout, get_pool
+
+
+# MySQL backend that checks connections out of a process-wide pool when
+# OPTIONS['pool'] is set (True or a dict of ConnectionPool arguments, with
+# `check` enabling a ping before an idle connection is reused). Without it
+# this is the stock backend.
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_pool_options(self):
+        options = self.settings_dict['OPTIONS'].get('pool')
+        if not options:
+            return None
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured('Pooled connections are returned after each request; set CONN_MAX_AGE to 0.')
+        return {} if options is True else dict(options)
+
+    @property
+    def pool(self):
+        options = self.get_pool_options()
+        if options is None:
+            return None
+        return get_pool(self.alias, lambda: self.create_pool(options))
+
+    def create_pool(self, options):
+        params = self.get_connection_params()
+        check = (lambda connection: connection.ping()) if options.pop('check', False) else None
+        # Open connections exactly as the stock backend does
+        return ConnectionPool(lambda: base.DatabaseWrapper.get_new_connection(self, params), check=check, **options)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # The pool settings are not connection arguments
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            return pool.checkout()
+        except PoolTimeout as exc:
+            raise base.Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        # Only connections outside any transaction go back to the pool
+        discard = self.in_atomic_block or not self.autocommit or (self.errors_occurred and not self.is_usable())
+        with self.wrap_database_errors:
+            pool.checkin(self.connection, discard=discard)
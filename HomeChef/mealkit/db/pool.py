@@ -0,0 +1,177 @@
+# Import the modules needed to share database connections between threads
+import os
+import threading
+import time
+from collections import deque
+
+
+# Raised when no connection becomes free within the pool timeout
+class PoolTimeout(Exception):
+    pass
+
+
+# Thread-safe pool of raw DB-API connections. `connect` opens a new connection
+# and `check`, if given, raises for a connection that is no longer usable.
+class ConnectionPool:
+    def __init__(self, connect, max_size=10, timeout=10.0, max_lifetime=1800.0, max_idle=300.0, check=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check = check
+        self.condition = threading.Condition()
+        # Idle connections as (connection, returned at), most recently used last
+        self.idle = deque()
+        # Open time of every connection owned by the pool
+        self.opened_at = {}
+        self.size = 0
+        self.closed = False
+        self.metrics = {
+            'checkouts': 0,
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    # Take a free connection, waiting up to `timeout` seconds when all are in use
+    def checkout(self):
+        started = time.monotonic()
+        while True:
+            entry = self._acquire(started)
+            if entry is None:
+                return self._open()
+            if self._usable(entry):
+                return entry[0]
+            self._close(entry)
+
+    # Pop an idle connection or reserve a slot for a new one (returns None)
+    def _acquire(self, started):
+        deadline = started + self.timeout
+        with self.condition:
+            while True:
+                if self.closed:
+                    raise PoolTimeout('The connection pool is closed.')
+                if self.idle or self.size < self.max_size:
+                    waited = time.monotonic() - started
+                    self.metrics['checkouts'] += 1
+                    self.metrics['wait_seconds_total'] += waited
+                    self.metrics['wait_seconds_max'] = max(self.metrics['wait_seconds_max'], waited)
+                    if self.idle:
+                        return self.idle.pop()
+                    self.size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.metrics['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection became free within {self.timeout} seconds.')
+                self.condition.wait(remaining)
+
+    # Open a connection in a slot reserved by _acquire
+    def _open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened_at[id(connection)] = time.monotonic()
+            self.metrics['connections_opened'] += 1
+        return connection
+
+    # Idle connections are recycled when too old and optionally health checked
+    def _usable(self, entry):
+        connection, returned_at = entry
+        now = time.monotonic()
+        if now - self.opened_at.get(id(connection), now) > self.max_lifetime or now - returned_at > self.max_idle:
+            return False
+        if self.check is not None:
+            try:
+                self.check(connection)
+            except Exception:
+                with self.condition:
+                    self.metrics['health_check_failures'] += 1
+                return False
+        return True
+
+    # Close a connection and free its slot
+    def _close(self, entry):
+        connection = entry[0] if isinstance(entry, tuple) else entry
+        with self.condition:
+            self.opened_at.pop(id(connection), None)
+            self.size -= 1
+            self.metrics['connections_closed'] += 1
+            self.condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    # Return a connection; broken or expired connections are closed instead
+    def checkin(self, connection, discard=False):
+        now = time.monotonic()
+        expired = now - self.opened_at.get(id(connection), now) > self.max_lifetime
+        if discard or expired or self.closed:
+            self._close(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, now))
+            self.condition.notify()
+
+    # Close every idle connection; connections in use are closed when returned
+    def close(self):
+        with self.condition:
+            self.closed = True
+            idle, self.idle = list(self.idle), deque()
+            self.condition.notify_all()
+        for entry in idle:
+            self._close(entry)
+
+    def stats(self):
+        with self.condition:
+            return dict(
+                self.metrics,
+                max_size=self.max_size,
+                size=self.size,
+                idle=len(self.idle),
+                in_use=self.size - len(self.idle),
+            )
+
+
+# Pools of this process by database alias; a forked worker gets new pools
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Return the pool of `alias`, creating it with `factory` on first use
+def get_pool(alias, factory):
+    pid = os.getpid()
+    entry = _pools.get(alias)
+    if entry is None or entry[0] != pid:
+        with _pools_lock:
+            entry = _pools.get(alias)
+            if entry is None or entry[0] != pid:
+                # Connections inherited from the parent process are never reused
+                entry = _pools[alias] = (pid, factory())
+    return entry[1]
+
+
+# Pool metrics of this process by database alias
+def get_pool_stats():
+    pid = os.getpid()
+    return {alias: pool.stats() for alias, (owner, pool) in list(_pools.items()) if owner == pid}
+
+
+# Close and forget every pool of this process
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for owner, pool in pools:
+        if owner == os.getpid():
+            pool.close()
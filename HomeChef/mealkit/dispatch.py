@@ -0,0 +1,220 @@
+# Import the modules needed to geocode pending deliveries and plan their routes
+import math
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from .analytics import day_start
+from .checkout import bulk_create_returning_ids
+from .models import Delivery, DeliveryRoute, PostalCodeZone
+from .signals import post_bulk_save
+
+# Postal (PIN) codes looked up in the PostalCodeZone table
+POSTAL_CODE_PATTERN = re.compile(r'\b(\d{6})\b')
+
+# Stops per route at most
+ROUTE_MAX_STOPS = 40
+
+# Improvement passes of 2-opt over a route at most
+TWO_OPT_MAX_PASSES = 10
+
+# Rows written per UPDATE by the planner
+DISPATCH_BATCH_SIZE = 1000
+
+# Kilometres per degree of latitude
+KM_PER_DEGREE = 6371.0 * math.pi / 180
+
+
+# The postal code of an address; the last one wins, as codes usually end an address
+def extract_postal_code(address):
+    codes = POSTAL_CODE_PATTERN.findall(address or '')
+    return codes[-1] if codes else None
+
+
+# Look up the zone and coordinates of deliveries whose address changed since the
+# last lookup, or that have no zone yet; one query for all of them
+def geocode_deliveries(deliveries):
+    stale = [delivery for delivery in deliveries if delivery.geocoded_address != delivery.delivery_address or not delivery.zone]
+    if not stale:
+        return 0
+    codes = {extract_postal_code(delivery.delivery_address) for delivery in stale} - {None}
+    zones = {row.postal_code: row for row in PostalCodeZone.objects.filter(postal_code__in=codes)} if codes else {}
+    for delivery in stale:
+        row = zones.get(extract_postal_code(delivery.delivery_address))
+        delivery.geocoded_address = delivery.delivery_address
+        delivery.zone, delivery.latitude, delivery.longitude = (row.zone, row.latitude, row.longitude) if row else ('', None, None)
+    Delivery.objects.bulk_update(stale, ['geocoded_address', 'zone', 'latitude', 'longitude'], batch_size=DISPATCH_BATCH_SIZE)
+    return len(stale)
+
+
+# Project (latitude, longitude) pairs onto a plane in kilometres; accurate enough
+# for distances within a city
+def project(coordinates):
+    if not coordinates:
+        return []
+    scale = math.cos(math.radians(sum(latitude for latitude, _ in coordinates) / len(coordinates)))
+    return [(longitude * KM_PER_DEGREE * scale, latitude * KM_PER_DEGREE) for latitude, longitude in coordinates]
+
+
+def distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+# Length of a path through `points` in the order of `indexes`
+def path_length(points, indexes):
+    return sum(distance(points[a], points[b]) for a, b in zip(indexes, indexes[1:]))
+
+
+# Visit every point, always going to the nearest unvisited one. Points are
+# bucketed in a grid of about one point per cell, so each step only searches
+# the rings of cells around the current point that can hold a closer point
+def nearest_neighbour_order(points, start=0):
+    count = len(points)
+    if count <= 2:
+        return [start] + [index for index in range(count) if index != start]
+    min_x = min(x for x, _ in points)
+    min_y = min(y for _, y in points)
+    span = max(max(x for x, _ in points) - min_x, max(y for _, y in points) - min_y) or 1.0
+    cell = span / math.sqrt(count)
+    cells = [(int((x - min_x) / cell), int((y - min_y) / cell)) for x, y in points]
+    grid = defaultdict(set)
+    for index, key in enumerate(cells):
+        grid[key].add(index)
+    max_ring = int(span / cell) + 1
+
+    order = [start]
+    grid[cells[start]].discard(start)
+    current = start
+    for _ in range(count - 1):
+        cx, cy = cells[current]
+        best, best_distance = None, math.inf
+        for ring in range(max_ring + 1):
+            for dx in range(-ring, ring + 1):
+                for dy in ((-ring, ring) if abs(dx) != ring else range(-ring, ring + 1)):
+                    for index in grid.get((cx + dx, cy + dy), ()):
+                        candidate = distance(points[current], points[index])
+                        if candidate < best_distance:
+                            best, best_distance = index, candidate
+            # Points in the next rings are at least `ring` cells away
+            if best is not None and best_distance <= ring * cell:
+                break
+        grid[cells[best]].discard(best)
+        order.append(best)
+        current = best
+    return order
+
+
+# Shorten an open path by reversing segments while that removes crossings (2-opt);
+# the first stop stays first
+def two_opt(points, order, max_passes=TWO_OPT_MAX_PASSES):
+    order = list(order)
+    count = len(order)
+    if count < 4:
+        return order
+    for _ in range(max_passes):
+        improved = False
+        for i in range(count - 2):
+            a, b = points[order[i]], points[order[i + 1]]
+            ab = distance(a, b)
+            for j in range(i + 2, count):
+                c = points[order[j]]
+                if j + 1 < count:
+                    d = points[order[j + 1]]
+                    change = distance(a, c) + distance(b, d) - ab - distance(c, d)
+                else:
+                    # Reversing the tail drops the path's last edge
+                    change = distance(a, c) - ab
+                if change < -1e-9:
+                    order[i + 1:j + 1] = reversed(order[i + 1:j + 1])
+                    improved = True
+                    b = points[order[i + 1]]
+                    ab = distance(a, b)
+        if not improved:
+            break
+    return order
+
+
+# Split a zone's deliveries into routes of at most `max_stops` ordered stops, with
+# the kilometres of each; deliveries without coordinates get routes of their own
+def order_zone(deliveries, max_stops=ROUTE_MAX_STOPS):
+    located = [delivery for delivery in deliveries if delivery.latitude is not None]
+    unlocated = [delivery for delivery in deliveries if delivery.latitude is None]
+    coordinates = [(delivery.latitude, delivery.longitude) for delivery in located]
+    # (latitude, longitude) routes start from, when set
+    depot = getattr(settings, 'DISPATCH_DEPOT', None)
+    points = project(coordinates + ([depot] if depot is not None else []))
+
+    routes = []
+    if located:
+        # Start at the stop nearest the depot, or else the northernmost one
+        if depot is not None:
+            depot_point = points.pop()
+            start = min(range(len(points)), key=lambda index: distance(points[index], depot_point))
+        else:
+            start = max(range(len(points)), key=lambda index: points[index][1])
+        order = nearest_neighbour_order(points, start)
+        for offset in range(0, len(order), max_stops):
+            chunk = two_opt(points, order[offset:offset + max_stops])
+            routes.append(([located[index] for index in chunk], path_length(points, chunk)))
+    for offset in range(0, len(unlocated), max_stops):
+        routes.append((unlocated[offset:offset + max_stops], 0.0))
+    return routes
+
+
+# Plan the unrouted pending deliveries of a local day: geocode them, group them by
+# zone (all zones, or only `zones`) and store each zone's routes with their stop order
+def plan_routes(day, zones=None, max_stops=ROUTE_MAX_STOPS):
+    with transaction.atomic():
+        # Locked, so that two planners can not route the same deliveries
+        deliveries = list(
+            Delivery.objects.select_for_update()
+            .filter(delivery_status='pending', route__isnull=True,
+                    delivery_date__gte=day_start(day), delivery_date__lt=day_start(day + timedelta(days=1)))
+            .order_by('pk')
+        )
+        geocode_deliveries(deliveries)
+
+        by_zone = defaultdict(list)
+        for delivery in deliveries:
+            if zones is None or delivery.zone in zones:
+                by_zone[delivery.zone].append(delivery)
+
+        plans = []
+        for zone in sorted(by_zone):
+            for stops, length in order_zone(by_zone[zone], max_stops):
+                plans.append((DeliveryRoute(delivery_day=day, zone=zone, distance=round(length, 3)), stops))
+        if not plans:
+            return []
+
+        bulk_create_returning_ids(DeliveryRoute, [route for route, _ in plans], delivery_day=day)
+        routed = []
+        for route, stops in plans:
+            for position, delivery in enumerate(stops):
+                delivery.route, delivery.route_position = route, position
+                routed.append(delivery)
+        Delivery.objects.bulk_update(routed, ['route', 'route_position'], batch_size=DISPATCH_BATCH_SIZE)
+        post_bulk_save.send(sender=Delivery, instances=routed, created=False)
+    return plans
+
+
+# Set the status of every delivery on a route with one UPDATE; returns the deliveries
+def set_route_status(route, delivery_status):
+    with transaction.atomic():
+        deliveries = list(route.deliveries.select_for_update().order_by('route_position'))
+        Delivery.objects.filter(pk__in=[delivery.pk for delivery in deliveries]).update(delivery_status=delivery_status)
+        for delivery in deliveries:
+            delivery.delivery_status = delivery_status
+        post_bulk_save.send(sender=Delivery, instances=deliveries, created=False)
+    return deliveries
+
+
+# Read the ?date= (YYYY-MM-DD) of a dispatch request
+def parse_delivery_day(params):
+    try:
+        return date.fromisoformat(params.get('date', ''))
+    except ValueError:
+        raise serializers.ValidationError({'date': ['Use the YYYY-MM-DD format.']})
@@ -0,0 +1,138 @@
+# Import the modules needed to stream large tables out as CSV or NDJSON
+import csv
+import io
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from .analytics import day_start
+from .models import Delivery, Order, Payment, Subscription
+
+# Rows fetched per query while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Characters of output collected before a chunk is sent to the client
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+# An exportable table and the date column its ?start=/?end= filter on
+ExportSpec = namedtuple('ExportSpec', ['model', 'date'])
+
+EXPORTS = {
+    'orders': ExportSpec(Order, 'order_date'),
+    'payments': ExportSpec(Payment, 'payment_date'),
+    'deliveries': ExportSpec(Delivery, 'delivery_date'),
+    'subscriptions': ExportSpec(Subscription, 'start_date'),
+}
+
+# Content type of each export format
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+# (name, column) of every concrete field; foreign keys are exported as ids
+def export_columns(model):
+    return [(field.name, field.attname) for field in model._meta.concrete_fields]
+
+
+# Yield the rows of a table as tuples ordered by (date, pk), one query per chunk.
+# Each chunk continues after the last row of the previous one, so memory stays
+# flat and no cursor stays open between chunks (MySQL's driver would otherwise
+# buffer the whole result set of iterator())
+def iter_export_rows(spec, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    columns = [column for _, column in export_columns(spec.model)]
+    date_index, pk_index = columns.index(spec.date), columns.index(spec.model._meta.pk.attname)
+
+    queryset = spec.model._default_manager.order_by(spec.date, 'pk')
+    if start is not None:
+        queryset = queryset.filter(**{f'{spec.date}__gte': day_start(start)})
+    if end is not None:
+        queryset = queryset.filter(**{f'{spec.date}__lt': day_start(end + timedelta(days=1))})
+
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            last_date, last_pk = last
+            # The redundant lower bound lets the date index serve the range
+            page = page.filter(**{f'{spec.date}__gte': last_date}).filter(
+                Q(**{f'{spec.date}__gt': last_date}) | Q(**{spec.date: last_date, 'pk__gt': last_pk})
+            )
+        rows = list(page.values_list(*columns)[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last = (rows[-1][date_index], rows[-1][pk_index])
+
+
+# Dates as ISO 8601 in both formats
+def _format_value(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+# Render rows as CSV with a header line, in chunks of about EXPORT_BUFFER_SIZE characters
+def iter_csv(names, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for row in rows:
+        writer.writerow([_format_value(value) for value in row])
+        if buffer.tell() >= EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# Render rows as newline delimited JSON objects, in chunks like iter_csv
+def iter_ndjson(names, rows):
+    encoder = DjangoJSONEncoder()
+    chunk = []
+    size = 0
+    for row in rows:
+        line = encoder.encode(dict(zip(names, (_format_value(value) for value in row)))) + '\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_BUFFER_SIZE:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    yield ''.join(chunk)
+
+
+# The chunks of an export of `dataset` in `file_format`
+def iter_export(dataset, file_format, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    spec = EXPORTS[dataset]
+    names = [name for name, _ in export_columns(spec.model)]
+    rows = iter_export_rows(spec, start, end, chunk_size)
+    render = iter_csv if file_format == 'csv' else iter_ndjson
+    return render(names, rows)
+
+
+# The chunks of an export for a response served under ASGI. Django would read a
+# sync iterator there into one list before sending anything, so each chunk, with
+# the queries it needs, is taken from `chunks` through sync_to_async instead
+async def aiter_chunks(chunks):
+    step = sync_to_async(next)
+    try:
+        while True:
+            chunk = await step(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        # Close the sync generator on its own thread when the client goes away
+        await sync_to_async(chunks.close)()
+
+
+# Negotiation for export views: downloads ask for text/csv and the like, which no
+# renderer produces, so errors are always rendered with the first renderer
+class ExportContentNegotiation(DefaultContentNegotiation):
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
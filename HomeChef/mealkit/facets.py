@@ -0,0 +1,241 @@
+# Import the modules needed for faceted filtering with per-value counts
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from django.db.models.functions import Cast
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+from .models import Company
+
+# Query parameter naming the facets to count: `all` or a comma-separated list
+FACETS_QUERY_PARAM = 'facets'
+
+# Values listed for an open-ended facet such as chefs, besides the selected ones
+MAX_FACET_VALUES = 20
+
+# Column aliases of the counting query
+NAME, VALUE, LABEL, COUNT = 'facet_name', 'facet_value', 'facet_label', 'facet_count'
+
+
+# An open-ended facet over one column, e.g. servings or chef; `cast` parses the
+# query parameter and `label` is a lookup read with each value, e.g. the chef's name.
+# Several values of one facet match any of them
+class Facet:
+    def __init__(self, name, field, cast=int, label=None):
+        self.name = name
+        self.field = field
+        self.cast = cast
+        self.label = label
+
+    # SQL expression giving the value of each row as a string, NULL for none
+    def expression(self):
+        return Cast(F(self.field), CharField())
+
+    def label_expression(self):
+        return Cast(F(self.label), CharField()) if self.label else Value('', output_field=CharField())
+
+    # The (value, label) pairs always listed, in order, or None to list the values
+    # found, most frequent first
+    def choices(self):
+        return None
+
+    def to_q(self, value):
+        try:
+            return Q(**{self.field: self.cast(value)})
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({self.name: [f'Unknown value "{value}".']})
+
+    # Rows matching any of `values`
+    def filter_q(self, values):
+        return reduce(or_, (self.to_q(value) for value in values))
+
+    # Entries of the response from {value: count} and {value: label}
+    def render(self, counts, labels, selected):
+        choices = self.choices()
+        if choices is None:
+            found = sorted(counts, key=lambda value: (-counts[value], value))
+            shown = found[:MAX_FACET_VALUES] + sorted(value for value in selected if value not in found[:MAX_FACET_VALUES])
+            choices = [(value, labels.get(value) or value) for value in shown]
+        return [
+            {'value': value, 'label': label, 'count': counts.get(value, 0), 'selected': value in selected}
+            for value, label in choices
+        ]
+
+
+# A facet over a field with fixed choices, e.g. a company's food type
+class ChoiceFacet(Facet):
+    def __init__(self, name, field, choices):
+        super().__init__(name, field, cast=str)
+        self.field_choices = list(choices)
+
+    def expression(self):
+        return F(self.field)
+
+    def choices(self):
+        return self.field_choices
+
+    def to_q(self, value):
+        if value not in dict(self.field_choices):
+            raise serializers.ValidationError({self.name: [f'Unknown value "{value}".']})
+        return Q(**{self.field: value})
+
+
+# A yes/no facet, selected with `true` or `false`
+class BooleanFacet(ChoiceFacet):
+    def __init__(self, name, field):
+        super().__init__(name, field, [('true', 'Yes'), ('false', 'No')])
+
+    def expression(self):
+        return Case(When(**{self.field: True}, then=Value('true')), default=Value('false'), output_field=CharField())
+
+    def to_q(self, value):
+        super().to_q(value)
+        return Q(**{self.field: value == 'true'})
+
+
+# A facet bucketing a column into ranges; `buckets` are (value, label, lower, upper)
+# with an inclusive lower and an exclusive upper bound, None for unbounded
+class RangeFacet(ChoiceFacet):
+    def __init__(self, name, field, buckets):
+        super().__init__(name, field, [(value, label) for value, label, _, _ in buckets])
+        self.buckets = {value: (lower, upper) for value, _, lower, upper in buckets}
+
+    def bucket_q(self, value):
+        lower, upper = self.buckets[value]
+        q = Q()
+        if lower is not None:
+            q &= Q(**{f'{self.field}__gte': lower})
+        if upper is not None:
+            q &= Q(**{f'{self.field}__lt': upper})
+        return q
+
+    # NULLs fall in no bucket
+    def expression(self):
+        return Case(
+            *(When(self.bucket_q(value), then=Value(value)) for value in self.buckets),
+            default=None,
+            output_field=CharField(),
+        )
+
+    def to_q(self, value):
+        super().to_q(value)
+        return self.bucket_q(value)
+
+
+# Facets of the meal kit list
+MEAL_KIT_FACETS = (
+    RangeFacet('price', 'price', [
+        ('under-10', 'Under 10', None, Decimal('10')),
+        ('10-20', '10 to 20', Decimal('10'), Decimal('20')),
+        ('20-50', '20 to 50', Decimal('20'), Decimal('50')),
+        ('50-plus', '50 and more', Decimal('50'), None),
+    ]),
+    Facet('servings', 'servings'),
+    RangeFacet('preparation_time', 'preparation_time', [
+        ('under-15', 'Under 15 minutes', None, timedelta(minutes=15)),
+        ('15-30', '15 to 30 minutes', timedelta(minutes=15), timedelta(minutes=30)),
+        ('30-60', '30 to 60 minutes', timedelta(minutes=30), timedelta(minutes=60)),
+        ('60-plus', '60 minutes and more', timedelta(minutes=60), None),
+    ]),
+    BooleanFacet('is_available', 'is_available'),
+    Facet('chef', 'chef_id', label='chef__chef_name'),
+)
+
+# Facets of the company list
+COMPANY_FACETS = (
+    ChoiceFacet('food_type', 'food_type', Company.FOOD_TYPE_CHOICES),
+    ChoiceFacet('category', 'category', Company.CATEGORY_CHOICES),
+)
+
+
+# {facet: set of selected values} from the query parameters, e.g. ?price=under-10,10-20
+def get_facet_selection(request, facets):
+    selection = {}
+    for facet in facets:
+        values = {value.strip() for param in request.query_params.getlist(facet.name) for value in param.split(',') if value.strip()}
+        if values:
+            facet.filter_q(values)
+            selection[facet] = values
+    return selection
+
+
+# Facets named by ?facets=, or None when none were asked for
+def get_requested_facets(request, facets):
+    names = [name.strip() for name in request.query_params.get(FACETS_QUERY_PARAM, '').split(',') if name.strip()]
+    if not names:
+        return None
+    if 'all' in names:
+        return list(facets)
+    by_name = {facet.name: facet for facet in facets}
+    for name in names:
+        if name not in by_name:
+            raise serializers.ValidationError({FACETS_QUERY_PARAM: [f'Unknown facet "{name}".']})
+    return [by_name[name] for name in dict.fromkeys(names)]
+
+
+# Count the values of every facet in one query: a UNION ALL of one GROUP BY per
+# facet, each over `queryset` narrowed by the selections of the other facets, so
+# that a facet's counts show what choosing another of its values would give
+def count_facets(queryset, facets, selection):
+    queryset = queryset.order_by().prefetch_related(None)
+    grouped = []
+    for facet in facets:
+        subset = queryset
+        for other, values in selection.items():
+            if other is not facet:
+                subset = subset.filter(other.filter_q(values))
+        grouped.append(subset.values(**{
+            NAME: Value(facet.name, output_field=CharField()),
+            VALUE: facet.expression(),
+            LABEL: facet.label_expression(),
+        }).annotate(**{COUNT: Count('pk')}))
+
+    counts = {facet.name: {} for facet in facets}
+    labels = {facet.name: {} for facet in facets}
+    for row in grouped[0].union(*grouped[1:], all=True):
+        if row[VALUE] is None:
+            continue
+        counts[row[NAME]][row[VALUE]] = counts[row[NAME]].get(row[VALUE], 0) + row[COUNT]
+        labels[row[NAME]][row[VALUE]] = row[LABEL]
+    return {
+        facet.name: facet.render(counts[facet.name], labels[facet.name], selection.get(facet, set()))
+        for facet in facets
+    }
+
+
+# Filter backend narrowing a list to the selected values of the view's `facets`
+class FacetFilter(BaseFilterBackend):
+    def filter_queryset(self, request, queryset, view):
+        for facet, values in get_facet_selection(request, getattr(view, 'facets', ())).items():
+            queryset = queryset.filter(facet.filter_q(values))
+        return queryset
+
+
+# Mixin for list views with `facets` and FacetFilter: with ?facets=, the page comes
+# with the count of every value of the facets asked for, under the other filters
+class FacetedListMixin:
+    facets = ()
+
+    # The listed queryset before the facet selections are applied
+    def get_facet_queryset(self):
+        queryset = self.get_queryset()
+        for backend in self.filter_backends:
+            if not issubclass(backend, FacetFilter):
+                queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset
+
+    # Counts of the `requested` facets under the other filters and selections
+    def get_facet_counts(self, requested):
+        selection = get_facet_selection(self.request, self.facets)
+        return count_facets(self.get_facet_queryset(), requested, selection)
+
+    def list(self, request, *args, **kwargs):
+        requested = get_requested_facets(request, self.facets)
+        response = super().list(request, *args, **kwargs)
+        if requested and isinstance(response.data, dict):
+            response.data['facets'] = self.get_facet_counts(requested)
+        return response
@@ -0,0 +1,152 @@
+# Import the modules needed to render read-only lists straight from values_list() rows
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .sparse import get_field_selection
+
+# DRF fields whose to_representation returns the database value of these model
+# fields unchanged, so rows can skip the call
+PASSTHROUGH_FIELDS = {
+    serializers.CharField: {'CharField', 'TextField'},
+    serializers.EmailField: {'CharField', 'EmailField'},
+    serializers.IntegerField: {
+        'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+        'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField',
+    },
+    serializers.BooleanField: {'BooleanField'},
+}
+
+
+# A serializer field the row plan can not reproduce, e.g. a method field
+class FastPathUnsupported(Exception):
+    pass
+
+
+# How to render one serializer from flat rows: the values_list() lookups to load
+# and, per rendered field, (name, row index, converter or None, nested entries or None).
+# A nested serializer's index points at its foreign key, so a null relation renders None
+class RowPlan:
+    def __init__(self, model, columns, entries):
+        self.model = model
+        self.columns = tuple(columns)
+        self.entries = tuple(entries)
+
+    # Swap a queryset's model instances for named rows, which keyset pagination
+    # reads its cursor columns from
+    def apply(self, queryset):
+        return queryset.values_list(*self.columns, named=True)
+
+    def render_rows(self, rows):
+        entries = self.entries
+        return [_render(entries, row) for row in rows]
+
+
+def _render(entries, row):
+    data = {}
+    for name, index, convert, nested in entries:
+        value = row[index]
+        if value is None:
+            data[name] = None
+        elif nested is not None:
+            data[name] = _render(nested, row)
+        elif convert is None:
+            data[name] = value
+        else:
+            data[name] = convert(value)
+    return data
+
+
+# Index of a lookup in the row, adding it the first time it is seen
+def _column(columns, lookup):
+    if lookup not in columns:
+        columns[lookup] = len(columns)
+    return columns[lookup]
+
+
+# Converter turning a database value into what the DRF field renders
+def _converter(field, model_field):
+    if model_field.get_internal_type() in PASSTHROUGH_FIELDS.get(type(field), ()):
+        return None
+    return field.to_representation
+
+
+# Walk one serializer level the way Serializer.to_representation would read it
+def _compile(serializer, model, prefix, columns):
+    # Serializers customizing their output can not be rendered from rows
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        raise FastPathUnsupported(type(serializer).__name__)
+
+    entries = []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        source = field.source
+        # Whole-object and dotted sources may read anything
+        if source == '*' or '.' in source:
+            raise FastPathUnsupported(field.field_name)
+        try:
+            model_field = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            # Properties and SerializerMethodFields
+            raise FastPathUnsupported(field.field_name)
+        # Reverse relations and many-to-many fields would multiply the rows
+        if not model_field.concrete or model_field.many_to_many:
+            raise FastPathUnsupported(field.field_name)
+
+        if isinstance(field, serializers.BaseSerializer):
+            if not isinstance(field, serializers.ModelSerializer) or not model_field.is_relation:
+                raise FastPathUnsupported(field.field_name)
+            index = _column(columns, prefix + model_field.attname)
+            nested = _compile(field, model_field.related_model, prefix + source + '__', columns)
+            entries.append((field.field_name, index, None, tuple(nested)))
+        elif model_field.is_relation:
+            # A related object rendered as its key, read from the foreign key column
+            if type(field) is not serializers.PrimaryKeyRelatedField or field.pk_field is not None:
+                raise FastPathUnsupported(field.field_name)
+            entries.append((field.field_name, _column(columns, prefix + model_field.attname), None, None))
+        else:
+            entries.append((field.field_name, _column(columns, prefix + source), _converter(field, model_field), None))
+    return entries
+
+
+# Build (and memoize) the row plan of a serializer class for the fields chosen by
+# `selection`, or None when some field needs the model instance
+@lru_cache(maxsize=1024)
+def get_row_plan(serializer_class, selection=None):
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return None
+    model = serializer_class.Meta.model
+    columns = {}
+    try:
+        entries = _compile(serializer_class(context={'field_selection': selection}), model, '', columns)
+    except FastPathUnsupported:
+        return None
+    return RowPlan(model, columns, entries)
+
+
+# Mixin for read-only list views: when the serializer compiles to a row plan
+# (FAST_SERIALIZATION_ENABLED), pages are loaded with values_list() and rendered
+# from the rows, giving the same JSON as the serializer without model instances
+class FastListMixin:
+    def get_row_plan(self):
+        if not getattr(settings, 'FAST_SERIALIZATION_ENABLED', True):
+            return None
+        plan = get_row_plan(self.get_serializer_class(), get_field_selection(self.request))
+        # The rows are read from the serializer's model, which must be the one listed
+        if plan is None or plan.model is not getattr(self.queryset, 'model', None):
+            return None
+        return plan
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_row_plan()
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        queryset = plan.apply(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render_rows(page))
+        return Response(plan.render_rows(queryset))
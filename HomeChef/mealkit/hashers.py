@@ -0,0 +1,11 @@
+# Import the modules needed for a password hasher with a configurable work factor
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+# PBKDF2 whose iteration count comes from settings.PASSWORD_HASH_ITERATIONS;
+# hashes with another count are re-encoded on the user's next successful login
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_HASH_ITERATIONS', PBKDF2PasswordHasher.iterations)
@@ -0,0 +1,158 @@
+# Import the modules needed to check the database indexes against the API's queries
+import re
+from collections import namedtuple
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from .benchmarks import discover_routes
+
+# One query issued by an endpoint and what its plan does
+QueryPlan = namedtuple('QueryPlan', ['route', 'params', 'table', 'sql', 'scans', 'sorts', 'indexes'])
+
+# A request whose plan scans or sorts its table, with the columns an index should cover
+MissingIndex = namedtuple('MissingIndex', ['route', 'params', 'table', 'columns'])
+
+# An index that none of the analyzed queries used
+UnusedIndex = namedtuple('UnusedIndex', ['table', 'name', 'columns'])
+
+# SQLite EXPLAIN QUERY PLAN lines
+SQLITE_SCAN_RE = re.compile(r'^SCAN (\S+)(?: USING (?:COVERING )?INDEX (\S+))?')
+SQLITE_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\S+)')
+
+# PostgreSQL EXPLAIN lines
+POSTGRES_SEQ_SCAN_RE = re.compile(r'Seq Scan on (\S+)')
+POSTGRES_INDEX_RE = re.compile(r'Index (?:Only )?Scan(?: Backward)? using (\S+)|Bitmap Index Scan on (\S+)')
+POSTGRES_SORT_RE = re.compile(r'^\s*(?:->\s*)?(?:Incremental )?Sort\b')
+
+
+# Query strings to analyze for a list route: every filter, every ordering, and both combined
+def iter_list_params(view_class):
+    model = view_class.queryset.model
+    yield {}
+    filters = {}
+    for name in getattr(view_class, 'filterset_fields', None) or []:
+        value = model._default_manager.exclude(**{f'{name}__isnull': True}).values_list(name, flat=True).first()
+        if value is None:
+            continue
+        filters[name] = value.isoformat() if hasattr(value, 'isoformat') else value
+        yield {name: filters[name]}
+    ordering_fields = getattr(view_class, 'ordering_fields', None)
+    for name in ordering_fields if isinstance(ordering_fields, (list, tuple)) else []:
+        for ordering in (name, f'-{name}'):
+            yield {'ordering': ordering}
+            for field, value in filters.items():
+                yield {field: value, 'ordering': ordering}
+    if getattr(view_class, 'keyset_ordering', None):
+        yield {'pagination': 'cursor'}
+        for field, value in filters.items():
+            yield {field: value, 'pagination': 'cursor'}
+
+
+# Run the database's EXPLAIN over an already interpolated query
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+# Summarize a plan as (tables scanned in full, whether rows are sorted, indexes used)
+def read_plan(rows, vendor=None):
+    vendor = vendor or connection.vendor
+    scans, sorts, indexes = set(), False, set()
+    for row in rows:
+        if vendor == 'mysql':
+            if row.get('type') == 'ALL':
+                scans.add(row['table'])
+            if row.get('key'):
+                indexes.add(row['key'])
+            sorts = sorts or 'filesort' in (row.get('Extra') or '')
+        elif vendor == 'sqlite':
+            detail = row['detail']
+            match = SQLITE_SCAN_RE.match(detail)
+            if match and not match.group(2):
+                scans.add(match.group(1))
+            indexes.update(SQLITE_INDEX_RE.findall(detail))
+            sorts = sorts or 'TEMP B-TREE FOR ORDER BY' in detail
+        else:
+            line = next(iter(row.values()))
+            scans.update(POSTGRES_SEQ_SCAN_RE.findall(line))
+            indexes.update(name for names in POSTGRES_INDEX_RE.findall(line) for name in names if name)
+            sorts = sorts or bool(POSTGRES_SORT_RE.match(line))
+    return scans, sorts, indexes
+
+
+# Request a list route and explain every SELECT it ran
+def explain_request(client, route, params):
+    table = resolve(route.url).func.view_class.queryset.model._meta.db_table
+    with CaptureQueriesContext(connection) as queries:
+        client.get(route.url, params)
+    plans = []
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        scans, sorts, indexes = read_plan(explain(sql))
+        plans.append(QueryPlan(route.name, params, table, sql, scans, sorts, indexes))
+    return plans
+
+
+# Columns an index should cover for a request: the filters, then the ordering
+def suggest_columns(model, params):
+    names = [name for name in params if name not in ('ordering', 'pagination')]
+    if 'ordering' in params:
+        names.append(params['ordering'].lstrip('-'))
+    columns = []
+    for name in names:
+        try:
+            column = model._meta.get_field(name).column
+        except FieldDoesNotExist:
+            continue
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+# Plans that read the view's whole table to filter it, or sort rows without an index
+def find_missing_indexes(plans, models_by_table):
+    missing = {}
+    for plan in plans:
+        filtered = plan.table in plan.scans and ' WHERE ' in plan.sql.upper()
+        if not (filtered or plan.sorts):
+            continue
+        columns = suggest_columns(models_by_table[plan.table], plan.params)
+        if columns:
+            missing.setdefault((plan.route, tuple(sorted(plan.params.items()))), MissingIndex(plan.route, plan.params, plan.table, columns))
+    return list(missing.values())
+
+
+# Non-unique indexes on the given tables that no analyzed plan used
+def find_unused_indexes(plans, tables):
+    used = set()
+    for plan in plans:
+        used.update(plan.indexes)
+    unused = []
+    with connection.cursor() as cursor:
+        for table in sorted(tables):
+            constraints = connection.introspection.get_constraints(cursor, table)
+            for name, info in sorted(constraints.items()):
+                if info['index'] and not info['primary_key'] and not info['unique'] and name not in used:
+                    unused.append(UnusedIndex(table, name, info['columns']))
+    return unused
+
+
+# Explain every filter/ordering combination of every list route; returns
+# (plans, missing indexes, unused indexes)
+def build_index_report(client):
+    plans, models_by_table = [], {}
+    for route in discover_routes():
+        if not route.is_list:
+            continue
+        view_class = resolve(route.url).func.view_class
+        models_by_table[view_class.queryset.model._meta.db_table] = view_class.queryset.model
+        for params in iter_list_params(view_class):
+            plans.extend(explain_request(client, route, params))
+    return plans, find_missing_indexes(plans, models_by_table), find_unused_indexes(plans, models_by_table)
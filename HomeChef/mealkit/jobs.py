@@ -0,0 +1,162 @@
+# Import the modules needed to run the side effects of writes outside the request
+import functools
+import logging
+import os
+import random
+import socket
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Queue modes: 'database' stores jobs for the run_jobs workers, 'sync' keeps them
+# in memory and runs them in this process once the transaction commits (tests)
+DATABASE = 'database'
+SYNC = 'sync'
+
+# Attempts a job gets before it is marked as failed
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Seconds before the first retry, doubled after every failed attempt up to the maximum
+RETRY_BASE_DELAY = 10
+RETRY_MAX_DELAY = 3600
+
+# Jobs a worker claims per transaction
+CLAIM_BATCH_SIZE = 20
+
+# Seconds after which a running job is assumed lost with its worker and run again
+LOCK_TIMEOUT = 600
+
+# A registered job function and its attempt limit
+JobSpec = namedtuple('JobSpec', ['func', 'max_attempts'])
+
+# Registered jobs by name
+registry = {}
+
+
+# Register a function as the job `name`; it is called with the enqueued keyword
+# arguments, which must be JSON serializable (ids rather than instances)
+def register(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    def decorator(func):
+        registry[name] = JobSpec(func, max_attempts)
+        return func
+    return decorator
+
+
+def get_queue_mode():
+    return getattr(settings, 'JOB_QUEUE_MODE', DATABASE)
+
+
+# Queue the job `name` once with `payload`
+def enqueue(name, **payload):
+    return enqueue_many(name, [payload])
+
+
+# Queue the job `name` once per payload. Stored jobs are inserted in the caller's
+# transaction, so they are rolled back with it and workers only see them once it
+# commits; in sync mode they run on commit instead
+def enqueue_many(name, payloads):
+    spec = registry[name]
+    payloads = list(payloads)
+    if get_queue_mode() == SYNC:
+        for payload in payloads:
+            transaction.on_commit(functools.partial(run_job_now, name, payload))
+        return []
+    now = timezone.now()
+    return Job.objects.bulk_create([
+        Job(name=name, payload=payload, max_attempts=spec.max_attempts, run_at=now)
+        for payload in payloads
+    ])
+
+
+# Run a job in this process; its writes are committed or rolled back together
+def run_job_now(name, payload):
+    with transaction.atomic():
+        registry[name].func(**payload)
+
+
+# Seconds to wait before retrying after `attempts` failed attempts, with jitter so
+# that jobs failing together do not all come back at once
+def retry_delay(attempts):
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** max(attempts - 1, 0))
+    return random.uniform(delay / 2, delay)
+
+
+# Name identifying this worker process in the lock columns
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+# Requeue running jobs whose worker disappeared, or fail them when out of attempts;
+# returns the number of jobs released
+def release_stale_jobs(now=None):
+    now = now or timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_by='', locked_at=None, last_error='The worker running this job was lost.',
+    )
+    requeued = stale.update(status=Job.QUEUED, run_at=now, locked_by='', locked_at=None)
+    return failed + requeued
+
+
+# Lock up to `batch_size` due jobs for `worker`, oldest first
+def claim_jobs(worker, batch_size=CLAIM_BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        # Workers skip the rows other workers are claiming instead of waiting for them
+        lock = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+        jobs = list(
+            Job.objects.select_for_update(**lock)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by('run_at', 'pk')[:batch_size]
+        )
+        if jobs:
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+                status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+            )
+    for job in jobs:
+        job.status, job.locked_by, job.locked_at, job.attempts = Job.RUNNING, worker, now, job.attempts + 1
+    return jobs
+
+
+# Run a claimed job: finished jobs are deleted, failed ones retried with backoff
+# until they run out of attempts. Returns the job's new status, or None when done
+def run_job(job):
+    spec = registry.get(job.name)
+    try:
+        if spec is None:
+            raise LookupError(f'No job named "{job.name}" is registered.')
+        with transaction.atomic():
+            spec.func(**job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts)
+        job.last_error = traceback.format_exc()
+        job.locked_by, job.locked_at = '', None
+        if spec is None or job.attempts >= job.max_attempts:
+            job.status = Job.FAILED
+        else:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+        Job.objects.filter(pk=job.pk).update(
+            status=job.status, run_at=job.run_at, locked_by='', locked_at=None, last_error=job.last_error,
+        )
+        return job.status
+    Job.objects.filter(pk=job.pk).delete()
+    return None
+
+
+# Claim and run one batch of due jobs; returns how many finished, were retried and failed
+def run_pending_jobs(worker=None, batch_size=CLAIM_BATCH_SIZE):
+    counts = {'done': 0, Job.QUEUED: 0, Job.FAILED: 0}
+    for job in claim_jobs(worker or worker_name(), batch_size):
+        status = run_job(job)
+        counts['done' if status is None else status] += 1
+    return counts['done'], counts[Job.QUEUED], counts[Job.FAILED]
@@ -0,0 +1,75 @@
+# Import the modules needed to compare catalog throughput under ASGI and WSGI
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from mealkit.benchmarks import (
+    CATALOG_PATHS, DEFAULT_SCALE, benchmark_asgi, benchmark_http, benchmark_wsgi, seeded_test_database,
+)
+from mealkit.models import User
+
+
+# Management command that measures requests per second of the catalog endpoints:
+# the sync views under WSGI and ASGI, and the async views under ASGI.
+#
+# By default both handlers run in this process against a seeded throwaway database.
+# To compare real servers, start them against the same database, e.g.
+#   gunicorn HomeChef.wsgi --workers 2 --bind 127.0.0.1:8000
+#   uvicorn HomeChef.asgi:application --workers 2 --port 8001
+# and run `benchmark_catalog --wsgi-url http://127.0.0.1:8000 --asgi-url http://127.0.0.1:8001 --token <access token>`
+class Command(BaseCommand):
+    help = 'Compare the throughput of the catalog endpoints served by the sync (WSGI) and async (ASGI) views.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and interface')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at once')
+        parser.add_argument('--cache', action='store_true', help='Keep the response cache enabled')
+        parser.add_argument('--wsgi-url', help='Base URL of a running WSGI server, e.g. gunicorn')
+        parser.add_argument('--asgi-url', help='Base URL of a running ASGI server, e.g. uvicorn')
+        parser.add_argument('--token', help='JWT access token used against running servers')
+        for name in ('companies', 'chefs', 'meal_kits'):
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=DEFAULT_SCALE[name])
+
+    def handle(self, *args, **options):
+        requests, concurrency = options['requests'], options['concurrency']
+        if options['wsgi_url'] or options['asgi_url']:
+            if not options['token']:
+                raise CommandError('--token is required when benchmarking running servers.')
+            results = self.benchmark_servers(options, requests, concurrency)
+        else:
+            results = self.benchmark_in_process(options, requests, concurrency)
+
+        self.stdout.write(f'{"endpoint":<40}{"interface":>11}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errors":>8}')
+        for result in results:
+            self.stdout.write(
+                f'{result.path:<40}{result.interface:>11}{result.per_second:>10.1f}'
+                f'{result.p50:>10.2f}{result.p95:>10.2f}{result.errors:>8}'
+            )
+
+    def benchmark_in_process(self, options, requests, concurrency):
+        # Only the catalog tables are seeded; the endpoints do not read the others
+        scale = {name: options[name] for name in ('companies', 'chefs', 'meal_kits')}
+        scale.update(customers=0, orders=0, reviews=0, gift_cards=0, cart_items=0, subscriptions=0)
+        results = []
+        with seeded_test_database(**scale):
+            user = User.objects.create_user(username='benchmark', password='benchmark', is_customer=True)
+            headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+            with override_settings(API_CACHE_ENABLED=options['cache']):
+                for path in CATALOG_PATHS:
+                    results.append(benchmark_wsgi(f'/api/{path}', headers, requests, concurrency))
+                    results.append(benchmark_asgi(f'/api/{path}', headers, requests, concurrency))
+                    results.append(benchmark_asgi(f'/api/async/{path}', headers, requests, concurrency))
+        return results
+
+    def benchmark_servers(self, options, requests, concurrency):
+        headers = {'Authorization': f'Bearer {options["token"]}'}
+        results = []
+        for path in CATALOG_PATHS:
+            if options['wsgi_url']:
+                url = f'{options["wsgi_url"].rstrip("/")}/api/{path}'
+                results.append(benchmark_http(url, headers, requests, concurrency, 'wsgi'))
+            if options['asgi_url']:
+                base = options['asgi_url'].rstrip('/')
+                results.append(benchmark_http(f'{base}/api/{path}', headers, requests, concurrency, 'asgi'))
+                results.append(benchmark_http(f'{base}/api/async/{path}', headers, requests, concurrency, 'asgi'))
+        return results
@@ -0,0 +1,42 @@
+# Import the modules needed to run the endpoint benchmark from the command line
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from mealkit.benchmarks import DEFAULT_SCALE, PAGE_SIZES, find_query_regressions, run_benchmarks, seeded_test_database
+from mealkit.models import User
+
+
+# Management command that seeds a throwaway database and benchmarks every /api/ route
+class Command(BaseCommand):
+    help = 'Seed a synthetic dataset into a throwaway test database and benchmark every /api/ endpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per endpoint and page size')
+        parser.add_argument('--page-sizes', type=int, nargs='+', default=list(PAGE_SIZES))
+        for name, default in DEFAULT_SCALE.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, default=default)
+
+    def handle(self, *args, **options):
+        scale = {name: options[name] for name in DEFAULT_SCALE}
+
+        with seeded_test_database(**scale):
+            user = User.objects.create_user(username='benchmark', password='benchmark', is_customer=True)
+            client = APIClient()
+            client.force_authenticate(user)
+            # Measure the uncached path of every endpoint
+            with override_settings(API_CACHE_ENABLED=False):
+                results = run_benchmarks(client, options['page_sizes'], options['repeat'])
+
+        # Print one row per endpoint and page size
+        self.stdout.write(f'{"endpoint":<28}{"page":>6}{"status":>8}{"queries":>9}{"p50 ms":>10}{"p95 ms":>10}{"bytes":>10}')
+        for result in results:
+            page_size = result.page_size if result.page_size is not None else '-'
+            self.stdout.write(
+                f'{result.name:<28}{page_size:>6}{result.status:>8}{result.queries:>9}'
+                f'{result.p50:>10.2f}{result.p95:>10.2f}{result.bytes:>10}'
+            )
+
+        regressions = find_query_regressions(results)
+        if regressions:
+            raise CommandError(f'Query count grows with page size on: {", ".join(regressions)}')
@@ -0,0 +1,45 @@
+# Import the modules needed to benchmark the login endpoint from the command line
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from mealkit.benchmarks import LoginResult, benchmark_logins, create_login_users, test_database
+
+
+# Management command that measures logins per second for each password work
+# factor and outstanding-token batch size, in a throwaway test database
+class Command(BaseCommand):
+    help = (
+        'Benchmark /api/login/ for each PBKDF2 iteration count and token batch size. '
+        'The first row (Django default iterations, one INSERT per login) is the previous behaviour.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Logins per configuration')
+        parser.add_argument('--users', type=int, default=10, help='Distinct users logging in')
+        parser.add_argument(
+            '--iterations', type=int, nargs='+',
+            default=sorted({PBKDF2PasswordHasher.iterations, settings.PASSWORD_HASH_ITERATIONS}, reverse=True),
+        )
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=sorted({1, settings.LOGIN_TOKEN_BATCH_SIZE}))
+
+    def handle(self, *args, **options):
+        results = []
+        with test_database():
+            client = APIClient()
+            for iterations in options['iterations']:
+                with override_settings(PASSWORD_HASH_ITERATIONS=iterations):
+                    credentials = create_login_users(options['users'], prefix=f'login{iterations}-')
+                    for batch_size in options['batch_sizes']:
+                        with override_settings(LOGIN_TOKEN_BATCH_SIZE=batch_size):
+                            per_second, p50, p95, queries = benchmark_logins(client, credentials, options['logins'])
+                        results.append(LoginResult(iterations, batch_size, options['logins'], per_second, p50, p95, queries))
+
+        self.stdout.write(f'{"iterations":>12}{"batch":>8}{"logins":>8}{"logins/s":>11}{"p50 ms":>10}{"p95 ms":>10}{"queries":>9}')
+        for result in results:
+            self.stdout.write(
+                f'{result.iterations:>12}{result.batch_size:>8}{result.logins:>8}{result.per_second:>11.1f}'
+                f'{result.p50:>10.2f}{result.p95:>10.2f}{result.queries:>9.2f}'
+            )
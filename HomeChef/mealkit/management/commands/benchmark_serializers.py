@@ -0,0 +1,35 @@
+# Import the modules needed to benchmark list serialization from the command line
+from django.core.management.base import BaseCommand, CommandError
+
+from mealkit.benchmarks import FAST_PATH_ROUTES, benchmark_serialization, seeded_test_database
+
+
+# Management command that compares rows per second of the serializers and the
+# values_list() fast path on the order and payment lists, in a throwaway database
+class Command(BaseCommand):
+    help = (
+        'Benchmark rendering the order and payment lists to JSON with their serializers '
+        'and with the values_list() fast path, and check that both give the same bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows rendered per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per engine')
+
+    def handle(self, *args, **options):
+        results = []
+        with seeded_test_database(orders=max(options['rows'], 1)):
+            for route_name in FAST_PATH_ROUTES:
+                results.extend(benchmark_serialization(route_name, options['rows'], options['repeat']))
+
+        self.stdout.write(f'{"endpoint":<18}{"engine":<12}{"rows":>7}{"rows/s":>11}{"speedup":>9}{"identical":>11}')
+        baseline = {}
+        for result in results:
+            baseline.setdefault(result.path, result.per_second)
+            self.stdout.write(
+                f'{result.path:<18}{result.engine:<12}{result.rows:>7}{result.per_second:>11.0f}'
+                f'{result.per_second / baseline[result.path]:>8.1f}x{"yes" if result.identical else "NO":>11}'
+            )
+
+        if not all(result.identical for result in results):
+            raise CommandError('The fast path rendered different JSON than the serializers.')
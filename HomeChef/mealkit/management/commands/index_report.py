@@ -0,0 +1,61 @@
+# Import the modules needed to report missing and unused indexes from the command line
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from mealkit.benchmarks import DEFAULT_SCALE, seeded_test_database
+from mealkit.indexes import build_index_report
+from mealkit.models import User
+
+
+# Management command that EXPLAINs the queries of every list endpoint
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the queries every /api/ list endpoint runs for each filter and ordering, '
+        'and report full table scans or sorts without an index and indexes no query used.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Analyze a throwaway test database with the synthetic dataset')
+        parser.add_argument('--plans', action='store_true', help='Print every analyzed query with its plan summary')
+        parser.add_argument('--fail-on-missing', action='store_true', help='Exit with an error if an index is missing')
+
+    def handle(self, *args, **options):
+        context = seeded_test_database(**DEFAULT_SCALE) if options['seed'] else nullcontext()
+        with context:
+            user, created = User.objects.get_or_create(username='index-report', defaults={'is_customer': True})
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                # Explain the queries of the uncached path
+                with override_settings(API_CACHE_ENABLED=False):
+                    plans, missing, unused = build_index_report(client)
+            finally:
+                if created and not options['seed']:
+                    user.delete()
+
+        if options['plans']:
+            for plan in plans:
+                self.stdout.write(
+                    f'{plan.route} {plan.params}: scans={sorted(plan.scans)} sorts={plan.sorts} indexes={sorted(plan.indexes)}'
+                )
+                self.stdout.write(f'    {plan.sql}')
+
+        self.stdout.write(f'Analyzed {len(plans)} queries.')
+        self.stdout.write('\nQueries that scan or sort without an index:')
+        for item in missing or []:
+            params = '&'.join(f'{key}={value}' for key, value in item.params.items()) or '-'
+            self.stdout.write(f'  {item.route:<24} {params:<48} {item.table}({", ".join(item.columns)})')
+        if not missing:
+            self.stdout.write('  none')
+
+        self.stdout.write('\nIndexes no analyzed query used (foreign key indexes also serve joins and deletes):')
+        for item in unused:
+            self.stdout.write(f'  {item.table:<28} {item.name:<44} {", ".join(item.columns)}')
+        if not unused:
+            self.stdout.write('  none')
+
+        if missing and options['fail_on_missing']:
+            raise CommandError(f'{len(missing)} queries need an index.')
@@ -0,0 +1,39 @@
+# Import the modules needed to load the offline geocoding table from a CSV file
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mealkit.dispatch import DISPATCH_BATCH_SIZE
+from mealkit.models import PostalCodeZone
+
+
+# Management command that inserts or updates postal code zones from a CSV file
+# with a postal_code,zone,latitude,longitude header
+class Command(BaseCommand):
+    help = 'Load postal code zones and coordinates for the delivery planner from a CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with postal_code, zone, latitude and longitude columns')
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='', encoding='utf-8') as csv_file:
+            try:
+                rows = [
+                    PostalCodeZone(
+                        postal_code=row['postal_code'].strip(),
+                        zone=row['zone'].strip(),
+                        latitude=float(row['latitude']),
+                        longitude=float(row['longitude']),
+                    )
+                    for row in csv.DictReader(csv_file)
+                ]
+            except (KeyError, ValueError) as exc:
+                raise CommandError(f'Invalid postal code file: {exc}')
+        PostalCodeZone.objects.bulk_create(
+            rows,
+            batch_size=DISPATCH_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['postal_code'],
+            update_fields=['zone', 'latitude', 'longitude'],
+        )
+        self.stdout.write(f'Loaded {len(rows)} postal codes.')
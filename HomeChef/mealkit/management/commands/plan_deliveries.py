@@ -0,0 +1,26 @@
+# Import the modules needed to plan delivery routes from the command line
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mealkit.dispatch import ROUTE_MAX_STOPS, plan_routes
+
+
+# Management command that plans the routes of a day's pending deliveries;
+# schedule it every morning, e.g. from cron: `manage.py plan_deliveries`
+class Command(BaseCommand):
+    help = "Group a day's pending deliveries by zone and store routes with their stop order."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, default=None, help='Day to plan (YYYY-MM-DD), today by default')
+        parser.add_argument('--zone', action='append', dest='zones', help='Plan only this zone (repeatable)')
+        parser.add_argument('--max-stops', type=int, default=ROUTE_MAX_STOPS, help='Stops per route at most')
+
+    def handle(self, *args, **options):
+        day = options['date'] or timezone.localdate()
+        started = time.perf_counter()
+        plans = plan_routes(day, options['zones'], options['max_stops'])
+        stops = sum(len(deliveries) for _, deliveries in plans)
+        self.stdout.write(f'Planned {len(plans)} routes with {stops} stops for {day} in {time.perf_counter() - started:.2f}s.')
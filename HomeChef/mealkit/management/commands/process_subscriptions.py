@@ -0,0 +1,19 @@
+# Import the modules needed to renew and expire subscriptions from the command line
+from django.core.management.base import BaseCommand
+
+from mealkit.subscriptions import RENEWAL_BATCH_SIZE, process_due_subscriptions
+
+
+# Management command that renews the subscriptions that came to an end, creating
+# the next period's orders, and expires the rest; schedule it, e.g. hourly from
+# cron, on as many nodes as needed: each run skips the rows the others are locking
+class Command(BaseCommand):
+    help = 'Renew or expire subscriptions whose end date has passed, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=RENEWAL_BATCH_SIZE, help='Subscriptions per transaction')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        result = process_due_subscriptions(batch_size=options['batch_size'], max_batches=options['max_batches'])
+        self.stdout.write(f'Renewed {result.renewed} and expired {result.expired} subscriptions, created {result.orders} orders.')
@@ -0,0 +1,41 @@
+# Import the modules needed to rank endpoints from the request profile log
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mealkit.profiling import rank_endpoints, read_profiles
+
+# Columns of the report and their headers
+COLUMNS = [
+    ('requests', 'n'), ('p50_ms', 'p50 ms'), ('p95_ms', 'p95 ms'), ('max_ms', 'max ms'),
+    ('db_ms', 'db ms'), ('serialize_ms', 'ser ms'), ('queries', 'queries'), ('duplicate_queries', 'dups'),
+    ('response_bytes', 'bytes'),
+]
+
+
+# Management command that aggregates the profiles written by ProfilingMiddleware
+# per endpoint and lists the slowest, e.g. `manage.py profile_report --since 60`
+class Command(BaseCommand):
+    help = 'Rank endpoints by latency, DB time or query count from the request profile log.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=None, help='Profile log path (PROFILING_LOG_PATH by default)')
+        parser.add_argument('--sort', default='p95_ms', choices=['p95_ms', 'p50_ms', 'max_ms', 'sum_ms', 'db_ms', 'serialize_ms', 'queries', 'duplicate_queries', 'requests'])
+        parser.add_argument('--limit', type=int, default=20, help='Endpoints listed')
+        parser.add_argument('--since', type=float, default=None, help='Only requests of the last N minutes')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since'] is not None:
+            since = (timezone.now() - timedelta(minutes=options['since'])).isoformat()
+        rows = rank_endpoints(read_profiles(options['log']), options['sort'], since)[:options['limit']]
+        if not rows:
+            self.stdout.write('No profiled requests.')
+            return
+
+        endpoints = [f"{row['method']} {row['route']}" for row in rows]
+        width = max(len(endpoint) for endpoint in endpoints + ['endpoint'])
+        self.stdout.write('endpoint'.ljust(width) + ''.join(f'{header:>10}' for _, header in COLUMNS))
+        for endpoint, row in zip(endpoints, rows):
+            self.stdout.write(endpoint.ljust(width) + ''.join(f'{row[name]:>10}' for name, _ in COLUMNS))
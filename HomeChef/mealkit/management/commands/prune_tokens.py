@@ -0,0 +1,23 @@
+# Import the modules needed to prune expired JWT bookkeeping from the command line
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mealkit.tokens import PRUNE_BATCH_SIZE, prune_expired_tokens
+
+
+# Management command that deletes expired outstanding and blacklisted tokens in
+# chunks; schedule it, e.g. hourly from cron: `manage.py prune_tokens --pause 0.1`
+class Command(BaseCommand):
+    help = 'Delete expired outstanding tokens and their blacklist entries in primary key batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help='Rows examined per batch')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--grace-hours', type=float, default=0.0, help='Keep tokens that expired this recently')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options['grace_hours'])
+        outstanding, blacklisted = prune_expired_tokens(before, options['batch_size'], options['pause'])
+        self.stdout.write(f'Deleted {outstanding} outstanding and {blacklisted} blacklisted tokens.')
@@ -0,0 +1,16 @@
+# Import the modules needed to rebuild the rating aggregates from the command line
+from django.core.management.base import BaseCommand
+
+from mealkit.ratings import REBUILD_BATCH_SIZE, rebuild_rating_aggregates
+
+
+# Management command that recomputes meal kit and chef ratings from the Review table
+class Command(BaseCommand):
+    help = 'Recompute the denormalized meal kit and chef rating aggregates from the Review table in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE, help='Rows recomputed per query')
+
+    def handle(self, *args, **options):
+        meal_kits, chefs = rebuild_rating_aggregates(batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt rating aggregates for {meal_kits} meal kits and {chefs} chefs.')
@@ -0,0 +1,22 @@
+# Import the modules needed to rebuild the catalog feed from the command line
+from django.core.management.base import BaseCommand
+
+from mealkit.catalog import refresh_catalog_feed
+
+
+# Management command that rebuilds the changed catalog feed rows and publishes a
+# new snapshot; schedule it, e.g. every few minutes from cron, besides the jobs
+# queued on every change. Running it once on deploy publishes the first snapshot
+# before the feed is requested, which otherwise answers 503 until a job builds it
+class Command(BaseCommand):
+    help = 'Rebuild the catalog feed rows of changed meal kits (or all of them) and publish a new snapshot.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every row')
+
+    def handle(self, *args, **options):
+        result = refresh_catalog_feed(full=options['full'])
+        if result is None:
+            self.stdout.write('The catalog feed is up to date.')
+        else:
+            self.stdout.write(f'Rebuilt {result.rows} catalog rows and published version {result.version}.')
@@ -0,0 +1,27 @@
+# Import the modules needed to refresh the daily sales rollup from the command line
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from mealkit.analytics import REFRESH_BATCH_DAYS, all_sales_days, refresh_sales_rollup
+
+
+# Management command that recomputes the rollup rows of the days whose sales
+# changed; schedule it, e.g. every few minutes from cron
+class Command(BaseCommand):
+    help = 'Recompute the daily sales rollup for changed days (or the last N days, or all of history).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=0, help='Also rebuild the last N days')
+        parser.add_argument('--all', action='store_true', help='Rebuild every day since the oldest sale')
+        parser.add_argument('--batch-days', type=int, default=REFRESH_BATCH_DAYS, help='Days rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            days = all_sales_days()
+        else:
+            today = timezone.localdate()
+            days = [today - timedelta(days=offset) for offset in range(options['days'])]
+        rebuilt_days, rows = refresh_sales_rollup(days, options['batch_days'])
+        self.stdout.write(f'Rebuilt {rebuilt_days} days ({rows} rollup rows).')
@@ -0,0 +1,46 @@
+# Import the modules needed to run queued background jobs from the command line
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from mealkit.jobs import CLAIM_BATCH_SIZE, release_stale_jobs, run_pending_jobs, worker_name
+
+
+# Management command that works through the job queue until stopped; run one or
+# more per host under a process supervisor: `manage.py run_jobs --sleep 1`
+class Command(BaseCommand):
+    help = 'Run queued background jobs, retrying failures with exponential backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=CLAIM_BATCH_SIZE, help='Jobs claimed per transaction')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no job is due')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        # Finish the current job on SIGTERM/SIGINT instead of abandoning it
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker = worker_name()
+        totals = [0, 0, 0]
+        released = release_stale_jobs()
+        if released:
+            self.stdout.write(f'Released {released} jobs of lost workers.')
+        while not self.stopping:
+            # Drop connections the database may have closed while idle
+            close_old_connections()
+            counts = run_pending_jobs(worker, options['batch_size'])
+            totals = [total + count for total, count in zip(totals, counts)]
+            if any(counts):
+                continue
+            if options['once']:
+                break
+            release_stale_jobs()
+            time.sleep(options['sleep'])
+        self.stdout.write('Finished {} jobs, {} to be retried, {} failed.'.format(*totals))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,342 @@
+# Import the modules needed to export Prometheus metrics from every worker process
+import atexit
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# Base of the metrics: values live in one dict per thread, so that updates take no
+# lock; a collection sums the threads' dicts and folds in those of finished threads
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.reset()
+        (registry or REGISTRY).register(self)
+
+    def reset(self):
+        self.local = threading.local()
+        # (thread, values) of every thread that updated the metric
+        self.shards = []
+        self.retired = {}
+        # Only taken when a thread first updates the metric, and when collecting
+        self.lock = threading.Lock()
+
+    def shard(self):
+        values = getattr(self.local, 'values', None)
+        if values is None:
+            values = self.local.values = {}
+            with self.lock:
+                self.shards.append((threading.current_thread(), values))
+            REGISTRY.start_flusher()
+        return values
+
+    def collect(self):
+        with self.lock:
+            # Fold finished threads into the retired values
+            alive = []
+            for thread, values in self.shards:
+                if thread.is_alive():
+                    alive.append((thread, values))
+                else:
+                    self.merge(self.retired, dict(values))
+            self.shards = alive
+            total = {}
+            self.merge(total, self.retired)
+            for _, values in alive:
+                # Copying a dict does not release the GIL, so the copy is consistent
+                self.merge(total, dict(values))
+        return total
+
+    @staticmethod
+    def merge(total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+
+# Monotonic count, e.g. requests or logins
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        values = self.shard()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+
+# Distribution of observed values over fixed buckets, with their sum and count
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labelvalues):
+        values = self.shard()
+        counts = values.get(labelvalues)
+        if counts is None:
+            # One count per bucket plus +Inf, then the sum
+            counts = values[labelvalues] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @staticmethod
+    def merge(total, values):
+        for key, counts in values.items():
+            merged = total.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(counts):
+                merged[index] += count
+
+
+# Value read from a callback at collection time, e.g. the connection pool sizes;
+# `callback` returns (labelvalues, value) pairs
+class CallbackMetric(Metric):
+    def __init__(self, name, documentation, labelnames, callback, type='gauge', registry=None):
+        self.callback = callback
+        self.type = type
+        super().__init__(name, documentation, labelnames, registry)
+
+    def collect(self):
+        try:
+            return {tuple(labelvalues): value for labelvalues, value in self.callback()}
+        except Exception:
+            logger.exception('Could not collect %s', self.name)
+            return {}
+
+
+# The metrics of this process. With METRICS_DIR set, each process also writes its
+# values to its own file there every METRICS_FLUSH_INTERVAL seconds, and a scrape
+# of any worker adds up the files of all of them
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.flusher_pid = None
+        self.flusher_lock = threading.Lock()
+        # Unique per process, so that a reused pid does not overwrite a dead worker's file
+        self.file_name = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    # A forked worker starts from zero with its own file, instead of counting the
+    # parent's values a second time
+    def after_fork(self):
+        self.flusher_pid = None
+        self.flusher_lock = threading.Lock()
+        self.file_name = None
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def get_directory(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        return Path(directory) if directory else None
+
+    # {name: {labels as a JSON list: value}} of this process
+    def snapshot(self):
+        return {
+            name: {json.dumps(labelvalues): value for labelvalues, value in metric.collect().items()}
+            for name, metric in self.metrics.items()
+        }
+
+    def start_flusher(self):
+        if self.flusher_pid == os.getpid() or self.get_directory() is None:
+            return
+        with self.flusher_lock:
+            if self.flusher_pid == os.getpid():
+                return
+            self.flusher_pid = os.getpid()
+            self.file_name = f'{os.getpid()}-{uuid.uuid4().hex}.json'
+            thread = threading.Thread(target=self.flush_periodically, name='metrics-flusher', daemon=True)
+            thread.start()
+            atexit.register(self.flush)
+
+    def flush_periodically(self):
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5.0)
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Could not write the metrics file')
+
+    # Replace this process's file atomically
+    def flush(self):
+        directory = self.get_directory()
+        if directory is None or self.file_name is None or self.flusher_pid != os.getpid():
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / self.file_name
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({'pid': os.getpid(), 'metrics': self.snapshot()}))
+        os.replace(temporary, path)
+
+    # Values of every process: this one live, the others from their last flush.
+    # Counters and histograms of exited workers keep counting; gauges only add
+    # up the processes still running
+    def collect(self):
+        own = self.snapshot()
+        snapshots = [(True, own)]
+        directory = self.get_directory()
+        if directory is not None and directory.exists():
+            for path in directory.glob('*.json'):
+                if path.name == self.file_name and self.flusher_pid == os.getpid():
+                    continue
+                try:
+                    data = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    continue
+                snapshots.append((_pid_alive(data.get('pid')), data.get('metrics', {})))
+
+        totals = {}
+        for alive, snapshot in snapshots:
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.type == 'gauge' and not alive):
+                    continue
+                metric.merge(totals.setdefault(name, {}), samples)
+        return totals
+
+    # Render every metric in the Prometheus text format
+    def expose(self):
+        totals = self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {_escape_help(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(totals.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, json.loads(key)))
+                if metric.type == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (math.inf,), value):
+                        cumulative += count
+                        le = '+Inf' if bound == math.inf else repr(float(bound))
+                        lines.append(f'{name}_bucket{_labels(labels + [("le", le)])} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+                    lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+                else:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    if not isinstance(pid, int):
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape_help(text):
+    return text.replace('\\', r'\\').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value))
+
+
+# Metrics of this process
+REGISTRY = Registry()
+os.register_at_fork(after_in_child=REGISTRY.after_fork)
+
+
+# Connection pool sizes and counters of this process (see mealkit/db/pool.py)
+def _pool_samples(*keys):
+    from .db.pool import get_pool_stats
+
+    def samples():
+        for alias, stats in get_pool_stats().items():
+            for key in keys:
+                yield ((alias, key) if len(keys) > 1 else (alias,)), stats[key]
+    return samples
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time to answer a request, by URL name.', ['method', 'url_name', 'status'],
+)
+DB_QUERIES = Counter('db_queries_total', 'Queries run while answering requests.', ['alias'])
+DB_QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Time spent in each query of a request.', ['alias'])
+LOGINS = Counter('auth_logins_total', 'Login attempts by result.', ['result'])
+TOKEN_REFRESHES = Counter('auth_token_refreshes_total', 'Token refreshes by result.', ['result'])
+BLACKLIST_CHECKS = Counter(
+    'auth_blacklist_checks_total', 'Refresh token revocation checks by where they were answered.', ['source'],
+)
+CACHE_REQUESTS = Counter('api_cache_requests_total', 'Response cache lookups by result.', ['result'])
+ORDERS_CREATED = Counter('orders_created_total', 'Orders created.')
+PAYMENTS_CREATED = Counter('payments_created_total', 'Payments created.')
+POOL_CONNECTIONS = CallbackMetric(
+    'db_pool_connections', 'Pooled database connections by state.', ['alias', 'state'], _pool_samples('idle', 'in_use'),
+)
+POOL_CHECKOUTS = CallbackMetric(
+    'db_pool_checkouts_total', 'Connections taken from the pool.', ['alias'], _pool_samples('checkouts'), type='counter',
+)
+POOL_TIMEOUTS = CallbackMetric(
+    'db_pool_timeouts_total', 'Waits for a pooled connection that timed out.', ['alias'], _pool_samples('timeouts'), type='counter',
+)
+POOL_WAIT = CallbackMetric(
+    'db_pool_wait_seconds_total', 'Time spent waiting for a pooled connection.', ['alias'], _pool_samples('wait_seconds_total'), type='counter',
+)
+
+
+# Times each request per URL name and counts and times its queries
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.QueryTimer(connection.alias)))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        url_name = (match.url_name if match is not None else None) or 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - started, request.method, url_name, f'{response.status_code // 100}xx')
+        return response
+
+    # Execute wrapper recording the count and latency of the queries on one alias
+    class QueryTimer:
+        def __init__(self, alias):
+            self.alias = alias
+
+        def __call__(self, execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                DB_QUERIES.inc(self.alias)
+                DB_QUERY_LATENCY.observe(time.perf_counter() - started, self.alias)
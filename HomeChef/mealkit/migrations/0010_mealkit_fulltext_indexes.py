@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+# FULLTEXT indexes only exist on MySQL; other backends use the in-process search index
+def create_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(
+        'CREATE FULLTEXT INDEX mealkit_mealkit_search_ft '
+        'ON mealkit_mealkit (meal_name, description, ingredients)'
+    )
+    schema_editor.execute(
+        'CREATE FULLTEXT INDEX mealkit_chefprofile_speciality_ft '
+        'ON mealkit_chefprofile (speciality)'
+    )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute('DROP INDEX mealkit_mealkit_search_ft ON mealkit_mealkit')
+    schema_editor.execute('DROP INDEX mealkit_chefprofile_speciality_ft ON mealkit_chefprofile')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0009_rename_user_order_customer_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
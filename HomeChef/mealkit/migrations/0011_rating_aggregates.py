@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+# Rows rewritten per query by the backfill
+BATCH_SIZE = 500
+
+
+# Fill the new aggregates from the existing reviews: meal kits from their reviews,
+# then chefs from their meal kits. Self-contained, so that it runs against the
+# historical models whatever the app code looks like later
+def populate_rating_aggregates(apps, schema_editor):
+    MealKit = apps.get_model('mealkit', 'MealKit')
+    ChefProfile = apps.get_model('mealkit', 'ChefProfile')
+    Review = apps.get_model('mealkit', 'Review')
+    counted = ['review_count', 'rating_sum'] + [f'rating_{value}_count' for value in range(1, 6)]
+
+    def rebuild(model, source, group_field, aggregates):
+        last = 0
+        while True:
+            instances = list(model.objects.filter(pk__gt=last).order_by('pk')[:BATCH_SIZE])
+            if not instances:
+                return
+            last = instances[-1].pk
+            grouped = (
+                source.filter(**{f'{group_field}__in': [instance.pk for instance in instances]})
+                .values(group_field).annotate(**aggregates)
+            )
+            rows = {row.pop(group_field): row for row in grouped}
+            for instance in instances:
+                row = rows.get(instance.pk, {})
+                for name in counted:
+                    setattr(instance, name, row.get(name) or 0)
+                instance.rating = instance.rating_sum / instance.review_count if instance.review_count else 0.0
+            model.objects.bulk_update(instances, ['rating'] + counted)
+
+    review_aggregates = {'review_count': Count('rating'), 'rating_sum': Sum('rating')}
+    for value in range(1, 6):
+        review_aggregates[f'rating_{value}_count'] = Count('rating', filter=Q(rating=value))
+    rebuild(MealKit, Review.objects.all(), 'meal_kit', review_aggregates)
+    rebuild(ChefProfile, MealKit.objects.all(), 'chef', {name: Sum(name) for name in counted})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0010_mealkit_fulltext_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chefprofile',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chefprofile',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chefprofile',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chefprofile',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chefprofile',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chefprofile',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='chefprofile',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='mealkit',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='chefprofile',
+            name='rating',
+            field=models.FloatField(default=0.0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
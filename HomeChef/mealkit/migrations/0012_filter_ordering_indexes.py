@@ -0,0 +1,85 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0011_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chefprofile',
+            index=models.Index(fields=['speciality'], name='chef_speciality_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chefprofile',
+            index=models.Index(fields=['rating'], name='chef_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_status', 'delivery_date'], name='delivery_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_date'], name='delivery_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealkit',
+            index=models.Index(fields=['meal_name'], name='mealkit_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealkit',
+            index=models.Index(fields=['price'], name='mealkit_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealkit',
+            index=models.Index(fields=['rating'], name='mealkit_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealkit',
+            index=models.Index(fields=['review_count'], name='mealkit_review_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'order_date'], name='order_customer_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_amount'], name='order_total_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['payment_date'], name='payment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['amount'], name='payment_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['rating', 'review_date'], name='review_rating_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['review_date'], name='review_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['start_date'], name='subscription_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['end_date'], name='subscription_end_idx'),
+        ),
+    ]
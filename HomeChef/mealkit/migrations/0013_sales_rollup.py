@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0012_filter_ordering_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('source', models.CharField(choices=[('order', 'Orders'), ('payment', 'Payments'), ('booking', 'Chef service bookings'), ('subscription', 'Subscriptions')], max_length=20)),
+                ('status', models.CharField(blank=True, max_length=50)),
+                ('meal_kit_id', models.IntegerField(null=True)),
+                ('chef_id', models.IntegerField(null=True)),
+                ('company_id', models.IntegerField(null=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'day'], name='sales_rollup_source_day_idx')],
+            },
+        ),
+    ]
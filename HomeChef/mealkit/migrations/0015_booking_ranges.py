@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copy the chef and end time of the existing bookings from their services
+def populate_booking_ranges(apps, schema_editor):
+    ChefServiceBooking = apps.get_model('mealkit', 'ChefServiceBooking')
+    bookings = []
+    for booking in ChefServiceBooking.objects.select_related('service').iterator(chunk_size=1000):
+        booking.chef_id = booking.service.chef_id
+        booking.service_end = booking.service_date + booking.service.duration
+        bookings.append(booking)
+        if len(bookings) == 1000:
+            ChefServiceBooking.objects.bulk_update(bookings, ['chef', 'service_end'])
+            bookings = []
+    ChefServiceBooking.objects.bulk_update(bookings, ['chef', 'service_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0014_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chefservicebooking',
+            name='chef',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='mealkit.chefprofile'),
+        ),
+        migrations.AddField(
+            model_name='chefservicebooking',
+            name='service_end',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='chefservicebooking',
+            index=models.Index(fields=['chef', 'service_date', 'service_end'], name='booking_chef_range_idx'),
+        ),
+        migrations.RunPython(populate_booking_ranges, migrations.RunPython.noop),
+    ]
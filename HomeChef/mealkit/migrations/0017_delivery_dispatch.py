@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0016_subscription_renewal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostalCodeZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('postal_code', models.CharField(max_length=12, unique=True)),
+                ('zone', models.CharField(db_index=True, max_length=50)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='geocoded_address',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='latitude',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='longitude',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='route_position',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='zone',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.CreateModel(
+            name='DeliveryRoute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delivery_day', models.DateField()),
+                ('zone', models.CharField(blank=True, max_length=50)),
+                ('distance', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['delivery_day', 'zone'], name='route_day_zone_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='delivery',
+            name='route',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='deliveries', to='mealkit.deliveryroute'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['route', 'route_position'], name='delivery_route_position_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealkit', '0017_delivery_dispatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogFeedDirty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('meal_kit_id', models.PositiveIntegerField(null=True)),
+                ('chef_id', models.PositiveIntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogFeedRow',
+            fields=[
+                ('meal_kit_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('chef_id', models.PositiveIntegerField(db_index=True)),
+                ('content', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CatalogSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('meal_kit_count', models.PositiveIntegerField(default=0)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('content', models.BinaryField()),
+                ('etag', models.CharField(max_length=64)),
+            ],
+        ),
+    ]
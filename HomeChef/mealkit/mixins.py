@@ -0,0 +1,133 @@
+# Import the helpers needed to walk a serializer tree and optimize querysets
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+
+from .sparse import get_field_selection
+
+
+# Describes how a queryset should be loaded for a given serializer class
+class EagerLoadingPlan:
+    def __init__(self, select_related=(), prefetch_related=(), only=None):
+        # Forward FK / one-to-one paths joined in the main query
+        self.select_related = tuple(select_related)
+        # Reverse FK / many-to-many paths loaded with one extra query each
+        self.prefetch_related = tuple(prefetch_related)
+        # Columns to load, or None when every column is needed
+        self.only = tuple(only) if only is not None else None
+
+    def apply(self, queryset):
+        # Apply the plan to a queryset, keeping anything already configured on it
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.only is not None:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+# Walk one serializer level and collect the relations and columns it reads;
+# returns True when some column on a joined level can be deferred
+def _walk(serializer, model, prefix, select, prefetch, only, in_prefetch):
+    # Track whether every field on this level maps onto a concrete column
+    restrictable = True
+    deferred = False
+    columns = [model._meta.pk.name]
+
+    for field in serializer.fields.values():
+        # Write-only fields are never read while rendering a response
+        if field.write_only:
+            continue
+
+        source = field.source
+        # Fields rendered from the whole object (source='*') may read anything
+        if source == '*':
+            restrictable = False
+            continue
+
+        # Dotted sources (e.g. 'customer.customer_name') follow a relation
+        name, _, rest = source.partition('.')
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Properties, methods and SerializerMethodFields may touch any column
+            restrictable = False
+            continue
+
+        path = prefix + name
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+
+        if model_field.is_relation and (model_field.many_to_many or model_field.one_to_many):
+            # Collections can not be joined without multiplying rows, so prefetch them
+            prefetch.append(path)
+            if isinstance(nested, serializers.ModelSerializer):
+                _walk(nested, model_field.related_model, path + '__', select, prefetch, only, True)
+            continue
+
+        if model_field.is_relation and (model_field.many_to_one or model_field.one_to_one):
+            columns.append(name)
+            if isinstance(nested, serializers.ModelSerializer) or rest:
+                # Nested objects and dotted lookups need the related row
+                (prefetch if in_prefetch else select).append(path)
+            if isinstance(nested, serializers.ModelSerializer):
+                deferred |= _walk(nested, model_field.related_model, path + '__', select, prefetch, only, in_prefetch)
+            elif rest:
+                restrictable = False
+            continue
+
+        if getattr(model_field, 'concrete', False):
+            columns.append(name)
+        else:
+            restrictable = False
+
+    # only() can not reach through prefetch lookups, so restrict joined levels only
+    if in_prefetch:
+        return False
+    all_columns = [f.name for f in model._meta.concrete_fields]
+    if restrictable:
+        only.extend(prefix + column for column in columns)
+        return deferred or not set(all_columns).issubset(columns)
+    # Load every column of this level
+    only.extend(prefix + column for column in all_columns)
+    return deferred
+
+
+# Build (and memoize) the eager loading plan for a serializer class rendering
+# the fields chosen by `selection`; bounded since selections come from clients
+@lru_cache(maxsize=1024)
+def get_eager_loading_plan(serializer_class, selection=None):
+    model = serializer_class.Meta.model
+    select, prefetch, only = [], [], []
+    serializer = serializer_class(context={'field_selection': selection})
+    deferred = _walk(serializer, model, '', select, prefetch, only, False)
+
+    # Skip only() entirely when it would not defer any column
+    if not deferred:
+        only = None
+
+    return EagerLoadingPlan(
+        select_related=dict.fromkeys(select),
+        prefetch_related=dict.fromkeys(prefetch),
+        only=dict.fromkeys(only) if only is not None else None,
+    )
+
+
+# Apply the eager loading plan of a serializer class to a queryset
+def optimize_queryset(queryset, serializer_class, selection=None):
+    # Only ModelSerializers describe the model they render
+    if not issubclass(serializer_class, serializers.ModelSerializer):
+        return queryset
+    if serializer_class.Meta.model is not queryset.model:
+        return queryset
+    return get_eager_loading_plan(serializer_class, selection).apply(queryset)
+
+
+# Mixin for generic views that eager-loads everything the serializer renders
+class EagerLoadingMixin:
+    def get_queryset(self):
+        # Start from the view's queryset and join/prefetch the relations the
+        # serializer renders for this request's ?fields=/?omit=/?expand=
+        queryset = super().get_queryset()
+        return optimize_queryset(queryset, self.get_serializer_class(), get_field_selection(self.request))
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 
 # Custom User model extending AbstractUser
 class User(AbstractUser):
@@ -76,24 +77,67 @@ class Subscription(models.Model):
     start_date = models.DateTimeField(auto_now_add=True)
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    # Renewed for another period when it ends, unless turned off or the plan is withdrawn
+    auto_renew = models.BooleanField(default=True)
+    # Meal kit ordered every week of a renewed period (see mealkit/subscriptions.py)
+    meal_kit = models.ForeignKey('MealKit', on_delete=models.SET_NULL, null=True, blank=True, related_name='subscriptions')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_date'], name='subscription_start_idx'),
+            models.Index(fields=['end_date'], name='subscription_end_idx'),
+            # Active subscriptions that have come to an end
+            models.Index(fields=['is_active', 'end_date'], name='subscription_active_end_idx'),
+        ]
 
     def __str__(self):
         return f"Subscription for {self.customer_name} - {self.plan} ({self.start_date.date()} to {self.end_date.date()})"
     
+# Review aggregates kept up to date by mealkit.ratings whenever a Review changes
+class RatingAggregates(models.Model):
+    rating = models.FloatField(default=0.0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    # Rating histogram: number of reviews with each star value
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        # Updates leave the aggregates alone, so a stale instance can not
+        # overwrite ratings that changed since it was loaded
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            skipped = {field.name for field in RatingAggregates._meta.local_fields} | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
 # Model representing a Chef
-class ChefProfile(models.Model):
+class ChefProfile(RatingAggregates):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='chef_profile', null=True, blank=True)
     chef_name = models.CharField(max_length=50, null=True)
     bio = models.TextField(blank=True, null=True)
     cooking_experience = models.IntegerField(help_text="Years of experience")
     speciality = models.CharField(max_length=255, help_text="Chef's speciality dishes")
-    rating = models.FloatField(default=0.0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['speciality'], name='chef_speciality_idx'),
+            models.Index(fields=['rating'], name='chef_rating_idx'),
+        ]
 
     def __str__(self):
         return self.chef_name if self.chef_name else "Unnamed Chef"
 
 # Model representing a Meal Kit
-class MealKit(models.Model):
+class MealKit(RatingAggregates):
     chef = models.ForeignKey(ChefProfile, on_delete=models.CASCADE, related_name='meal_kits')
     meal_name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
@@ -103,6 +147,21 @@ class MealKit(models.Model):
     ingredients = models.TextField()
     is_available = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['meal_name'], name='mealkit_name_idx'),
+            models.Index(fields=['price'], name='mealkit_price_idx'),
+            models.Index(fields=['rating'], name='mealkit_rating_idx'),
+            models.Index(fields=['review_count'], name='mealkit_review_count_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored chef so that moving a meal kit can move its ratings
+        instance._loaded_chef_id = instance.__dict__.get('chef_id')
+        return instance
+
     def __str__(self):
         return self.meal_name
 
@@ -131,6 +190,24 @@ class ChefServiceBooking(models.Model):
     service_date = models.DateTimeField()
     status = models.CharField(max_length=50, choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='pending')
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    # The booked chef and the end of the booked time, copied from the service on save
+    chef = models.ForeignKey(ChefProfile, on_delete=models.CASCADE, related_name='bookings', null=True, editable=False)
+    service_end = models.DateTimeField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Bookings of a chef overlapping a time range (see mealkit/bookings.py)
+            models.Index(fields=['chef', 'service_date', 'service_end'], name='booking_chef_range_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the booked range in step with the service and its duration
+        if self.service_id is not None and self.service_date is not None:
+            self.chef_id = self.service.chef_id
+            self.service_end = self.service_date + self.service.duration
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'chef', 'service_end'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Booking for {self.service} by {self.customer}"
@@ -159,6 +236,15 @@ class Order(models.Model):
     payment_status = models.CharField(max_length=50, choices=PAYMENT_STATUS_CHOICES, default=PAYMENT_PENDING)
     order_date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Order history of one customer, newest first
+            models.Index(fields=['customer', 'order_date'], name='order_customer_date_idx'),
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+            models.Index(fields=['order_date'], name='order_date_idx'),
+            models.Index(fields=['total_amount'], name='order_total_amount_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.customer}"
 
@@ -195,9 +281,21 @@ class CartItem(models.Model):
 class Review(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='reviews')
     meal_kit = models.ForeignKey(MealKit, on_delete=models.CASCADE, related_name='reviews')
-    rating = models.PositiveSmallIntegerField()
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True)
     review_date=models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rating', 'review_date'], name='review_rating_date_idx'),
+            models.Index(fields=['review_date'], name='review_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The rating aggregates are updated by signals inside the same transaction
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Review by {self.customer} for {self.meal_kit}"
 
@@ -209,6 +307,12 @@ class Payment(models.Model):
     payment_method = models.CharField(max_length=50)
     status = models.CharField(max_length=50, choices=[('pending', 'Pending'), ('completed', 'Completed')], default='pending')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_date'], name='payment_date_idx'),
+            models.Index(fields=['amount'], name='payment_amount_idx'),
+        ]
+
     def __str__(self):
         return f"Payment {self.id} for Order {self.order.id}"
 
@@ -218,6 +322,151 @@ class Delivery(models.Model):
     delivery_date = models.DateTimeField()
     delivery_address = models.TextField()
     delivery_status = models.CharField(max_length=50, choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed')], default='pending')
+    # Zone and coordinates of the address, looked up once by mealkit.dispatch
+    geocoded_address = models.TextField(blank=True, editable=False)
+    zone = models.CharField(max_length=50, blank=True, editable=False)
+    latitude = models.FloatField(null=True, editable=False)
+    longitude = models.FloatField(null=True, editable=False)
+    # The planned route and the stop's place on it
+    route = models.ForeignKey('DeliveryRoute', on_delete=models.SET_NULL, null=True, blank=True, related_name='deliveries', editable=False)
+    route_position = models.PositiveIntegerField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_status', 'delivery_date'], name='delivery_status_date_idx'),
+            models.Index(fields=['delivery_date'], name='delivery_date_idx'),
+            models.Index(fields=['route', 'route_position'], name='delivery_route_position_idx'),
+        ]
 
     def __str__(self):
         return f"Delivery {self.id} for Order {self.order.id}"
+
+# Offline geocoding table: the zone and coordinates of a postal code
+class PostalCodeZone(models.Model):
+    postal_code = models.CharField(max_length=12, unique=True)
+    zone = models.CharField(max_length=50, db_index=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def __str__(self):
+        return f"{self.postal_code} ({self.zone})"
+
+# Ordered stops of one zone delivered on one day, planned by mealkit.dispatch
+class DeliveryRoute(models.Model):
+    delivery_day = models.DateField()
+    zone = models.CharField(max_length=50, blank=True)
+    # Kilometres from the first to the last stop with known coordinates
+    distance = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_day', 'zone'], name='route_day_zone_idx'),
+        ]
+
+    def __str__(self):
+        return f"Route {self.id} {self.zone or 'unzoned'} on {self.delivery_day}"
+
+# Daily sales totals per source and dimension, maintained by mealkit.analytics
+class SalesRollup(models.Model):
+    ORDER = 'order'
+    PAYMENT = 'payment'
+    BOOKING = 'booking'
+    SUBSCRIPTION = 'subscription'
+
+    SOURCE_CHOICES = [
+        (ORDER, 'Orders'),
+        (PAYMENT, 'Payments'),
+        (BOOKING, 'Chef service bookings'),
+        (SUBSCRIPTION, 'Subscriptions'),
+    ]
+
+    day = models.DateField()
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    status = models.CharField(max_length=50, blank=True)
+    # Plain ids rather than foreign keys: deleting a meal kit must not rewrite history
+    meal_kit_id = models.IntegerField(null=True)
+    chef_id = models.IntegerField(null=True)
+    company_id = models.IntegerField(null=True)
+    count = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['source', 'day'], name='sales_rollup_source_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} sales on {self.day}"
+
+# Days whose sales changed since the rollup last covered them
+class SalesRollupDirtyDay(models.Model):
+    day = models.DateField(unique=True)
+
+    def __str__(self):
+        return str(self.day)
+
+# Background job waiting for (or being run by) a worker, see mealkit/jobs.py
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest due jobs of a status
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} {self.name} ({self.status})"
+
+# Denormalized catalog feed row of one meal kit (meal kit, chef summary, rating
+# summary and availability), rendered to JSON once per change, see mealkit/catalog.py
+class CatalogFeedRow(models.Model):
+    meal_kit_id = models.PositiveIntegerField(primary_key=True)
+    chef_id = models.PositiveIntegerField(db_index=True)
+    content = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Catalog row of meal kit {self.meal_kit_id}"
+
+# Catalog feed rows to rebuild: one meal kit's, every meal kit of a chef, or with
+# neither set only the subscription plans
+class CatalogFeedDirty(models.Model):
+    meal_kit_id = models.PositiveIntegerField(null=True)
+    chef_id = models.PositiveIntegerField(null=True)
+
+    def __str__(self):
+        return f"Catalog change of meal kit {self.meal_kit_id} / chef {self.chef_id}"
+
+# One published version of the catalog feed, stored gzip-compressed
+class CatalogSnapshot(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    meal_kit_count = models.PositiveIntegerField(default=0)
+    # Uncompressed size in bytes
+    size = models.PositiveIntegerField(default=0)
+    content = models.BinaryField()
+    etag = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"Catalog snapshot {self.id} ({self.meal_kit_count} meal kits)"
@@ -0,0 +1,294 @@
+# Import the modules needed for keyset pagination and cheaper page counts
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import partial
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Supported values of the `count` query parameter
+COUNT_EXACT = 'exact'
+COUNT_APPROXIMATE = 'approximate'
+COUNT_NONE = 'none'
+COUNT_MODES = (COUNT_EXACT, COUNT_APPROXIMATE, COUNT_NONE)
+
+# Approximate counts stop counting filtered rows after this many
+APPROXIMATE_COUNT_LIMIT = 1000
+
+
+# Estimate the number of rows in a queryset without a full COUNT(*)
+def approximate_count(queryset, limit=APPROXIMATE_COUNT_LIMIT):
+    connection = connections[queryset.db]
+    # Unfiltered MySQL tables: read the row estimate kept by InnoDB
+    if connection.vendor == 'mysql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] is not None:
+            return row[0]
+    # Otherwise count at most `limit` rows: SELECT COUNT(*) FROM (... LIMIT n)
+    return queryset.order_by()[:limit].count()
+
+
+# JSON encoder for cursor values; keeps the full microsecond precision of datetimes
+class CursorJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+# Django paginator whose total count comes from approximate_count()
+class ApproximateCountPaginator(Paginator):
+    def __init__(self, *args, count_limit=APPROXIMATE_COUNT_LIMIT, **kwargs):
+        self.count_limit = count_limit
+        super().__init__(*args, **kwargs)
+
+    @cached_property
+    def count(self):
+        return approximate_count(self.object_list, self.count_limit)
+
+
+# Keyset (seek) pagination: every page is an indexed range scan with no OFFSET
+class KeysetPagination(BasePagination):
+    page_size = 2
+    page_size_query_param = 'page_size'
+    max_page_size = 10
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    # Cursor pages skip the total count unless the client asks for one
+    default_count_mode = COUNT_NONE
+    # Ordering used when neither the view nor OrderingFilter orders the queryset
+    default_ordering = ('-pk',)
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+        values, reverse = self.decode_cursor(request)
+
+        # Count the filtered rows before the keyset condition narrows them
+        self.count_mode = get_count_mode(request, self.count_query_param, self.default_count_mode)
+        if self.count_mode == COUNT_EXACT:
+            self.count = queryset.count()
+        elif self.count_mode == COUNT_APPROXIMATE:
+            self.count = approximate_count(queryset)
+
+        queryset = queryset.order_by(*self.get_order_by(reverse))
+        # Sparse fieldsets may defer the columns the cursors are built from
+        names, deferred = queryset.query.deferred_loading
+        if names and not deferred:
+            queryset = queryset.only(*names, *(field.name for field, _ in self.ordering))
+        # So may the values_list() rows of the fast path (see mealkit/fastpath.py);
+        # the ordering columns go last so the rendered columns keep their places
+        fields = getattr(queryset, '_fields', None)
+        if fields:
+            missing = [field.attname for field, _ in self.ordering if field.attname not in fields]
+            if missing:
+                queryset = queryset.values_list(*fields, *missing, named=True)
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(values, reverse))
+
+        # Fetch one extra row to learn whether another page follows
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.has_next = (values is not None) if reverse else has_more
+        self.has_previous = has_more if reverse else (values is not None)
+        self.first_values = self.get_row_values(rows[0]) if rows else values
+        self.last_values = self.get_row_values(rows[-1]) if rows else values
+        return rows
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+                if page_size > 0:
+                    return min(page_size, self.max_page_size) if self.max_page_size else page_size
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, queryset, view):
+        # Prefer the ordering applied by OrderingFilter, then the view's keyset ordering
+        terms = list(queryset.query.order_by) or list(getattr(view, 'keyset_ordering', None) or self.default_ordering)
+        ordering = []
+        pk = queryset.model._meta.pk
+        for term in terms:
+            if not isinstance(term, str):
+                raise ParseError('Cursor pagination requires ordering on model fields.')
+            descending = term.startswith('-')
+            name = term.lstrip('-')
+            try:
+                field = pk if name == 'pk' else queryset.model._meta.get_field(name)
+            except FieldDoesNotExist:
+                raise ParseError(f'Cursor pagination can not order by "{name}".')
+            if not field.concrete:
+                raise ParseError(f'Cursor pagination can not order by "{name}".')
+            ordering.append((field, descending))
+        # The primary key breaks ties so that every row has a unique position
+        if not any(field == pk for field, _ in ordering):
+            ordering.append((pk, ordering[0][1] if ordering else True))
+        return ordering
+
+    def get_order_by(self, reverse):
+        # NULLs sort first ascending and last descending on every backend
+        order_by = []
+        for field, descending in self.ordering:
+            if descending != reverse:
+                order_by.append(F(field.attname).desc(nulls_last=True))
+            else:
+                order_by.append(F(field.attname).asc(nulls_first=True))
+        return order_by
+
+    def get_keyset_filter(self, values, reverse):
+        # (a, b, pk) > (x, y, z)  ==>  a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+        keyset = Q(pk__in=[])
+        equal = Q()
+        for (field, descending), value in zip(self.ordering, values):
+            after = self.get_after_filter(field.attname, value, descending != reverse)
+            if after is not None:
+                keyset |= equal & after
+            equal &= Q(**{f'{field.attname}__isnull': True}) if value is None else Q(**{field.attname: value})
+        return keyset
+
+    def get_after_filter(self, attname, value, descending):
+        if descending:
+            # Descending order puts NULLs last, so nothing follows a NULL
+            if value is None:
+                return None
+            return Q(**{f'{attname}__lt': value}) | Q(**{f'{attname}__isnull': True})
+        if value is None:
+            return Q(**{f'{attname}__isnull': False})
+        return Q(**{f'{attname}__gt': value})
+
+    def get_row_values(self, row):
+        return [getattr(row, field.attname) for field, _ in self.ordering]
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, cls=CursorJSONEncoder, separators=(',', ':'))
+        cursor = urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode()).decode())
+            raw_values, reverse = payload['v'], bool(payload['r'])
+            if len(raw_values) != len(self.ordering):
+                raise ValueError
+            values = [
+                None if value is None else field.to_python(value)
+                for (field, _), value in zip(self.ordering, raw_values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.last_values, False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.first_values, True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.count_mode != COUNT_NONE:
+            response['count'] = self.count
+            response['count_approximate'] = self.count_mode == COUNT_APPROXIMATE
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'count_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+
+# Read the requested count mode, falling back to the paginator's default
+def get_count_mode(request, param, default):
+    mode = request.query_params.get(param, default)
+    return mode if mode in COUNT_MODES else default
+
+
+# Lets a PageNumberPagination switch to keyset pagination per view or per request
+class KeysetSwitchMixin:
+    # Query parameter selecting 'page' or 'cursor' pagination for a single request
+    mode_query_param = 'pagination'
+    keyset_pagination_class = KeysetPagination
+    count_query_param = 'count'
+    default_count_mode = COUNT_EXACT
+
+    def get_pagination_mode(self, request, view):
+        mode = request.query_params.get(self.mode_query_param)
+        if mode in ('page', 'cursor'):
+            return mode
+        # A cursor in the query string always means keyset pagination
+        if request.query_params.get(self.keyset_pagination_class.cursor_query_param):
+            return 'cursor'
+        return getattr(view, 'pagination_mode', 'page')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.get_pagination_mode(request, view) == 'cursor':
+            self.keyset = self.keyset_pagination_class()
+            self.keyset.page_size = self.page_size
+            self.keyset.page_size_query_param = self.page_size_query_param
+            self.keyset.max_page_size = self.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        # Page numbers need some total, so 'none' falls back to an approximate count
+        self.count_mode = get_count_mode(request, self.count_query_param, self.default_count_mode)
+        if self.count_mode == COUNT_NONE:
+            self.count_mode = COUNT_APPROXIMATE
+        if self.count_mode == COUNT_APPROXIMATE:
+            # Count far enough to reach the requested page
+            try:
+                page_number = int(request.query_params.get(self.page_query_param, 1))
+            except ValueError:
+                page_number = 1
+            count_limit = max(APPROXIMATE_COUNT_LIMIT, page_number * self.get_page_size(request) + 1)
+            self.django_paginator_class = partial(ApproximateCountPaginator, count_limit=count_limit)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        if self.count_mode == COUNT_APPROXIMATE:
+            response.data['count_approximate'] = True
+        return response
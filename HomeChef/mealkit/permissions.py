@@ -1,4 +1,7 @@
 # Import the BasePermission class from rest_framework.permissions
+import hmac
+
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
 # Custom permission class to check if the user is a Customer
@@ -21,3 +24,14 @@ class IsCompany(BasePermission):
     def has_permission(self, request, view):
         # Return True if the user is a company, otherwise False
         return request.user.is_company == True
+
+# Permission class for the metrics scraper: with METRICS_TOKEN set, requests must
+# send it as "Authorization: Bearer <token>"; without it the metrics are open
+class HasMetricsToken(BasePermission):
+    # Method to check if the request carries the metrics token
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        if not token:
+            return True
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        return hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
@@ -0,0 +1,249 @@
+# Import the modules needed to measure where the time of each request goes
+import contextvars
+import functools
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+from rest_framework import serializers
+
+from .fastpath import RowPlan
+
+logger = logging.getLogger(__name__)
+
+# Name of the logger the request profiles are written to, one JSON object per line
+PROFILE_LOGGER = 'mealkit.profiling.requests'
+
+# Longest SQL kept in a profile for the most repeated statement
+MAX_SQL_LENGTH = 500
+
+# Profile of the request being handled in this thread or task, or None
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+# What one request spent its time on
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        self.executions = Counter()
+        self.serializer_time = 0.0
+        self.serializer_db_time = 0.0
+        self.serializer_depth = 0
+
+    # Wraps every query of the request (connection.execute_wrapper)
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries += 1
+            if self.serializer_depth:
+                self.serializer_db_time += elapsed
+            self.statements[sql] += 1
+            try:
+                self.executions[(sql, repr(params))] += 1
+            except Exception:
+                pass
+
+    # Queries repeated with the same parameters, which a cache or select_related could save
+    @property
+    def duplicate_queries(self):
+        return sum(count - 1 for count in self.executions.values() if count > 1)
+
+    # Statement run most often with any parameters, the usual sign of an N+1 pattern
+    @property
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        sql, count = self.statements.most_common(1)[0]
+        return sql[:MAX_SQL_LENGTH], count
+
+
+# Time the outermost to_representation of each serializer tree, since nested
+# serializers run inside their parent's call
+def _timed(to_representation):
+    @functools.wraps(to_representation)
+    def wrapper(self, *args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return to_representation(self, *args, **kwargs)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return to_representation(self, *args, **kwargs)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+    wrapper.profiled = True
+    return wrapper
+
+
+# Patch the serializer base classes and the row plans of the fast path once;
+# unprofiled requests only pay a context variable lookup
+def instrument_serializers():
+    for cls, name in ((serializers.Serializer, 'to_representation'), (serializers.ListSerializer, 'to_representation'), (RowPlan, 'render_rows')):
+        if not getattr(getattr(cls, name), 'profiled', False):
+            setattr(cls, name, _timed(getattr(cls, name)))
+
+
+# Send the profile log to a file rotated by size
+def configure_profile_log():
+    profile_logger = logging.getLogger(PROFILE_LOGGER)
+    if profile_logger.handlers:
+        return profile_logger
+    path = Path(getattr(settings, 'PROFILING_LOG_PATH', 'profile.log'))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=getattr(settings, 'PROFILING_LOG_MAX_BYTES', 10 * 1024 * 1024),
+        backupCount=getattr(settings, 'PROFILING_LOG_BACKUPS', 5),
+        encoding='utf-8',
+    )
+    profile_logger.addHandler(handler)
+    profile_logger.setLevel(logging.INFO)
+    profile_logger.propagate = False
+    return profile_logger
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+# Opt-in middleware (PROFILING_ENABLED) that profiles a sample of requests: total,
+# DB and serializer time, query and duplicate counts and response size, sent back
+# in a Server-Timing header and appended to the profile log for `profile_report`
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.log = configure_profile_log()
+        instrument_serializers()
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile.record_query))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        total = time.perf_counter() - profile.started
+
+        entry = self.build_entry(request, response, profile, total)
+        response['Server-Timing'] = self.server_timing(entry)
+        try:
+            self.log.info(json.dumps(entry))
+        except Exception:
+            logger.exception('Could not write the request profile')
+        return response
+
+    def build_entry(self, request, response, profile, total):
+        match = getattr(request, 'resolver_match', None)
+        sql, repeats = profile.most_repeated
+        if response.streaming:
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            size = len(response.content)
+        return {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            # The URL pattern, so that all /orders/<pk>/ requests rank together
+            'route': f'/{match.route}' if match is not None and match.route else request.path,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': _ms(total),
+            'db_ms': _ms(profile.db_time),
+            'queries': profile.queries,
+            'duplicate_queries': profile.duplicate_queries,
+            # Serialization without the queries it ran lazily
+            'serialize_ms': _ms(profile.serializer_time - profile.serializer_db_time),
+            'serialize_db_ms': _ms(profile.serializer_db_time),
+            'response_bytes': size,
+            'most_repeated_sql': sql if repeats > 1 else None,
+            'most_repeated_count': repeats,
+        }
+
+    def server_timing(self, entry):
+        app = max(entry['total_ms'] - entry['db_ms'] - entry['serialize_ms'], 0)
+        return ', '.join([
+            f'total;dur={entry["total_ms"]}',
+            f'db;dur={entry["db_ms"]};desc="{entry["queries"]} queries, {entry["duplicate_queries"]} duplicates"',
+            f'serialize;dur={entry["serialize_ms"]}',
+            f'app;dur={round(app, 3)}',
+        ])
+
+
+# The profiles in the log and its rotated backups, oldest first
+def read_profiles(path=None):
+    path = Path(path or getattr(settings, 'PROFILING_LOG_PATH', 'profile.log'))
+    files = sorted(path.parent.glob(path.name + '.*'), key=lambda file: -int(file.suffix[1:]) if file.suffix[1:].isdigit() else 0)
+    for file in files + [path]:
+        if not file.exists():
+            continue
+        with open(file, encoding='utf-8') as lines:
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash or a rotation
+                    continue
+
+
+# Value at the given percentile (nearest rank) of sorted values
+def percentile(values, fraction):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+# Aggregate profiles per (method, route), slowest first by `sort`
+def rank_endpoints(profiles, sort='p95_ms', since=None):
+    groups = {}
+    for profile in profiles:
+        if since is not None and profile.get('time', '') < since:
+            continue
+        groups.setdefault((profile['method'], profile['route']), []).append(profile)
+
+    rows = []
+    for (method, route), items in groups.items():
+        totals = sorted(item['total_ms'] for item in items)
+        count = len(items)
+        rows.append({
+            'method': method,
+            'route': route,
+            'requests': count,
+            'p50_ms': percentile(totals, 0.5),
+            'p95_ms': percentile(totals, 0.95),
+            'max_ms': totals[-1],
+            'sum_ms': round(sum(totals), 3),
+            'db_ms': round(sum(item['db_ms'] for item in items) / count, 3),
+            'serialize_ms': round(sum(item['serialize_ms'] for item in items) / count, 3),
+            'queries': round(sum(item['queries'] for item in items) / count, 1),
+            'duplicate_queries': round(sum(item['duplicate_queries'] for item in items) / count, 1),
+            'response_bytes': round(sum(item['response_bytes'] or 0 for item in items) / count),
+        })
+    rows.sort(key=lambda row: row[sort], reverse=True)
+    return rows
@@ -0,0 +1,136 @@
+# Import the modules needed to maintain denormalized rating aggregates
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .cache import invalidate_model
+from .models import ChefProfile, MealKit, Review
+
+# Star values counted in the rating histogram
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+# Rows recomputed per query by the rebuild
+REBUILD_BATCH_SIZE = 500
+
+
+# Name of the histogram field counting reviews with `value` stars
+def histogram_field(value):
+    return f'rating_{value}_count'
+
+
+# Every aggregate field, in the order they are written
+AGGREGATE_FIELDS = ['rating', 'review_count', 'rating_sum'] + [histogram_field(value) for value in RATING_VALUES]
+
+
+# UPDATE expressions shifting a row's aggregates by a change in its reviews
+def aggregate_delta(count, total, histogram):
+    # `rating` comes first: MySQL evaluates SET clauses left to right with the new values
+    updates = {
+        'rating': Coalesce(
+            Cast(F('rating_sum') + total, FloatField()) / NullIf(F('review_count') + count, 0),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+        'review_count': F('review_count') + count,
+        'rating_sum': F('rating_sum') + total,
+    }
+    for value, change in histogram.items():
+        if change and value in RATING_VALUES:
+            updates[histogram_field(value)] = F(histogram_field(value)) + change
+    return updates
+
+
+# Apply the change from `previous` to `current`, each a (meal_kit_id, rating) pair or None
+def apply_review_change(previous, current):
+    changes = {}
+    for review, sign in ((previous, -1), (current, 1)):
+        if review is None:
+            continue
+        meal_kit_id, rating = review
+        count, total, histogram = changes.get(meal_kit_id, (0, 0, Counter()))
+        histogram[rating] += sign
+        changes[meal_kit_id] = (count + sign, total + sign * rating, histogram)
+    changes = {key: change for key, change in changes.items() if change[0] or change[1]}
+    if not changes:
+        return
+
+    # Row-level F() updates, so concurrent reviews never overwrite each other
+    chef_ids = dict(MealKit.objects.filter(pk__in=changes).values_list('pk', 'chef_id'))
+    chef_changes = {}
+    for meal_kit_id, (count, total, histogram) in changes.items():
+        MealKit.objects.filter(pk=meal_kit_id).update(**aggregate_delta(count, total, histogram))
+        if meal_kit_id in chef_ids:
+            chef_count, chef_total, chef_histogram = chef_changes.get(chef_ids[meal_kit_id], (0, 0, Counter()))
+            # update() keeps negative counts, unlike Counter addition
+            chef_histogram.update(histogram)
+            chef_changes[chef_ids[meal_kit_id]] = (chef_count + count, chef_total + total, chef_histogram)
+    for chef_id, (count, total, histogram) in chef_changes.items():
+        ChefProfile.objects.filter(pk=chef_id).update(**aggregate_delta(count, total, histogram))
+
+    invalidate_model(MealKit)
+    invalidate_model(ChefProfile)
+
+
+# Aggregate expressions over the review ratings in `rating`
+def review_aggregates(rating):
+    aggregates = {'review_count': Count(rating), 'rating_sum': Coalesce(Sum(rating), 0)}
+    for value in RATING_VALUES:
+        aggregates[histogram_field(value)] = Count(rating, filter=Q(**{rating: value}))
+    return aggregates
+
+
+# Aggregate expressions summing the stored aggregates of meal kits
+def meal_kit_aggregates():
+    return {name: Coalesce(Sum(name), 0) for name in AGGREGATE_FIELDS[1:]}
+
+
+# Recompute the aggregates of `ids` from one grouped query over `source`
+def rebuild_rows(model, ids, source, group_field, aggregates):
+    with transaction.atomic():
+        # Lock the rows before reading the source, so that concurrent deltas
+        # wait for the rebuild and are applied on top of it
+        instances = list(model._default_manager.select_for_update().filter(pk__in=ids).only('pk', *AGGREGATE_FIELDS))
+        grouped = source.filter(**{f'{group_field}__in': ids}).values(group_field).annotate(**aggregates)
+        rows = {row.pop(group_field): row for row in grouped}
+        for instance in instances:
+            row = rows.get(instance.pk, {})
+            for name in AGGREGATE_FIELDS[1:]:
+                setattr(instance, name, row.get(name, 0))
+            instance.rating = instance.rating_sum / instance.review_count if instance.review_count else 0.0
+        model._default_manager.bulk_update(instances, AGGREGATE_FIELDS)
+    return len(instances)
+
+
+# Walk a table in primary key order, yielding batches of ids
+def iter_id_batches(queryset, batch_size):
+    last = None
+    while True:
+        page = queryset.order_by('pk')
+        if last is not None:
+            page = page.filter(pk__gt=last)
+        ids = list(page.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+# Recompute the chefs' aggregates from their meal kits
+def rebuild_chef_aggregates(chef_ids):
+    return rebuild_rows(ChefProfile, chef_ids, MealKit.objects.all(), 'chef', meal_kit_aggregates())
+
+
+# Recompute every aggregate from the Review table, in batches
+def rebuild_rating_aggregates(batch_size=REBUILD_BATCH_SIZE):
+    meal_kits = chefs = 0
+    reviews = Review.objects.all()
+    for ids in iter_id_batches(MealKit.objects.all(), batch_size):
+        meal_kits += rebuild_rows(MealKit, ids, reviews, 'meal_kit', review_aggregates('rating'))
+    # Chefs are summed from the meal kit totals written above
+    for ids in iter_id_batches(ChefProfile.objects.all(), batch_size):
+        chefs += rebuild_chef_aggregates(ids)
+    invalidate_model(MealKit)
+    invalidate_model(ChefProfile)
+    return meal_kits, chefs
@@ -0,0 +1,192 @@
+# Import the modules needed for ranked meal kit search
+import math
+import re
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import MealKit
+
+# Fields searched for meal kits and the weight of a match in each of them
+MEAL_KIT_SEARCH_WEIGHTS = {
+    'meal_name': 3.0,
+    'chef__speciality': 2.0,
+    'ingredients': 1.5,
+    'description': 1.0,
+}
+
+# Name of the relevance annotation added to searched querysets
+SEARCH_RANK = 'search_rank'
+
+# The in-process index ranks at most this many matches per query
+MAX_INDEX_RESULTS = 5000
+
+# Words are runs of letters and digits
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# MySQL FULLTEXT expressions over the indexes created in migration 0010
+MYSQL_MEAL_KIT_MATCH = (
+    'MATCH (mealkit_mealkit.meal_name, mealkit_mealkit.description, mealkit_mealkit.ingredients) '
+    'AGAINST (%s IN BOOLEAN MODE)'
+)
+MYSQL_CHEF_MATCH = (
+    '(SELECT MATCH (mealkit_chefprofile.speciality) AGAINST (%s IN BOOLEAN MODE) '
+    'FROM mealkit_chefprofile WHERE mealkit_chefprofile.id = mealkit_mealkit.chef_id)'
+)
+
+# InnoDB's default full-text stopwords (INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD)
+MYSQL_FT_STOPWORDS = frozenset([
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i', 'in',
+    'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'who',
+    'will', 'with', 'und', 'www',
+])
+
+
+# Split text into lower-case search tokens
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+# In-process inverted index with prefix matching and tf-idf ranking
+class InvertedIndex:
+    def __init__(self, weights):
+        self.weights = weights
+        self.postings = {}
+        self.vocabulary = []
+        self.size = 0
+
+    def build(self, rows):
+        # rows are (id, {field: text}) pairs
+        postings = {}
+        size = 0
+        for doc_id, fields in rows:
+            size += 1
+            for field, text in fields.items():
+                weight = self.weights[field]
+                for token in tokenize(text):
+                    doc_scores = postings.setdefault(token, {})
+                    doc_scores[doc_id] = doc_scores.get(doc_id, 0.0) + weight
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+        self.size = size
+        return self
+
+    def expand(self, term):
+        # Every indexed token starting with `term`, so that search works while typing
+        start = bisect_left(self.vocabulary, term)
+        tokens = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, terms):
+        # Every term must match; the score is the sum of the best tf-idf per term
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for token in self.expand(term):
+                doc_scores = self.postings[token]
+                idf = math.log(1 + self.size / len(doc_scores))
+                for doc_id, weight in doc_scores.items():
+                    score = weight * idf
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: scores[doc_id] + score for doc_id, score in term_scores.items() if doc_id in scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+
+# Lazily built inverted index over all meal kits, rebuilt after catalog changes
+class MealKitIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+
+    def invalidate(self, **kwargs):
+        self.index = None
+
+    def get(self):
+        index = self.index
+        if index is None:
+            with self.lock:
+                if self.index is None:
+                    rows = MealKit.objects.values_list('id', *MEAL_KIT_SEARCH_WEIGHTS).iterator(chunk_size=2000)
+                    self.index = InvertedIndex(MEAL_KIT_SEARCH_WEIGHTS).build(
+                        (row[0], dict(zip(MEAL_KIT_SEARCH_WEIGHTS, row[1:]))) for row in rows
+                    )
+                index = self.index
+        return index
+
+    def search(self, terms):
+        return self.get().search(terms)
+
+
+# Shared fallback index used when the database has no full-text support
+meal_kit_index = MealKitIndex()
+
+
+# The terms a MySQL FULLTEXT index holds: words shorter than innodb_ft_min_token_size
+# (MYSQL_FT_MIN_TOKEN_SIZE) and stopwords are not indexed, so requiring one matches nothing
+def mysql_searchable_terms(terms):
+    min_size = getattr(settings, 'MYSQL_FT_MIN_TOKEN_SIZE', 3)
+    return [term for term in terms if len(term) >= min_size and term not in MYSQL_FT_STOPWORDS]
+
+
+# Search filter for meal kits: MySQL FULLTEXT, or the in-process index elsewhere
+class MealKitSearchFilter(SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        terms = [token for term in self.get_search_terms(request) for token in tokenize(term)]
+        mysql = connections[queryset.db].vendor == 'mysql'
+        if mysql:
+            terms = mysql_searchable_terms(terms)
+        if not terms:
+            return queryset
+
+        if mysql:
+            queryset = self.filter_mysql(queryset, terms)
+        else:
+            queryset = self.filter_index(queryset, terms)
+
+        # Rank by relevance unless the client asked for another ordering
+        if not queryset.query.order_by:
+            queryset = queryset.order_by(f'-{SEARCH_RANK}', '-pk')
+        return queryset
+
+    def filter_mysql(self, queryset, terms):
+        # Prefix-match every term in boolean mode and require each one somewhere
+        for position, term in enumerate(terms):
+            alias = f'_{SEARCH_RANK}_{position}'
+            queryset = queryset.alias(**{
+                alias: RawSQL(f'{MYSQL_MEAL_KIT_MATCH} + {MYSQL_CHEF_MATCH}', [f'{term}*', f'{term}*'])
+            }).filter(**{f'{alias}__gt': 0})
+        # MySQL can not weight columns inside one FULLTEXT index, so rank = both scores
+        query = ' '.join(f'{term}*' for term in terms)
+        return queryset.annotate(**{
+            SEARCH_RANK: RawSQL(f'{MYSQL_MEAL_KIT_MATCH} + {MYSQL_CHEF_MATCH}', [query, query], output_field=FloatField())
+        })
+
+    def filter_index(self, queryset, terms):
+        scores = meal_kit_index.search(terms)
+        if len(scores) > MAX_INDEX_RESULTS:
+            best = sorted(scores, key=scores.get, reverse=True)[:MAX_INDEX_RESULTS]
+            scores = {doc_id: scores[doc_id] for doc_id in best}
+        if not scores:
+            return queryset.none().annotate(**{SEARCH_RANK: Value(0.0, output_field=FloatField())})
+        return queryset.filter(pk__in=scores).annotate(**{
+            SEARCH_RANK: Case(
+                *(When(pk=doc_id, then=Value(score)) for doc_id, score in scores.items()),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        })
@@ -1,15 +1,17 @@
+from django.utils import timezone
 from rest_framework import serializers
-from django.contrib.auth.hashers import make_password
 from .models import *
+from .bulk import BulkListSerializer, BulkModelSerializer
+from .sparse import SparseFieldsMixin
 
 # Serializer for the Company model
-class CompanySerializer(serializers.ModelSerializer):
+class CompanySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Company
         fields = '__all__'
 
 # Serializer for registering a new Company
-class CompanyRegisterSerializer(serializers.ModelSerializer):
+class CompanyRegisterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -19,14 +21,14 @@ class CompanyRegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         company_name = validated_data.get('company_name')
         password = validated_data.pop('password')
-        hashed_password = make_password(password)
         email = validated_data.get('email')
-        user = User.objects.create_user(username=company_name, password=hashed_password, email=email, is_company=True)
+        # create_user hashes the password
+        user = User.objects.create_user(username=company_name, password=password, email=email, is_company=True)
         company = Company.objects.create(user=user, **validated_data)
         return company
 
 # Serializer for the SubscriptionPlan model
-class SubscriptionPlanSerializer(serializers.ModelSerializer):
+class SubscriptionPlanSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     company = CompanySerializer(read_only=True)
 
     class Meta:
@@ -34,13 +36,13 @@ class SubscriptionPlanSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the Customer model
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = '__all__'
 
 # Serializer for registering a new Customer
-class CustomerRegisterSerializer(serializers.ModelSerializer):
+class CustomerRegisterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(write_only=True)
     password = serializers.CharField(write_only=True)
     email = serializers.EmailField(write_only=True)
@@ -58,8 +60,8 @@ class CustomerRegisterSerializer(serializers.ModelSerializer):
         return customer
     
 # Serializer for the Subscription model
-class SubscriptionSerializer(serializers.ModelSerializer):
-    customer = CustomerSerializer(read_only=True)
+class SubscriptionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    customer = CustomerSerializer(source='customer_name', read_only=True)
     plan = SubscriptionPlanSerializer(read_only=True)
 
     class Meta:
@@ -67,13 +69,13 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the ChefProfile model
-class ChefProfileSerializer(serializers.ModelSerializer):
+class ChefProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ChefProfile
         fields = '__all__'
 
 # Serializer for registering a new ChefProfile
-class ChefProfileRegisterSerializer(serializers.ModelSerializer):
+class ChefProfileRegisterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -83,13 +85,13 @@ class ChefProfileRegisterSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         chef_name = validated_data.get('chef_name')
         password = validated_data.pop('password')
-        hashed_password = make_password(password)
-        user = User.objects.create_user(username=chef_name, password=hashed_password, is_chef=True)
+        # create_user hashes the password
+        user = User.objects.create_user(username=chef_name, password=password, is_chef=True)
         chef = ChefProfile.objects.create(user=user, **validated_data)
         return chef
 
 # Serializer for the MealKit model
-class MealKitSerializer(serializers.ModelSerializer):
+class MealKitSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     chef = ChefProfileSerializer(read_only=True)
 
     class Meta:
@@ -97,7 +99,7 @@ class MealKitSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the ChefKartService model
-class ChefKartServiceSerializer(serializers.ModelSerializer):
+class ChefKartServiceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     chef = ChefProfileSerializer(read_only=True)
 
     class Meta:
@@ -105,7 +107,7 @@ class ChefKartServiceSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the ChefServiceBooking model
-class ChefServiceBookingSerializer(serializers.ModelSerializer):
+class ChefServiceBookingSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     service = ChefKartServiceSerializer(read_only=True)
 
@@ -114,7 +116,7 @@ class ChefServiceBookingSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the Order model
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     meal_kit = MealKitSerializer(read_only=True)
 
@@ -123,15 +125,13 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the GiftCard model
-class GiftCardSerializer(serializers.ModelSerializer):
-    customer = CustomerSerializer(read_only=True)
-
+class GiftCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = GiftCard
         fields = '__all__'
 
 # Serializer for the CartItem model
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     gift_card = GiftCardSerializer(read_only=True)
 
@@ -140,7 +140,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the Review model
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer(read_only=True)
     meal_kit = MealKitSerializer(read_only=True)
 
@@ -149,7 +149,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the Payment model
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     order = OrderSerializer(read_only=True)
 
     class Meta:
@@ -157,9 +157,92 @@ class PaymentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Serializer for the Delivery model
-class DeliverySerializer(serializers.ModelSerializer):
+class DeliverySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     order = OrderSerializer(read_only=True)
     
     class Meta:
         model = Delivery
         fields = '__all__'
+
+# Serializer for the chef summary in catalog feed rows
+class CatalogChefSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChefProfile
+        fields = ['id', 'chef_name', 'speciality', 'cooking_experience', 'rating', 'review_count']
+
+# Serializer for one denormalized catalog feed row (see mealkit/catalog.py)
+class CatalogFeedRowSerializer(serializers.ModelSerializer):
+    chef = CatalogChefSerializer(read_only=True)
+    rating_summary = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MealKit
+        fields = [
+            'id', 'meal_name', 'description', 'price', 'preparation_time', 'servings', 'ingredients',
+            'is_available', 'chef', 'rating_summary',
+        ]
+
+    def get_rating_summary(self, meal_kit):
+        return {
+            'average': meal_kit.rating,
+            'count': meal_kit.review_count,
+            'histogram': {str(star): getattr(meal_kit, f'rating_{star}_count') for star in range(1, 6)},
+        }
+
+# Serializer for the checkout request; the cart itself is read from the database
+class CheckoutSerializer(serializers.Serializer):
+    payment_method = serializers.CharField(max_length=50)
+    # Defaults to the customer's address
+    delivery_address = serializers.CharField(required=False)
+    # Defaults to checkout.DEFAULT_DELIVERY_DAYS from now
+    delivery_date = serializers.DateTimeField(required=False)
+
+# Serializer for booking a chef service from a date and time
+class ChefBookingSerializer(serializers.Serializer):
+    service = serializers.PrimaryKeyRelatedField(queryset=ChefKartService.objects.filter(available=True))
+    service_date = serializers.DateTimeField()
+    event_type = serializers.CharField(max_length=255)
+
+    def validate_service_date(self, value):
+        if value <= timezone.now():
+            raise serializers.ValidationError('Book a time in the future.')
+        return value
+
+# Serializer for a dispatch planning request
+class DispatchPlanSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    # Plan only these zones; all of them by default
+    zones = serializers.ListField(child=serializers.CharField(allow_blank=True), required=False)
+    max_stops = serializers.IntegerField(min_value=1, max_value=500, required=False)
+
+# Serializer for setting the status of every delivery on a route
+class RouteStatusSerializer(serializers.Serializer):
+    delivery_status = serializers.ChoiceField(choices=Delivery._meta.get_field('delivery_status').choices)
+
+# Serializer for bulk writes of the MealKit model
+class MealKitBulkSerializer(BulkModelSerializer):
+    class Meta:
+        model = MealKit
+        fields = '__all__'
+        list_serializer_class = BulkListSerializer
+
+# Serializer for bulk writes of the CartItem model
+class CartItemBulkSerializer(BulkModelSerializer):
+    class Meta:
+        model = CartItem
+        fields = '__all__'
+        list_serializer_class = BulkListSerializer
+
+# Serializer for bulk writes of the Order model
+class OrderBulkSerializer(BulkModelSerializer):
+    class Meta:
+        model = Order
+        fields = '__all__'
+        list_serializer_class = BulkListSerializer
+
+# Serializer for bulk writes of the Delivery model
+class DeliveryBulkSerializer(BulkModelSerializer):
+    class Meta:
+        model = Delivery
+        fields = '__all__'
+        list_serializer_class = BulkListSerializer
@@ -0,0 +1,176 @@
+# Import the signals and models needed to keep derived catalog data in sync
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .analytics import mark_sales_dirty
+from .cache import invalidate_model
+from .catalog import mark_catalog_dirty
+from .jobs import enqueue, enqueue_many
+from .metrics import ORDERS_CREATED, PAYMENTS_CREATED
+from .models import ChefProfile, ChefServiceBooking, Company, MealKit, Order, Payment, Review, Subscription, SubscriptionPlan
+from .ratings import apply_review_change, rebuild_chef_aggregates
+from .search import meal_kit_index
+from .tokens import revocations
+
+# Job queued for each new instance of a model, and the argument carrying its id
+FOLLOW_UP_JOBS = {Order: 'order_placed', ChefServiceBooking: 'booking_created', Review: 'review_posted'}
+FOLLOW_UP_ARGUMENTS = {Order: 'order_id', ChefServiceBooking: 'booking_id', Review: 'review_id'}
+
+# Job rebuilding the catalog feed after catalog changes
+CATALOG_JOB = 'catalog_changed'
+
+# Sent after bulk_create/bulk_update, which skip post_save; provides `instances` and `created`
+post_bulk_save = Signal()
+
+
+# Rebuild the in-process search index after meal kits or chefs change
+@receiver([post_save, post_delete, post_bulk_save], sender=MealKit)
+@receiver([post_save, post_delete, post_bulk_save], sender=ChefProfile)
+def invalidate_meal_kit_search_index(sender, **kwargs):
+    # Invalidate again on commit in case another request rebuilt it in between
+    meal_kit_index.invalidate()
+    transaction.on_commit(meal_kit_index.invalidate)
+
+
+# Drop cached catalog responses after a catalog model changes
+@receiver([post_save, post_delete, post_bulk_save], sender=MealKit)
+@receiver([post_save, post_delete, post_bulk_save], sender=Company)
+@receiver([post_save, post_delete, post_bulk_save], sender=ChefProfile)
+@receiver([post_save, post_delete, post_bulk_save], sender=SubscriptionPlan)
+def invalidate_cached_responses(sender, **kwargs):
+    invalidate_model(sender)
+
+
+# Queue the catalog feed rows of changed meal kits, chefs and ratings, and the
+# feed's plans after plan or company changes, for the next snapshot
+@receiver([post_save, post_delete, post_bulk_save], sender=MealKit)
+@receiver([post_save, post_delete, post_bulk_save], sender=ChefProfile)
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete, post_bulk_save], sender=SubscriptionPlan)
+@receiver([post_save, post_delete, post_bulk_save], sender=Company)
+def mark_catalog_feed_dirty(sender, instance=None, instances=(), raw=False, **kwargs):
+    if raw:
+        return
+    changed = [instance] if instance is not None else list(instances)
+    if sender is MealKit:
+        marked = mark_catalog_dirty(meal_kit_ids=[meal_kit.pk for meal_kit in changed])
+    elif sender is ChefProfile:
+        marked = mark_catalog_dirty(chef_ids=[chef.pk for chef in changed])
+    elif sender is Review:
+        # A review moved to another meal kit changes both rating summaries, and
+        # the chef ratings shown on every row of their chefs
+        stored = getattr(instance, '_stored_rating', None)
+        meal_kit_ids = [instance.meal_kit_id, stored[0] if stored else None]
+        chef_ids = MealKit.objects.filter(pk__in=[pk for pk in meal_kit_ids if pk is not None]).values_list('chef_id', flat=True)
+        marked = mark_catalog_dirty(meal_kit_ids=meal_kit_ids, chef_ids=list(chef_ids))
+    else:
+        marked = mark_catalog_dirty(plans=bool(changed))
+    if marked:
+        enqueue(CATALOG_JOB)
+
+
+# Remember the stored meal kit and rating of a review before it is updated
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    instance._stored_rating = None
+    if not raw and not instance._state.adding and instance.pk is not None:
+        # Lock the review so that concurrent edits apply their deltas one at a time
+        instance._stored_rating = (
+            sender.objects.select_for_update().filter(pk=instance.pk).values_list('meal_kit_id', 'rating').first()
+        )
+
+
+# Shift the meal kit and chef aggregates by the saved review
+@receiver(post_save, sender=Review)
+def update_ratings_on_review_save(sender, instance, raw=False, **kwargs):
+    # Fixtures are loaded raw; run rebuild_rating_aggregates afterwards
+    if raw:
+        return
+    apply_review_change(getattr(instance, '_stored_rating', None), (instance.meal_kit_id, instance.rating))
+    instance._stored_rating = (instance.meal_kit_id, instance.rating)
+
+
+# Remove a deleted review from the aggregates
+@receiver(post_delete, sender=Review)
+def update_ratings_on_review_delete(sender, instance, **kwargs):
+    apply_review_change((instance.meal_kit_id, instance.rating), None)
+
+
+# Move the ratings of meal kits that changed chef
+@receiver([post_save, post_bulk_save], sender=MealKit)
+def move_ratings_on_chef_change(sender, instance=None, instances=(), raw=False, **kwargs):
+    if raw:
+        return
+    chef_ids = set()
+    for meal_kit in ([instance] if instance is not None else instances):
+        loaded_chef_id = getattr(meal_kit, '_loaded_chef_id', None)
+        if loaded_chef_id is not None and loaded_chef_id != meal_kit.chef_id:
+            chef_ids.update((loaded_chef_id, meal_kit.chef_id))
+        meal_kit._loaded_chef_id = meal_kit.chef_id
+    if chef_ids:
+        rebuild_chef_aggregates(chef_ids)
+        # The rebuild's bulk_update sends no signal; the feed rows of both chefs
+        # show the moved ratings
+        if mark_catalog_dirty(chef_ids=chef_ids):
+            enqueue(CATALOG_JOB)
+
+
+# Remember revoked refresh tokens so that refreshes can skip the blacklist query
+@receiver(post_save, sender=BlacklistedToken)
+def remember_revoked_token(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        revocations.add(instance.token.jti, instance.token.expires_at.timestamp())
+
+
+# Queue the days of changed sales for the next rollup refresh
+@receiver([post_save, post_delete], sender=Order)
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=ChefServiceBooking)
+@receiver([post_save, post_delete], sender=Subscription)
+def mark_sales_day_dirty(sender, instance, **kwargs):
+    mark_sales_dirty(sender, [instance])
+
+
+# Same for bulk writes
+@receiver(post_bulk_save, sender=Order)
+@receiver(post_bulk_save, sender=Payment)
+def mark_bulk_sales_days_dirty(sender, instances, **kwargs):
+    mark_sales_dirty(sender, instances)
+
+
+# Queue the follow-up work of new orders, bookings and reviews (see mealkit/tasks.py)
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=ChefServiceBooking)
+@receiver(post_save, sender=Review)
+def enqueue_follow_up_job(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        enqueue(FOLLOW_UP_JOBS[sender], **{FOLLOW_UP_ARGUMENTS[sender]: instance.pk})
+
+
+# Same for orders written in bulk, e.g. by checkout
+@receiver(post_bulk_save, sender=Order)
+def enqueue_bulk_follow_up_jobs(sender, instances, created=False, **kwargs):
+    if created:
+        enqueue_many(FOLLOW_UP_JOBS[sender], [{FOLLOW_UP_ARGUMENTS[sender]: instance.pk} for instance in instances])
+
+
+# Count created orders and payments for /metrics once their transaction commits
+CREATION_COUNTERS = {Order: ORDERS_CREATED, Payment: PAYMENTS_CREATED}
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_save, sender=Payment)
+def count_created(sender, created=False, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(CREATION_COUNTERS[sender].inc)
+
+
+@receiver(post_bulk_save, sender=Order)
+@receiver(post_bulk_save, sender=Payment)
+def count_bulk_created(sender, instances, created=False, **kwargs):
+    if created and instances:
+        transaction.on_commit(partial(CREATION_COUNTERS[sender].inc, amount=len(instances)))
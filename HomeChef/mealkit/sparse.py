@@ -0,0 +1,102 @@
+# Import the modules needed to let clients choose which fields a response renders
+from collections import namedtuple
+
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+# Query parameters selecting the rendered fields
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+EXPAND_PARAM = 'expand'
+
+# The field paths requested by a client, each a sorted tuple of dotted paths
+# split into tuples; `fields` and `expand` are None when not given
+FieldSelection = namedtuple('FieldSelection', ['fields', 'omit', 'expand'])
+
+
+# Split a comma separated list of dotted paths ('id,meal_kit.chef') into tuples
+def parse_field_paths(value):
+    paths = set()
+    for item in value.split(','):
+        path = tuple(part for part in item.strip().split('.') if part)
+        if path:
+            paths.add(path)
+    return tuple(sorted(paths))
+
+
+# Read the field selection of a request; writes always render every field
+def get_field_selection(request):
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    params = request.query_params
+    if not any(name in params for name in (FIELDS_PARAM, OMIT_PARAM, EXPAND_PARAM)):
+        return None
+    return FieldSelection(
+        fields=parse_field_paths(params[FIELDS_PARAM]) if FIELDS_PARAM in params else None,
+        omit=parse_field_paths(params.get(OMIT_PARAM, '')),
+        expand=parse_field_paths(params[EXPAND_PARAM]) if EXPAND_PARAM in params else None,
+    )
+
+
+# Names of the fields directly below `prefix` among `paths`
+def _children(paths, prefix):
+    depth = len(prefix)
+    return {path[depth] for path in paths if len(path) > depth and path[:depth] == prefix}
+
+
+# Render a nested serializer field as the related object's primary key instead
+def _flatten(name, field):
+    kwargs = {'read_only': True}
+    if field.source not in (None, name):
+        kwargs['source'] = field.source
+    if isinstance(field, serializers.ListSerializer):
+        kwargs['many'] = True
+    return serializers.PrimaryKeyRelatedField(**kwargs)
+
+
+# Serializer mixin applying ?fields=, ?omit= and ?expand= to every nesting level:
+#   ?fields=id,meal_kit.meal_name  only render these fields
+#   ?omit=customer.address         render everything except these fields
+#   ?expand=meal_kit.chef          nest only these relations, others become ids
+# Without ?expand= nested relations are rendered as before.
+class SparseFieldsMixin:
+    def get_field_selection(self):
+        # Views pass a precomputed selection; otherwise read it from the request
+        if 'field_selection' in self.context:
+            return self.context['field_selection']
+        return get_field_selection(self.context.get('request'))
+
+    def get_field_path(self):
+        # The names of the fields leading from the root serializer to this one
+        path = []
+        node = self
+        while node.parent is not None:
+            if node.field_name:
+                path.insert(0, node.field_name)
+            node = node.parent
+        return tuple(path)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_field_selection()
+        if selection is None:
+            return fields
+
+        prefix = self.get_field_path()
+        if selection.fields is not None:
+            # Restrict this level unless only the level itself was asked for
+            keep = _children(selection.fields, prefix)
+            if keep:
+                fields = {name: field for name, field in fields.items() if name in keep}
+        omit = {path[-1] for path in selection.omit if path[:-1] == prefix}
+        fields = {name: field for name, field in fields.items() if name not in omit}
+
+        if selection.expand is not None:
+            # Fields picked below a relation also expand it
+            expand = _children(selection.expand, prefix)
+            if selection.fields is not None:
+                expand |= {path[len(prefix)] for path in selection.fields if len(path) > len(prefix) + 1 and path[:len(prefix)] == prefix}
+            for name, field in fields.items():
+                if isinstance(field, serializers.BaseSerializer) and name not in expand:
+                    fields[name] = _flatten(name, field)
+        return fields
@@ -0,0 +1,116 @@
+# Import the modules needed to renew and expire subscriptions in batches
+import math
+from collections import namedtuple
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .checkout import bulk_create_returning_ids
+from .models import Delivery, Order, Subscription
+from .signals import post_bulk_save
+
+# Subscriptions locked and processed per transaction
+RENEWAL_BATCH_SIZE = 200
+
+# Length of a period for plans without a duration
+DEFAULT_PERIOD = timedelta(weeks=1)
+
+# What one run did
+RenewalResult = namedtuple('RenewalResult', ['renewed', 'expired', 'orders'])
+
+
+# Number of weekly orders in a period
+def period_weeks(period):
+    return max(1, math.ceil(period / timedelta(weeks=1)))
+
+
+# Split a plan's price over the weeks of a period; the last week takes the rounding
+def weekly_amounts(price, weeks):
+    share = (price / weeks).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    return [share] * (weeks - 1) + [price - share * (weeks - 1)]
+
+
+# Renew or expire one batch of the due subscriptions; returns the batch's result,
+# or None once nothing is due. Rows locked by other runs are skipped, so several
+# nodes can process the same backlog in parallel without waiting on each other
+def process_subscription_batch(now=None, batch_size=RENEWAL_BATCH_SIZE):
+    now = now or timezone.now()
+    lock = {}
+    if connection.features.has_select_for_update_skip_locked:
+        lock['skip_locked'] = True
+    if connection.features.has_select_for_update_of:
+        # Leave the plans, customers and meal kits unlocked
+        lock['of'] = ('self',)
+
+    with transaction.atomic():
+        batch = list(
+            Subscription.objects.select_for_update(**lock)
+            .filter(is_active=True, end_date__lte=now)
+            .select_related('plan', 'customer_name', 'meal_kit')
+            .order_by('end_date', 'pk')[:batch_size]
+        )
+        if not batch:
+            return None
+
+        renewed, expired, orders, deliveries = [], [], [], []
+        for subscription in batch:
+            plan = subscription.plan
+            if not subscription.auto_renew or not plan.is_active:
+                expired.append(subscription.pk)
+                continue
+            period = plan.duration or DEFAULT_PERIOD
+            # A subscription that lapsed more than a period ago restarts now
+            start = subscription.end_date if subscription.end_date + period > now else now
+            subscription.end_date = start + period
+            renewed.append(subscription)
+
+            meal_kit = subscription.meal_kit
+            if meal_kit is None or not meal_kit.is_available:
+                continue
+            weeks = period_weeks(period)
+            for week, amount in enumerate(weekly_amounts(plan.price, weeks)):
+                order = Order(
+                    customer=subscription.customer_name,
+                    meal_kit=meal_kit,
+                    quantity=plan.meals_per_week,
+                    total_amount=amount,
+                    status=Order.PENDING,
+                    payment_status=Order.PAYMENT_PENDING,
+                )
+                orders.append(order)
+                deliveries.append(Delivery(
+                    order=order,
+                    delivery_date=start + timedelta(weeks=week),
+                    delivery_address=subscription.customer_name.address or '',
+                ))
+
+        if expired:
+            Subscription.objects.filter(pk__in=expired).update(is_active=False)
+        if renewed:
+            Subscription.objects.bulk_update(renewed, ['end_date'], batch_size=batch_size)
+        if orders:
+            bulk_create_returning_ids(Order, orders, customer__in={order.customer_id for order in orders})
+            # bulk_create copies the new order ids onto the deliveries
+            Delivery.objects.bulk_create(deliveries)
+            # Analytics and the order follow-up jobs
+            post_bulk_save.send(sender=Order, instances=orders, created=True)
+            post_bulk_save.send(sender=Delivery, instances=deliveries, created=True)
+        post_bulk_save.send(sender=Subscription, instances=batch, created=False)
+
+    return RenewalResult(len(renewed), len(expired), len(orders))
+
+
+# Process due subscriptions batch by batch until none are left or `max_batches` ran
+def process_due_subscriptions(now=None, batch_size=RENEWAL_BATCH_SIZE, max_batches=None):
+    now = now or timezone.now()
+    totals = RenewalResult(0, 0, 0)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        result = process_subscription_batch(now, batch_size)
+        if result is None:
+            break
+        totals = RenewalResult(*(total + count for total, count in zip(totals, result)))
+        batches += 1
+    return totals
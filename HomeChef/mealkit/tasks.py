@@ -0,0 +1,85 @@
+# Import the modules needed to run the follow-up work of orders, bookings and reviews
+from datetime import timedelta
+
+from django.core.mail import send_mail
+
+from .catalog import FIRST_BUILD_JOB, refresh_catalog_feed
+from .checkout import DEFAULT_DELIVERY_DAYS
+from .jobs import register
+from .models import ChefServiceBooking, Delivery, Order, Review
+
+# Names of the jobs queued by the model signals
+ORDER_PLACED = 'order_placed'
+BOOKING_CREATED = 'booking_created'
+REVIEW_POSTED = 'review_posted'
+CATALOG_CHANGED = 'catalog_changed'
+CATALOG_FIRST_BUILD = FIRST_BUILD_JOB
+
+
+# Email a user; users without an address are skipped. Failures raise, so the job is retried
+def notify(user, subject, message):
+    if user is None or not user.email:
+        return 0
+    return send_mail(subject, message, None, [user.email])
+
+
+# Give a new order its delivery record and tell the customer. The email goes last,
+# after the idempotent writes, so that a retry does not send it twice. The payment
+# is recorded when the customer pays, and the sales rollup is left to the
+# `refresh_sales_rollup` command, which rebuilds each changed day once
+@register(ORDER_PLACED)
+def order_placed(order_id):
+    order = Order.objects.select_related('customer__user', 'meal_kit').filter(pk=order_id).first()
+    if order is None:
+        # Deleted before the job ran
+        return
+    # Checkout creates the delivery itself
+    Delivery.objects.get_or_create(order=order, defaults={
+        'delivery_date': order.order_date + timedelta(days=DEFAULT_DELIVERY_DAYS),
+        'delivery_address': order.customer.address or '',
+    })
+    notify(
+        order.customer.user,
+        f'Order {order.pk} received',
+        f'We received your order for {order.quantity or 1} x {order.meal_kit.meal_name}.',
+    )
+
+
+# Confirm a new booking to the customer
+@register(BOOKING_CREATED)
+def booking_created(booking_id):
+    booking = ChefServiceBooking.objects.select_related('customer__user', 'service').filter(pk=booking_id).first()
+    if booking is None:
+        return
+    notify(
+        booking.customer.user,
+        f'Booking {booking.pk} received',
+        f'We received your {booking.service.get_service_type_display()} booking for {booking.service_date:%Y-%m-%d %H:%M}.',
+    )
+
+
+# Tell the chef about a new review of one of their meal kits
+@register(REVIEW_POSTED)
+def review_posted(review_id):
+    review = Review.objects.select_related('meal_kit__chef__user').filter(pk=review_id).first()
+    if review is None:
+        return
+    notify(
+        review.meal_kit.chef.user,
+        f'New review of {review.meal_kit.meal_name}',
+        f'{review.meal_kit.meal_name} was rated {review.rating}/5.\n\n{review.comment}',
+    )
+
+
+# Rebuild the catalog feed rows marked dirty and publish a new snapshot; jobs
+# queued by the same burst of changes find nothing left to do
+@register(CATALOG_CHANGED)
+def catalog_changed():
+    refresh_catalog_feed()
+
+
+# Build the catalog feed the first time it is requested (see catalog.get_catalog_snapshot);
+# a no-op when another job published a snapshot meanwhile
+@register(CATALOG_FIRST_BUILD)
+def catalog_first_build():
+    refresh_catalog_feed()
@@ -1,3 +1,1620 @@
-from django.test import TestCase
+import gzip
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .benchmarks import PAGE_SIZES, benchmark_endpoint, discover_routes, find_query_regressions, seed_dataset
+from .analytics import day_start, refresh_sales_rollup
+from .auth import outstanding_tokens
+from .bookings import IntervalTree
+from . import catalog
+from .cache import get_response_cache
+from .checkout import checkout_cart
+from .dispatch import nearest_neighbour_order, path_length, two_opt
+from .db.pool import ConnectionPool, PoolTimeout, close_pools, get_pool
+from .exports import EXPORTS, iter_export_rows
+from .facets import MEAL_KIT_FACETS, count_facets
+from .fastpath import get_row_plan
+from .indexes import build_index_report, read_plan
+from .metrics import Counter, Histogram, Registry
+from .jobs import LOCK_TIMEOUT, RETRY_BASE_DELAY, claim_jobs, enqueue, register, release_stale_jobs, run_pending_jobs
+from .models import *
+from .profiling import PROFILE_LOGGER, RequestProfile, rank_endpoints, read_profiles
+from .ratings import AGGREGATE_FIELDS
+from .search import MealKitSearchFilter, meal_kit_index, mysql_searchable_terms
+from .signals import post_bulk_save
+from .serializers import OrderSerializer
+from .subscriptions import process_due_subscriptions, weekly_amounts
+from .tokens import RevocationCheckedRefreshToken, prune_expired_tokens, revocations
+
+# Maximum number of queries a detail endpoint may run
+MAX_DETAIL_QUERIES = 2
+
+
+# Base class for API tests: authenticated client and fresh in-process state
+class APITestCase(TestCase):
+    def setUp(self):
+        # Test transactions roll back without signals, so drop caches and indexes
+        get_response_cache().clear()
+        meal_kit_index.invalidate()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+# Guard every /api/ list and detail endpoint against N+1 query regressions
+class EndpointQueryCountTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Seed thousands of rows so that missing eager loading shows up as extra queries
+        seed_dataset()
+        cls.user = User.objects.create_user(username='benchmark', password='benchmark', is_customer=True)
+
+    def test_every_route_is_covered(self):
+        names = {route.name for route in discover_routes()}
+        for name in ['order-list', 'payment-list', 'delivery-list', 'review-list', 'cart-item-list',
+                     'subscription-list', 'meal-kit-list', 'payment-detail', 'order-detail']:
+            self.assertIn(name, names)
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        results = []
+        for route in discover_routes():
+            if not route.is_list:
+                continue
+            for page_size in PAGE_SIZES:
+                result = benchmark_endpoint(self.client, route, page_size, repeat=1)
+                self.assertEqual(result.status, 200, route.url)
+                results.append(result)
+        self.assertEqual(find_query_regressions(results), [])
+
+    def test_list_pages_grow_with_page_size(self):
+        # Make sure the benchmark really serializes more rows on larger pages
+        route = next(route for route in discover_routes() if route.name == 'payment-list')
+        small = benchmark_endpoint(self.client, route, PAGE_SIZES[0], repeat=1)
+        large = benchmark_endpoint(self.client, route, PAGE_SIZES[-1], repeat=1)
+        self.assertGreater(large.bytes, small.bytes)
+        self.assertEqual(small.queries, large.queries)
+
+    def test_detail_query_count_is_constant(self):
+        for route in discover_routes():
+            if route.is_list:
+                continue
+            result = benchmark_endpoint(self.client, route, repeat=1)
+            self.assertEqual(result.status, 200, route.url)
+            self.assertLessEqual(result.queries, MAX_DETAIL_QUERIES, route.url)
+
+
+# Cursor (keyset) pagination and count modes of CustomPagination
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=20, chefs=5, meal_kits=10, orders=37, reviews=5, cart_items=5, subscriptions=5)
+        cls.user = User.objects.create_user(username='pager', password='pager', is_customer=True)
+        # Leave some NULLs in a nullable ordering field
+        Order.objects.filter(pk__in=Order.objects.order_by('pk').values('pk')[:4]).update(total_amount=None)
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, params)
+        # Bound the walk so that a broken cursor fails instead of looping forever
+        for _ in range(100):
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+        self.fail(f'Cursor pagination of {url} did not terminate')
+
+    def test_cursor_walk_matches_ordering_filter(self):
+        for ordering in ['status', '-total_amount', 'order_date', '-id']:
+            with self.subTest(ordering=ordering):
+                ids, _ = self.walk('/api/orders/', {'pagination': 'cursor', 'ordering': ordering, 'page_size': 10})
+                self.assertEqual(len(ids), Order.objects.count())
+                self.assertEqual(len(set(ids)), len(ids))
+                field = ordering.lstrip('-')
+                expected = sorted(
+                    Order.objects.values_list(field, 'id'),
+                    key=lambda row: ((row[0] is not None, row[0]), row[1]),
+                    reverse=ordering.startswith('-'),
+                )
+                self.assertEqual(ids, [pk for _, pk in expected])
+
+    def test_view_keyset_ordering_is_default(self):
+        ids, _ = self.walk('/api/payments/', {'pagination': 'cursor', 'page_size': 10})
+        self.assertEqual(ids, list(Payment.objects.order_by('-payment_date', '-id').values_list('id', flat=True)))
+
+    def test_previous_link_returns_previous_page(self):
+        first = self.client.get('/api/orders/', {'pagination': 'cursor', 'page_size': 5})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(first.data['previous'])
+
+    def test_cursor_page_skips_count_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/orders/', {'pagination': 'cursor', 'page_size': 10})
+        self.assertNotIn('count', response.data)
+        response = self.client.get('/api/orders/', {'pagination': 'cursor', 'count': 'exact'})
+        self.assertEqual(response.data['count'], Order.objects.count())
+        self.assertFalse(response.data['count_approximate'])
+
+    def test_page_mode_approximate_count(self):
+        response = self.client.get('/api/orders/', {'count': 'approximate'})
+        self.assertEqual(response.data['count'], Order.objects.count())
+        self.assertTrue(response.data['count_approximate'])
+        response = self.client.get('/api/orders/')
+        self.assertNotIn('count_approximate', response.data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/orders/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+# ?fields=, ?omit= and ?expand= on serializers and the queries they run
+class SparseFieldsetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=5, chefs=3, meal_kits=5, orders=12, reviews=5, cart_items=5, subscriptions=5)
+        cls.user = User.objects.create_user(username='sparse', password='sparse', is_customer=True)
+
+    def get_orders(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/orders/', dict(params, ordering='id'))
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], [query['sql'] for query in queries.captured_queries]
+
+    def test_default_payload_is_unchanged(self):
+        rows, _ = self.get_orders({})
+        self.assertEqual(rows[0]['meal_kit']['chef']['id'], Order.objects.order_by('id')[0].meal_kit.chef_id)
+
+    def test_empty_expand_renders_ids_without_joins(self):
+        rows, queries = self.get_orders({'expand': ''})
+        order = Order.objects.order_by('id')[0]
+        self.assertEqual(rows[0]['customer'], order.customer_id)
+        self.assertEqual(rows[0]['meal_kit'], order.meal_kit_id)
+        self.assertNotIn('JOIN', queries[-1])
+
+    def test_expand_joins_only_the_expanded_relations(self):
+        rows, queries = self.get_orders({'expand': 'meal_kit'})
+        self.assertEqual(rows[0]['meal_kit']['chef'], Order.objects.order_by('id')[0].meal_kit.chef_id)
+        self.assertIsInstance(rows[0]['customer'], int)
+        self.assertIn(MealKit._meta.db_table, queries[-1])
+        self.assertNotIn(ChefProfile._meta.db_table, queries[-1])
+        self.assertNotIn(Customer._meta.db_table, queries[-1])
+
+    def test_fields_and_omit_select_nested_fields(self):
+        rows, queries = self.get_orders({'fields': 'id,status,meal_kit.meal_name', 'expand': ''})
+        self.assertEqual(set(rows[0]), {'id', 'status', 'meal_kit'})
+        self.assertEqual(set(rows[0]['meal_kit']), {'meal_name'})
+        self.assertNotIn('total_amount', queries[-1])
+
+        rows, _ = self.get_orders({'omit': 'customer,meal_kit.chef.speciality'})
+        self.assertNotIn('customer', rows[0])
+        self.assertNotIn('speciality', rows[0]['meal_kit']['chef'])
+        self.assertIn('chef_name', rows[0]['meal_kit']['chef'])
+
+    def test_cursor_pages_load_their_ordering_column(self):
+        params = {'pagination': 'cursor', 'fields': 'id', 'page_size': 5}
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/payments/', params)
+        self.assertEqual(set(response.data['results'][0]), {'id'})
+        self.assertIsNotNone(response.data['next'])
+
+    def test_writes_render_every_field(self):
+        meal_kit = MealKit.objects.first()
+        response = self.client.patch(f'/api/meal-kits/{meal_kit.pk}/?fields=id', {'price': '9.99'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('chef', response.data)
+
+
+# Ranked meal kit search over the in-process index used on SQLite
+class MealKitSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='searcher', password='searcher', is_customer=True)
+        indian = ChefProfile.objects.create(chef_name='Asha', cooking_experience=10, speciality='Indian curries')
+        italian = ChefProfile.objects.create(chef_name='Marco', cooking_experience=8, speciality='Italian pasta')
+        cls.tikka = MealKit.objects.create(chef=indian, meal_name='Paneer Tikka', price=12, ingredients='paneer, yoghurt, spices')
+        cls.curry = MealKit.objects.create(chef=indian, meal_name='Vegetable Korma', price=10, ingredients='paneer, cashew, cream')
+        cls.pasta = MealKit.objects.create(chef=italian, meal_name='Pesto Pasta', price=11, ingredients='basil, pine nuts, parmesan')
+
+    def search(self, term, **params):
+        response = self.client.get('/api/meal-kits/', {'search': term, 'page_size': 10, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_name_match_ranks_above_ingredient_match(self):
+        self.assertEqual(self.search('paneer'), [self.tikka.id, self.curry.id])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.search('paneer cashew'), [self.curry.id])
+        self.assertEqual(self.search('paneer basil'), [])
+
+    def test_prefix_and_chef_speciality(self):
+        self.assertEqual(self.search('ital'), [self.pasta.id])
+        self.assertEqual(set(self.search('curr')), {self.tikka.id, self.curry.id})
+
+    def test_explicit_ordering_wins(self):
+        self.assertEqual(self.search('paneer', ordering='price'), [self.curry.id, self.tikka.id])
+
+    def test_mysql_skips_terms_the_fulltext_index_does_not_hold(self):
+        self.assertEqual(mysql_searchable_terms(['the', 'paneer', 'of', 'xo', 'dal']), ['paneer', 'dal'])
+        with override_settings(MYSQL_FT_MIN_TOKEN_SIZE=2):
+            self.assertEqual(mysql_searchable_terms(['xo', 'a']), ['xo'])
+
+        # The MATCH conditions are built from the remaining terms, or left out
+        search = lambda self, queryset, terms: self.filter_index(queryset, terms)
+        with mock.patch.object(connection, 'vendor', 'mysql'), \
+                mock.patch.object(MealKitSearchFilter, 'filter_mysql', autospec=True, side_effect=search) as filter_mysql:
+            self.assertEqual(self.search('the paneer'), [self.tikka.id, self.curry.id])
+            filter_mysql.assert_called_once_with(mock.ANY, mock.ANY, ['paneer'])
+            filter_mysql.reset_mock()
+            self.assertEqual(len(self.search('a of')), 3)
+            filter_mysql.assert_not_called()
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.search('risotto'), [])
+        self.pasta.meal_name = 'Mushroom Risotto'
+        self.pasta.save()
+        self.assertEqual(self.search('risotto'), [self.pasta.id])
+        self.pasta.delete()
+        self.assertEqual(self.search('risotto'), [])
+
+
+# Response caching of the catalog endpoints
+class CatalogCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='cached', password='cached', is_customer=True)
+        cls.chef = ChefProfile.objects.create(chef_name='Asha', cooking_experience=10, speciality='Indian')
+        cls.meal_kit = MealKit.objects.create(chef=cls.chef, meal_name='Dal', price=8, ingredients='lentils')
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get('/api/meal-kits/')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/meal-kits/')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_query_params_and_user_type_are_part_of_the_key(self):
+        self.client.get('/api/meal-kits/')
+        with self.assertNumQueries(2):
+            self.client.get('/api/meal-kits/', {'page_size': 5})
+        chef = User.objects.create_user(username='chef-user', password='chef', is_chef=True)
+        self.client.force_authenticate(chef)
+        with self.assertNumQueries(2):
+            self.client.get('/api/meal-kits/')
+
+    def test_model_changes_invalidate_dependent_views(self):
+        self.client.get('/api/meal-kits/')
+        self.client.get(f'/api/meal-kits/{self.meal_kit.id}/')
+        self.chef.speciality = 'Bengali'
+        self.chef.save()
+        response = self.client.get(f'/api/meal-kits/{self.meal_kit.id}/')
+        self.assertEqual(response.json()['chef']['speciality'], 'Bengali')
+        response = self.client.get('/api/meal-kits/')
+        self.assertEqual(response.json()['results'][0]['chef']['speciality'], 'Bengali')
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/companies/')['ETag']
+        response = self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Company.objects.create(company_name='Tiffins', email='t@example.com')
+        response = self.client.get('/api/companies/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @override_settings(API_CACHE_ENABLED=False)
+    def test_cache_can_be_disabled(self):
+        self.client.get('/api/meal-kits/')
+        with self.assertNumQueries(2):
+            self.client.get('/api/meal-kits/')
+
+
+# Bulk create/update endpoints
+class BulkEndpointTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=10, chefs=3, meal_kits=5, orders=6, reviews=0, gift_cards=2, cart_items=0, subscriptions=0)
+        cls.user = User.objects.create_user(username='bulk', password='bulk', is_chef=True)
+        cls.chef_ids = list(ChefProfile.objects.values_list('id', flat=True))
+
+    def meal_kits(self, count):
+        return [
+            {'chef': self.chef_ids[i % len(self.chef_ids)], 'meal_name': f'Bulk kit {i}', 'price': '9.50', 'ingredients': 'rice'}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_runs_a_constant_number_of_queries(self):
+        # One chef lookup, one INSERT, one catalog feed mark and the savepoint around the write
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/meal-kits/bulk/', self.meal_kits(3), format='json')
+        self.assertEqual(response.status_code, 201)
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/meal-kits/bulk/', self.meal_kits(40), format='json')
+        self.assertEqual(response.json()['count'], 40)
+        self.assertEqual(MealKit.objects.filter(meal_name__startswith='Bulk kit').count(), 43)
+
+    def test_ids_are_set_without_returning_inserts(self):
+        saved = []
+        receiver = lambda sender, instances, **kwargs: saved.extend(instance.pk for instance in instances)
+        post_bulk_save.connect(receiver, sender=MealKit)
+        self.addCleanup(post_bulk_save.disconnect, receiver, sender=MealKit)
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', new_callable=mock.PropertyMock, return_value=False):
+            response = self.client.post('/api/meal-kits/bulk/', self.meal_kits(3), format='json')
+        ids = [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids, list(MealKit.objects.filter(meal_name__startswith='Bulk kit').order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual(saved, ids)
+
+    def test_invalid_items_are_reported_and_nothing_is_written(self):
+        items = self.meal_kits(3)
+        items[1]['price'] = 'free'
+        items[2]['chef'] = 999999
+        response = self.client.post('/api/meal-kits/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(set(errors), {'1', '2'})
+        self.assertIn('price', errors['1'])
+        self.assertIn('chef', errors['2'])
+        self.assertFalse(MealKit.objects.filter(meal_name__startswith='Bulk kit').exists())
+
+    def test_bulk_update_orders(self):
+        orders = list(Order.objects.order_by('id')[:3])
+        items = [{'id': order.id, 'status': Order.COMPLETED, 'quantity': 7} for order in orders]
+        response = self.client.patch('/api/orders/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Order.objects.filter(id__in=[o.id for o in orders]).values_list('status', 'quantity').distinct()),
+            [(Order.COMPLETED, 7)],
+        )
+
+    def test_bulk_update_reports_unknown_and_duplicate_ids(self):
+        order = Order.objects.first()
+        response = self.client.patch('/api/orders/bulk/', [{'id': order.id}, {'id': order.id}, {'status': 'Paid'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+        response = self.client.patch('/api/orders/bulk/', [{'id': 999999, 'quantity': 1}], format='json')
+        self.assertEqual(response.json()['errors']['0']['id'], ['Object with id=999999 does not exist.'])
+
+    def test_delivery_order_uniqueness_is_checked_for_the_whole_list(self):
+        order = Order.objects.create(customer=Customer.objects.first(), meal_kit=MealKit.objects.first())
+        taken = Delivery.objects.first().order_id
+        item = {'delivery_date': '2026-01-01T10:00:00Z', 'delivery_address': 'Road 1'}
+        response = self.client.post('/api/deliveries/bulk/', [
+            dict(item, order=order.id), dict(item, order=order.id), dict(item, order=taken),
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+
+    def test_bulk_meal_kit_writes_invalidate_catalog(self):
+        before = self.client.get('/api/meal-kits/', {'search': 'bulk'}).json()
+        self.assertEqual(before['results'], [])
+        self.client.post('/api/meal-kits/bulk/', self.meal_kits(2), format='json')
+        after = self.client.get('/api/meal-kits/', {'search': 'bulk'}).json()
+        self.assertEqual(len(after['results']), 2)
+
+
+# Denormalized rating aggregates on meal kits and chefs
+class RatingAggregateTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=5, chefs=2, meal_kits=4, orders=0, reviews=0, gift_cards=1, cart_items=0, subscriptions=0)
+        cls.user = User.objects.create_user(username='ratings', password='ratings', is_customer=True)
+        cls.customer = Customer.objects.first()
+        cls.chef, cls.other_chef = ChefProfile.objects.order_by('id')[:2]
+        cls.kit = MealKit.objects.create(chef=cls.chef, meal_name='Dal', price=10, ingredients='lentils')
+        cls.other_kit = MealKit.objects.create(chef=cls.chef, meal_name='Rice', price=8, ingredients='rice')
+
+    def review(self, meal_kit, rating):
+        return Review.objects.create(customer=self.customer, meal_kit=meal_kit, rating=rating, review_date=timezone.now())
+
+    def aggregates(self, instance):
+        return type(instance).objects.values(*AGGREGATE_FIELDS).get(pk=instance.pk)
+
+    def test_reviews_update_meal_kit_and_chef(self):
+        review = self.review(self.kit, 5)
+        self.review(self.kit, 2)
+        self.review(self.other_kit, 2)
+        kit = self.aggregates(self.kit)
+        self.assertEqual((kit['review_count'], kit['rating_sum'], kit['rating']), (2, 7, 3.5))
+        self.assertEqual((kit['rating_2_count'], kit['rating_5_count']), (1, 1))
+        chef = self.aggregates(self.chef)
+        self.assertEqual((chef['review_count'], chef['rating_sum'], chef['rating_2_count']), (3, 9, 2))
+        self.assertEqual(chef['rating'], 3.0)
+
+        review.rating = 3
+        review.save()
+        review.delete()
+        kit = self.aggregates(self.kit)
+        self.assertEqual((kit['review_count'], kit['rating_sum'], kit['rating']), (1, 2, 2.0))
+        self.assertEqual((kit['rating_3_count'], kit['rating_5_count']), (0, 0))
+
+    def test_moving_reviews_and_meal_kits(self):
+        review = self.review(self.kit, 4)
+        review.meal_kit = self.other_kit
+        review.save()
+        self.assertEqual(self.aggregates(self.kit)['review_count'], 0)
+        self.assertEqual(self.aggregates(self.other_kit)['rating_4_count'], 1)
+
+        other_kit = MealKit.objects.get(pk=self.other_kit.pk)
+        other_kit.chef = self.other_chef
+        other_kit.save()
+        self.assertEqual(self.aggregates(self.chef)['review_count'], 0)
+        self.assertEqual(self.aggregates(self.other_chef)['rating_sum'], 4)
+
+    def test_stale_instances_do_not_overwrite_aggregates(self):
+        stale = MealKit.objects.get(pk=self.kit.pk)
+        self.review(self.kit, 5)
+        stale.price = 11
+        stale.save()
+        self.assertEqual(self.aggregates(self.kit)['review_count'], 1)
+
+    def test_rebuild_command_matches_incremental_updates(self):
+        for rating in (1, 3, 5, 5):
+            self.review(self.kit, rating)
+        expected = [self.aggregates(instance) for instance in (self.kit, self.chef)]
+        MealKit.objects.update(review_count=0, rating_sum=0, rating=0)
+        ChefProfile.objects.update(rating=1.5)
+        call_command('rebuild_rating_aggregates', batch_size=2, stdout=StringIO())
+        self.assertEqual([self.aggregates(instance) for instance in (self.kit, self.chef)], expected)
+
+    def test_meal_kits_can_be_sorted_by_rating(self):
+        self.review(self.other_kit, 5)
+        self.review(self.kit, 1)
+        response = self.client.get('/api/meal-kits/', {'ordering': '-rating', 'page_size': 10})
+        ids = [item['id'] for item in response.json()['results']]
+        self.assertEqual(ids[0], self.other_kit.pk)
+        self.assertLess(ids.index(self.other_kit.pk), ids.index(self.kit.pk))
+
+
+# EXPLAIN-based index report over the list endpoints
+@override_settings(API_CACHE_ENABLED=False)
+class IndexReportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=50, chefs=5, meal_kits=20, orders=200, reviews=50, gift_cards=5, cart_items=10, subscriptions=10)
+        cls.user = User.objects.create_user(username='indexes', password='indexes', is_customer=True)
+
+    def test_order_history_uses_the_composite_indexes(self):
+        plans, missing, unused = build_index_report(self.client)
+        used = set().union(*(plan.indexes for plan in plans if plan.route == 'order-list'))
+        self.assertTrue({'order_customer_date_idx', 'order_status_date_idx', 'order_date_idx'} <= used)
+        flagged = [item.params for item in missing if item.route == 'order-list']
+        for params in [{'pagination': 'cursor'}, {'ordering': '-order_date'}, {'status': 'Pending', 'pagination': 'cursor'}]:
+            self.assertNotIn(params, flagged)
+        self.assertNotIn('order_date_idx', {index.name for index in unused})
+
+    def test_read_plan_understands_each_backend(self):
+        mysql = [
+            {'table': 'mealkit_order', 'type': 'ALL', 'key': None, 'Extra': 'Using where; Using filesort'},
+            {'table': 'mealkit_customer', 'type': 'eq_ref', 'key': 'PRIMARY', 'Extra': None},
+        ]
+        self.assertEqual(read_plan(mysql, 'mysql'), ({'mealkit_order'}, True, {'PRIMARY'}))
+        sqlite = [{'detail': 'SCAN mealkit_order USING INDEX order_date_idx'}, {'detail': 'SCAN mealkit_review'},
+                  {'detail': 'USE TEMP B-TREE FOR ORDER BY'}]
+        self.assertEqual(read_plan(sqlite, 'sqlite'), ({'mealkit_review'}, True, {'order_date_idx'}))
+        postgresql = [{'QUERY PLAN': 'Limit  (cost=0.28..1.02 rows=10 width=8)'},
+                      {'QUERY PLAN': '  ->  Index Scan Backward using order_date_idx on mealkit_order'},
+                      {'QUERY PLAN': '  ->  Seq Scan on mealkit_review'}]
+        self.assertEqual(read_plan(postgresql, 'postgresql'), ({'mealkit_review'}, False, {'order_date_idx'}))
+
+    def test_command_prints_the_report(self):
+        out = StringIO()
+        call_command('index_report', stdout=out)
+        self.assertIn('Queries that scan or sort without an index:', out.getvalue())
+        self.assertIn('Indexes no analyzed query used', out.getvalue())
+
+
+# Fake DB-API connection for the pool tests
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+
+    def ping(self):
+        if self.broken:
+            raise OSError('gone away')
+
+    def close(self):
+        self.closed = True
+
+
+# Connection pool shared between request threads
+class ConnectionPoolTests(TestCase):
+    def pool(self, **options):
+        return ConnectionPool(FakeConnection, **options)
+
+    def test_connections_are_reused(self):
+        pool = self.pool(max_size=2)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connections_opened'], stats['in_use']), (2, 1, 1))
+
+    def test_checkout_waits_for_a_free_connection(self):
+        pool = self.pool(max_size=1, timeout=0.05)
+        connection = pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        timer = threading.Timer(0.05, pool.checkin, [connection])
+        timer.start()
+        pool.timeout = 5
+        self.assertIs(pool.checkout(), connection)
+        timer.join()
+        self.assertGreater(pool.stats()['wait_seconds_max'], 0.01)
+
+    def test_broken_and_expired_connections_are_replaced(self):
+        pool = self.pool(max_size=1, check=FakeConnection.ping)
+        broken = pool.checkout()
+        broken.broken = True
+        pool.checkin(broken)
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, broken)
+        self.assertTrue(broken.closed)
+        self.assertEqual(pool.stats()['health_check_failures'], 1)
+
+        pool.max_lifetime = 0
+        pool.checkin(replacement)
+        self.assertTrue(replacement.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_pool_stats_endpoint_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='customer', password='x', is_customer=True))
+        self.assertEqual(client.get('/api/db-pool-stats/').status_code, 403)
+        client.force_authenticate(User.objects.create_user(username='staff', password='x', is_staff=True))
+        get_pool('pool-test', lambda: self.pool())
+        self.assertIn('pool-test', client.get('/api/db-pool-stats/').json()['pools'])
+        close_pools()
+
+
+# Login: password verification, tunable hashing and batched token bookkeeping
+@override_settings(PASSWORD_HASH_ITERATIONS=1000, LOGIN_TOKEN_BATCH_SIZE=3, LOGIN_TOKEN_FLUSH_INTERVAL=3600)
+class LoginTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='diner', password='s3cret-pass', is_customer=True)
+
+    def tearDown(self):
+        outstanding_tokens.flush()
+
+    def login(self, username='diner', password='s3cret-pass'):
+        return self.client.post('/api/login/', {'username': username, 'password': password}, format='json')
+
+    def test_password_is_verified(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user_type'], 'customer')
+        self.assertEqual(self.login(password='wrong').status_code, 401)
+        self.assertEqual(self.login(username='nobody').status_code, 401)
+
+    def test_registered_chefs_can_log_in(self):
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/chef-profiles/', {
+            'chef_name': 'newchef', 'password': 'chef-pass-1', 'cooking_experience': 3, 'speciality': 'Thai',
+        }, format='json')
+        self.client.force_authenticate(None)
+        self.assertEqual(self.login('newchef', 'chef-pass-1').json()['user_type'], 'chef')
+
+    def test_outstanding_tokens_are_written_in_batches(self):
+        with self.assertNumQueries(1):
+            self.login()
+        self.login()
+        self.assertEqual(OutstandingToken.objects.count(), 0)
+        self.login()
+        self.assertEqual(OutstandingToken.objects.filter(user=self.user).count(), 3)
+
+    def test_logout_revokes_the_session_of_a_buffered_token(self):
+        older = self.login().json()['refresh']
+        tokens = self.login().json()
+        jti = RefreshToken(tokens['refresh'])['jti']
+        # Another worker still holds the current session's row in its buffer
+        elsewhere = [row for row in outstanding_tokens.pending if row.jti == jti]
+        outstanding_tokens.pending = [row for row in outstanding_tokens.pending if row.jti != jti]
+
+        response = self.client.post('/api/logout/', headers={'Authorization': f'Bearer {tokens["access"]}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), [jti])
+        OutstandingToken.objects.bulk_create(elsewhere, ignore_conflicts=True)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': tokens['refresh']}, format='json').status_code, 401)
+
+        # A rotated session's access token names the new refresh token
+        rotated = self.client.post('/api/token/refresh/', {'refresh': older}, format='json').json()
+        self.assertEqual(AccessToken(rotated['access'])['refresh_jti'], RefreshToken(rotated['refresh'])['jti'])
+
+        # Without the session claim the newest stored token is revoked
+        with override_settings(LOGIN_TOKEN_BATCH_SIZE=1):
+            latest = self.login().json()['refresh']
+            self.client.force_authenticate(self.user)
+            self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+        self.assertTrue(BlacklistedToken.objects.filter(token__token=latest).exists())
+
+    def test_hashes_follow_the_configured_work_factor(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.login()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+
+# Revocation cache in front of the token blacklist, and pruning of expired tokens
+@override_settings(PASSWORD_HASH_ITERATIONS=1000, LOGIN_TOKEN_BATCH_SIZE=1)
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        get_response_cache().clear()
+        revocations.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='diner', password='s3cret-pass', is_customer=True)
+
+    def login(self):
+        return self.client.post('/api/login/', {'username': 'diner', 'password': 's3cret-pass'}, format='json').json()['refresh']
+
+    def test_logout_revokes_the_presented_token(self):
+        refresh = self.login()
+        other = self.login()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post('/api/logout/', {'refresh': refresh}, format='json').status_code, 200)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': other}, format='json').status_code, 200)
+        # A revoked token is rejected without asking the database
+        with self.assertNumQueries(0):
+            self.assertRaises(TokenError, RevocationCheckedRefreshToken, refresh)
+
+    def test_logout_rejects_another_users_token(self):
+        refresh = self.login()
+        self.client.force_authenticate(User.objects.create_user(username='other', password='x', is_customer=True))
+        self.assertEqual(self.client.post('/api/logout/', {'refresh': refresh}, format='json').status_code, 400)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+    @override_settings(TOKEN_REVOCATION_CACHE_TIMEOUT=60)
+    def test_shared_cache_answers_repeated_checks(self):
+        refresh = self.login()
+        # Decoding checks the blacklist once; the answer is then cached
+        with self.assertNumQueries(1):
+            token = RevocationCheckedRefreshToken(refresh)
+            token.check_blacklist()
+        # Revoking overwrites the cached "not revoked" answer
+        token.blacklist()
+        revocations.clear()
+        with self.assertNumQueries(0):
+            self.assertRaises(TokenError, token.check_blacklist)
+
+    def test_prune_deletes_expired_tokens_in_batches(self):
+        now = timezone.now()
+        tokens = [
+            OutstandingToken.objects.create(
+                user=self.user, jti=f'jti-{i}', token='x', created_at=now - timedelta(days=8), expires_at=now + timedelta(days=i, hours=-12)
+            )
+            for i in range(5)
+        ]
+        BlacklistedToken.objects.create(token=tokens[0])
+        BlacklistedToken.objects.create(token=tokens[4])
+        out = StringIO()
+        call_command('prune_tokens', batch_size=2, stdout=out)
+        self.assertIn('Deleted 1 outstanding and 1 blacklisted tokens.', out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.order_by('pk').values_list('jti', flat=True)), ['jti-1', 'jti-2', 'jti-3', 'jti-4'])
+
+    def test_prune_stops_before_unexpired_tokens(self):
+        now = timezone.now()
+        for i in range(6):
+            created_at = now - timedelta(days=9 if i < 2 else 1)
+            OutstandingToken.objects.create(
+                user=self.user, jti=f'jti-{i}', token='x', created_at=created_at, expires_at=created_at + timedelta(days=7)
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(prune_expired_tokens(batch_size=2), (2, 0))
+        # The batch of recent tokens ends the walk; the last batch is never read
+        batches = [query for query in queries.captured_queries if query['sql'].startswith('SELECT') and 'LIMIT 2' in query['sql']]
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(OutstandingToken.objects.count(), 4)
+
+    @override_settings(TOKEN_REVOCATION_CACHE_TIMEOUT=60)
+    def test_revocation_during_a_check_is_not_overwritten(self):
+        token = RevocationCheckedRefreshToken(self.login())
+        jti = token.payload['jti']
+        revocations.clear()
+        get_response_cache().clear()
+
+        # Another worker revokes the token between the database read and the cache write
+        def revoke_meanwhile(*args, **kwargs):
+            get_response_cache().set(f'token-revoked:{jti}', True, 60)
+            return BlacklistedToken.objects.none()
+
+        with mock.patch.object(BlacklistedToken.objects, 'filter', side_effect=revoke_meanwhile):
+            self.assertFalse(revocations.is_revoked(jti, token.payload['exp']))
+        self.assertRaises(TokenError, token.check_blacklist)
+
+
+# Grouped sales figures and the daily rollup behind them
+class SalesAnalyticsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=10, chefs=3, meal_kits=6, orders=40, reviews=0, cart_items=0, subscriptions=8)
+        cls.user = User.objects.create_user(username='analyst', password='x', is_staff=True)
+        # Spread the orders and payments over the last ten days
+        now = timezone.now()
+        for order in Order.objects.all():
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(days=order.pk % 10))
+            Payment.objects.filter(order=order).update(payment_date=now - timedelta(days=order.pk % 10))
+        service = ChefKartService.objects.create(
+            chef=ChefProfile.objects.first(), service_type='party_chef', description='Party', price=50, duration=timedelta(hours=4),
+        )
+        for price in (50, 70):
+            ChefServiceBooking.objects.create(
+                customer=Customer.objects.first(), service=service, event_type='Birthday', service_date=now, total_price=price,
+            )
+
+    def get(self, params):
+        response = self.client.get('/api/analytics/sales/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_rollup_matches_the_source_tables(self):
+        call_command('refresh_sales_rollup', all=True, batch_days=3, stdout=StringIO())
+        for source, group_by in [('order', 'day,meal_kit'), ('order', 'week,chef,status'), ('payment', 'month,chef'),
+                                 ('booking', 'day,chef'), ('subscription', 'company,status')]:
+            with self.subTest(source=source, group_by=group_by):
+                rolled = self.get({'source': source, 'group_by': group_by})
+                live = self.get({'source': source, 'group_by': group_by, 'live': 'true'})
+                self.assertEqual(rolled['results'], live['results'])
+                self.assertEqual(rolled['totals'], live['totals'])
+        totals = self.get({'group_by': 'status'})['totals']
+        self.assertEqual(totals['count'], Order.objects.count())
+        self.assertEqual(float(totals['amount']), float(sum(Order.objects.values_list('total_amount', flat=True))))
+
+    def test_changes_are_rolled_up_incrementally(self):
+        call_command('refresh_sales_rollup', all=True, stdout=StringIO())
+        self.assertFalse(SalesRollupDirtyDay.objects.exists())
+        order = Order.objects.order_by('pk').first()
+        order.status = Order.COMPLETED if order.status == Order.PENDING else Order.PENDING
+        order.save()
+        self.assertEqual(list(SalesRollupDirtyDay.objects.values_list('day', flat=True)), [timezone.localdate(order.order_date)])
+
+        rebuilt_days, _ = refresh_sales_rollup()
+        self.assertEqual(rebuilt_days, 1)
+        params = {'group_by': 'day,status'}
+        self.assertEqual(self.get(params)['results'], self.get(dict(params, live='true'))['results'])
+
+    def test_date_range_and_grouping_in_sql(self):
+        call_command('refresh_sales_rollup', all=True, stdout=StringIO())
+        today = timezone.localdate()
+        with self.assertNumQueries(1):
+            # The view's only query is the grouped SELECT over the rollup
+            response = self.client.get('/api/analytics/sales/', {'start': today.isoformat(), 'end': today.isoformat()})
+        self.assertEqual([row['day'] for row in response.json()['results']], [today.isoformat()])
+
+    def test_invalid_queries_and_permissions(self):
+        self.assertEqual(self.client.get('/api/analytics/sales/', {'source': 'refunds'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/sales/', {'group_by': 'company'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/sales/', {'start': 'yesterday'}).status_code, 400)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='customer', password='x'))
+        self.assertEqual(client.get('/api/analytics/sales/').status_code, 403)
+
+
+# Streaming CSV/NDJSON exports
+class DataExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(customers=5, chefs=2, meal_kits=3, orders=25, reviews=0, cart_items=0, subscriptions=3)
+        cls.user = User.objects.create_user(username='finance', password='x', is_staff=True)
+        # Give every order its own day, some sharing a timestamp to exercise the keyset tie-break
+        now = timezone.now()
+        for order in Order.objects.all():
+            Order.objects.filter(pk=order.pk).update(order_date=now - timedelta(days=order.pk % 5))
+
+    def export(self, path, params=None, **headers):
+        response = self.client.get(f'/api/exports/{path}', params or {}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_streams_every_row_in_date_order(self):
+        lines = self.export('orders.csv', HTTP_ACCEPT='text/csv').splitlines()
+        self.assertEqual(lines[0].split(','), [field.name for field in Order._meta.concrete_fields])
+        expected = list(Order.objects.order_by('order_date', 'pk').values_list('pk', flat=True))
+        self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], expected)
+
+    def test_ndjson_export_filters_by_day(self):
+        day = timezone.localdate() - timedelta(days=2)
+        rows = [json.loads(line) for line in self.export('orders.ndjson', {'start': day, 'end': day}).splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), sorted(pk for pk in Order.objects.values_list('pk', flat=True) if pk % 5 == 2))
+        self.assertEqual(set(rows[0]), {field.name for field in Order._meta.concrete_fields})
+
+    def test_rows_are_fetched_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(iter_export_rows(EXPORTS['orders'], chunk_size=7))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(len(set(rows)), 25)
+        # Four full or partial chunks and the empty one ending the walk
+        self.assertEqual(len(queries), 5)
+
+    def test_asgi_export_streams_from_an_async_iterator(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}', 'Accept': 'text/csv'}
+
+        async def export():
+            response = await AsyncClient().get('/api/exports/orders.csv', headers=headers)
+            self.assertTrue(response.is_async)
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(async_to_sync(export)(), self.export('orders.csv', HTTP_ACCEPT='text/csv'))
+
+    def test_unknown_exports_and_permissions(self):
+        self.assertEqual(self.client.get('/api/exports/users.csv').status_code, 404)
+        self.assertEqual(self.client.get('/api/exports/orders.xlsx').status_code, 404)
+        self.assertEqual(self.client.get('/api/exports/orders.csv', {'start': '2024-13-01'}).status_code, 400)
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='customer', password='x'))
+        self.assertEqual(client.get('/api/exports/payments.csv').status_code, 403)
+
+
+# Checking out a whole cart in one transaction
+class CartCheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='x', is_customer=True)
+        cls.customer = Customer.objects.create(user=cls.user, customer_name='Shopper', gender='other', mobile='1', address='1 Main St')
+        chef = ChefProfile.objects.create(chef_name='Chef', cooking_experience=3, speciality='Curry')
+        cls.curry = MealKit.objects.create(chef=chef, meal_name='Curry', price=Decimal('40.00'), ingredients='rice')
+        cls.soup = MealKit.objects.create(chef=chef, meal_name='Soup', price=Decimal('25.00'), ingredients='lentils')
+        cls.card = GiftCard.objects.create(gift_amount=70, expiry_date=timezone.now() + timedelta(days=30))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self):
+        CartItem.objects.create(customer=self.customer, meal_kit=self.curry, quantity=2, gift_card=self.card)
+        CartItem.objects.create(customer=self.customer, meal_kit=self.soup, quantity=1, gift_card=self.card)
+        CartItem.objects.create(customer=self.customer, meal_kit=self.soup, quantity=3)
+
+    def test_checkout_creates_orders_payments_and_deliveries(self):
+        self.fill_cart()
+        # Customer, cart (locked, with prices), three inserts, gift card update, cart
+        # delete and the two rollup marks, plus the savepoint pair
+        with self.assertNumQueries(11):
+            response = self.client.post('/api/cart/checkout/', {'payment_method': 'card'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        # 80 + 25 paid with the 70 gift card in cart order, then 75
+        self.assertEqual([order['total_amount'] for order in response.data['orders']], [Decimal('10.00'), Decimal('25.00'), Decimal('75.00')])
+        self.assertEqual(response.data['gift_card_credit'], Decimal('70'))
+        orders = Order.objects.filter(customer=self.customer)
+        self.assertEqual(orders.count(), 3)
+        self.assertEqual(Payment.objects.filter(order__in=orders).count(), 3)
+        self.assertEqual(set(Delivery.objects.filter(order__in=orders).values_list('delivery_address', flat=True)), {'1 Main St'})
+        self.assertFalse(CartItem.objects.filter(customer=self.customer).exists())
+        self.assertFalse(GiftCard.objects.get(pk=self.card.pk).is_active)
+        self.assertTrue(SalesRollupDirtyDay.objects.exists())
+
+    def test_invalid_carts_write_nothing(self):
+        response = self.client.post('/api/cart/checkout/', {'payment_method': 'card'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.fill_cart()
+        MealKit.objects.filter(pk=self.soup.pk).update(is_available=False)
+        response = self.client.post('/api/cart/checkout/', {'payment_method': 'card'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(CartItem.objects.filter(customer=self.customer).count(), 3)
+        self.assertFalse(Order.objects.exists())
+        self.assertTrue(GiftCard.objects.get(pk=self.card.pk).is_active)
+
+    def test_ids_are_read_back_without_returning_inserts(self):
+        self.fill_cart()
+        features = type(connection.features)
+        with mock.patch.object(features, 'can_return_rows_from_bulk_insert', new_callable=mock.PropertyMock, return_value=False):
+            result = checkout_cart(self.customer, 'card')
+        self.assertEqual([order.pk for order in result.orders], list(Order.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual(Payment.objects.filter(order__in=result.orders).count(), 3)
+        self.assertEqual([payment.pk for payment in result.payments], list(Payment.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual([delivery.pk for delivery in result.deliveries], list(Delivery.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual([delivery.order_id for delivery in result.deliveries], [order.pk for order in result.orders])
+
+    def test_only_customers_can_check_out(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='chef', password='x', is_chef=True))
+        self.assertEqual(client.post('/api/cart/checkout/', {'payment_method': 'card'}, format='json').status_code, 403)
+
+
+# Async catalog views: same responses as the sync views, read with the async ORM
+@override_settings(API_CACHE_ENABLED=False)
+class AsyncCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(companies=4, customers=0, chefs=3, meal_kits=7, orders=0, reviews=0, gift_cards=0, cart_items=0, subscriptions=0)
+        cls.user = User.objects.create_user(username='async', password='x', is_customer=True)
+        cls.headers = {'Authorization': f'Bearer {AccessToken.for_user(cls.user)}'}
+
+    async def assert_same_response(self, path):
+        sync_response = await sync_to_async(Client().get)(f'/api/{path}', headers=self.headers)
+        async_response = await AsyncClient().get(f'/api/async/{path}', headers=self.headers)
+        self.assertEqual(async_response.status_code, sync_response.status_code, path)
+        self.assertEqual(async_response.content, sync_response.content.replace(b'/api/', b'/api/async/'), path)
+
+    async def test_async_views_match_the_sync_views(self):
+        meal_kit = await MealKit.objects.afirst()
+        for path in ['meal-kits/', 'meal-kits/?page=2&ordering=-price&expand=', f'meal-kits/{meal_kit.pk}/', 'meal-kits/0/',
+                     'meal-kits/?page=9', 'chef-profiles/?page=last', 'companies/?page_size=3', 'subscription-plans/',
+                     'meal-kits/?pagination=cursor']:
+            await self.assert_same_response(path)
+
+    async def test_async_lists_count_facets(self):
+        for path in ['meal-kits/?facets=all', 'meal-kits/?facets=price,chef&is_available=true&search=meal',
+                     'companies/?facets=food_type&category=lunch', 'meal-kits/?facets=nonsense']:
+            await self.assert_same_response(path)
+        response = await AsyncClient().get('/api/async/meal-kits/?facets=all&price=under-10', headers=self.headers)
+        self.assertEqual(set(response.json()['facets']), {facet.name for facet in MEAL_KIT_FACETS})
+
+    def test_page_is_read_with_three_queries(self):
+        # The async ORM runs its queries on this thread when called through async_to_sync
+        with CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(AsyncClient().get)('/api/async/meal-kits/', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        # The user, the count and the page with its chefs joined
+        self.assertEqual(len(queries), 3)
+
+    async def test_requests_need_a_valid_token(self):
+        client = AsyncClient()
+        response = await client.get('/api/async/companies/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response.headers['WWW-Authenticate'])
+        response = await client.get('/api/async/companies/', headers={'Authorization': 'Bearer nonsense'})
+        self.assertEqual(response.status_code, 401)
+
+
+# Failing job used to exercise the retries
+@register('test_failing_job', max_attempts=2)
+def failing_job(**payload):
+    raise RuntimeError('downstream is down')
+
+
+# Background jobs queued by orders, bookings and reviews
+class BackgroundJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='eater', password='x', email='eater@example.com', is_customer=True)
+        cls.customer = Customer.objects.create(user=user, customer_name='Eater', gender='other', mobile='1', address='2 High St')
+        chef_user = User.objects.create_user(username='cook', password='x', email='cook@example.com', is_chef=True)
+        chef = ChefProfile.objects.create(user=chef_user, chef_name='Cook', cooking_experience=3, speciality='Stew')
+        cls.meal_kit = MealKit.objects.create(chef=chef, meal_name='Stew', price=Decimal('30.00'), ingredients='beans')
+
+    def place_order(self):
+        return Order.objects.create(customer=self.customer, meal_kit=self.meal_kit, quantity=1, total_amount=Decimal('30.00'))
+
+    def test_sync_mode_runs_jobs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.place_order()
+            # Nothing runs before the transaction commits
+            self.assertFalse(Delivery.objects.filter(order=order).exists())
+        self.assertEqual(Delivery.objects.get(order=order).delivery_address, '2 High St')
+        # The payment is recorded when the customer pays; the rollup by its command
+        self.assertFalse(Payment.objects.filter(order=order).exists())
+        self.assertTrue(SalesRollupDirtyDay.objects.exists())
+        self.assertEqual([message.to for message in mail.outbox], [['eater@example.com']])
+        self.assertFalse(Job.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(customer=self.customer, meal_kit=self.meal_kit, rating=4, review_date=timezone.now())
+        self.assertEqual(mail.outbox[-1].to, ['cook@example.com'])
+
+    @override_settings(JOB_QUEUE_MODE='database')
+    def test_workers_run_stored_jobs(self):
+        order = self.place_order()
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.payload, job.status), ('order_placed', {'order_id': order.pk}, Job.QUEUED))
+        # Jobs of rolled back writes are rolled back with them
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.place_order()
+            raise RuntimeError
+        self.assertEqual(Job.objects.count(), 1)
+
+        out = StringIO()
+        call_command('run_jobs', once=True, stdout=out)
+        self.assertIn('Finished 1 jobs, 0 to be retried, 0 failed.', out.getvalue())
+        self.assertFalse(Job.objects.exists())
+        self.assertTrue(Delivery.objects.filter(order=order).exists())
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(JOB_QUEUE_MODE='database')
+    def test_failed_jobs_are_retried_with_backoff(self):
+        enqueue('test_failing_job', attempt='first')
+        with self.assertLogs('mealkit.jobs', 'ERROR'):
+            self.assertEqual(run_pending_jobs('test'), (0, 1, 0))
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('downstream is down', job.last_error)
+        self.assertGreaterEqual(job.run_at, timezone.now() + timedelta(seconds=RETRY_BASE_DELAY / 2 - 1))
+        # Not due yet
+        self.assertEqual(run_pending_jobs('test'), (0, 0, 0))
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('mealkit.jobs', 'ERROR'):
+            self.assertEqual(run_pending_jobs('test'), (0, 0, 1))
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    @override_settings(JOB_QUEUE_MODE='database')
+    def test_lost_jobs_are_released(self):
+        enqueue('test_failing_job')
+        claim_jobs('lost-worker')
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=LOCK_TIMEOUT + 1))
+        self.assertEqual(release_stale_jobs(), 1)
+        self.assertEqual(Job.objects.get().status, Job.QUEUED)
+
+
+# Chef bookings without double booking, and the availability search
+class ChefBookingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='host', password='x', is_customer=True)
+        cls.customer = Customer.objects.create(user=cls.user, customer_name='Host', gender='other', mobile='1')
+        busy_chef = ChefProfile.objects.create(chef_name='Busy', cooking_experience=5, speciality='Grill')
+        free_chef = ChefProfile.objects.create(chef_name='Free', cooking_experience=2, speciality='Cake')
+        cls.busy = ChefKartService.objects.create(
+            chef=busy_chef, service_type='party_chef', description='Grill', price=Decimal('200.00'), duration=timedelta(hours=4),
+        )
+        cls.free = ChefKartService.objects.create(
+            chef=free_chef, service_type='party_chef', description='Cakes', price=Decimal('300.00'), duration=timedelta(hours=4),
+        )
+        cls.party = timezone.now().replace(hour=18, minute=0, second=0, microsecond=0) + timedelta(days=7)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, service, start):
+        return self.client.post('/api/chef-bookings/', {
+            'service': service.pk, 'service_date': start.isoformat(), 'event_type': 'party',
+        }, format='json')
+
+    def test_interval_tree_matches_a_scan(self):
+        rng = random.Random(7)
+        intervals = []
+        for value in range(300):
+            start = rng.randrange(1000)
+            intervals.append((start, start + rng.randrange(1, 50), value))
+        tree = IntervalTree(intervals)
+        for _ in range(300):
+            start = rng.randrange(1050)
+            end = start + rng.randrange(1, 80)
+            expected = sorted(interval for interval in intervals if interval[0] < end and interval[1] > start)
+            self.assertEqual(sorted(tree.overlapping(start, end)), expected)
+
+    def test_bookings_store_their_range_and_refuse_overlaps(self):
+        response = self.book(self.busy, self.party)
+        self.assertEqual(response.status_code, 201, response.content)
+        booking = ChefServiceBooking.objects.get(pk=response.data['id'])
+        self.assertEqual((booking.chef_id, booking.service_end), (self.busy.chef_id, self.party + timedelta(hours=4)))
+        self.assertEqual(booking.total_price, Decimal('200.00'))
+
+        response = self.book(self.busy, self.party + timedelta(hours=3))
+        self.assertEqual(response.status_code, 409)
+        # Back to back is fine, and cancelling frees the time
+        self.assertEqual(self.book(self.busy, self.party + timedelta(hours=4)).status_code, 201)
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.book(self.busy, self.party - timedelta(hours=1)).status_code, 201)
+
+    def test_availability_search(self):
+        self.book(self.busy, self.party)
+        # The services, then the busy bookings of their chefs
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/chef-availability/', {'service_type': 'party_chef', 'start': (self.party + timedelta(hours=1)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['service'] for result in response.data['results']], [self.free.pk])
+
+        response = self.client.get('/api/chef-availability/', {'service_type': 'party_chef', 'date': self.party.date().isoformat()})
+        results = {result['service']: result['free'] for result in response.data['results']}
+        self.assertEqual(len(results[self.free.pk]), 1)
+        self.assertEqual([slot['end'] for slot in results[self.busy.pk]][0], self.party)
+
+        response = self.client.get('/api/chef-availability/', {'service_type': 'butler', 'date': 'soon'})
+        self.assertEqual(response.status_code, 400)
+
+
+# Batch renewal and expiry of subscriptions
+class SubscriptionRenewalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = Customer.objects.create(customer_name='Regular', gender='other', mobile='1', address='3 Low St')
+        chef = ChefProfile.objects.create(chef_name='Chef', cooking_experience=3, speciality='Pasta')
+        cls.meal_kit = MealKit.objects.create(chef=chef, meal_name='Pasta', price=Decimal('12.00'), ingredients='flour')
+        cls.plan = SubscriptionPlan.objects.create(
+            price=Decimal('100.00'), duration=timedelta(days=14), meals_per_week=3,
+            company=Company.objects.create(company_name='Weekly', email='weekly@example.com'),
+        )
+        cls.withdrawn = SubscriptionPlan.objects.create(
+            price=Decimal('50.00'), meals_per_week=2, is_active=False,
+            company=Company.objects.create(company_name='Gone', email='gone@example.com'),
+        )
+
+    def subscribe(self, plan, end_date, **kwargs):
+        return Subscription.objects.create(customer_name=self.customer, plan=plan, end_date=end_date, meal_kit=self.meal_kit, **kwargs)
+
+    def test_due_subscriptions_are_renewed_or_expired(self):
+        now = timezone.now()
+        renewing = self.subscribe(self.plan, now - timedelta(hours=1))
+        lapsed = self.subscribe(self.plan, now - timedelta(days=30))
+        cancelled = self.subscribe(self.plan, now - timedelta(hours=1), auto_renew=False)
+        withdrawn = self.subscribe(self.withdrawn, now - timedelta(hours=1))
+        running = self.subscribe(self.plan, now + timedelta(days=1))
+
+        result = process_due_subscriptions(now=now, batch_size=2)
+        self.assertEqual(result, (2, 2, 4))
+
+        renewing.refresh_from_db()
+        self.assertEqual(renewing.end_date, now - timedelta(hours=1) + timedelta(days=14))
+        lapsed.refresh_from_db()
+        self.assertEqual(lapsed.end_date, now + timedelta(days=14))
+        self.assertFalse(Subscription.objects.get(pk=cancelled.pk).is_active)
+        self.assertFalse(Subscription.objects.get(pk=withdrawn.pk).is_active)
+        self.assertEqual(Subscription.objects.get(pk=running.pk).end_date, running.end_date)
+
+        # Two weekly orders per renewal, splitting the plan price, each with its delivery
+        orders = Order.objects.order_by('pk')
+        self.assertEqual([order.total_amount for order in orders], [Decimal('50.00')] * 4)
+        self.assertEqual({order.quantity for order in orders}, {3})
+        dates = sorted(Delivery.objects.filter(order__in=orders).values_list('delivery_date', flat=True))
+        self.assertIn(renewing.end_date - timedelta(days=7), dates)
+        self.assertTrue(SalesRollupDirtyDay.objects.exists())
+
+        # Nothing is due any more
+        self.assertEqual(process_due_subscriptions(now=now), (0, 0, 0))
+
+    def test_command(self):
+        self.subscribe(self.plan, timezone.now() - timedelta(hours=1))
+        out = StringIO()
+        call_command('process_subscriptions', stdout=out)
+        self.assertIn('Renewed 1 and expired 0 subscriptions, created 2 orders.', out.getvalue())
+        self.assertEqual(weekly_amounts(Decimal('100.00'), 3), [Decimal('33.33'), Decimal('33.33'), Decimal('33.34')])
+
+
+# Geocoding, zoning and route planning of deliveries
+class DispatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='dispatcher', password='x', is_staff=True)
+        PostalCodeZone.objects.bulk_create([
+            PostalCodeZone(postal_code='560001', zone='central', latitude=12.975, longitude=77.590),
+            PostalCodeZone(postal_code='560002', zone='central', latitude=12.960, longitude=77.580),
+            PostalCodeZone(postal_code='560100', zone='south', latitude=12.850, longitude=77.660),
+        ])
+        customer = Customer.objects.create(customer_name='Diner', gender='other', mobile='1')
+        chef = ChefProfile.objects.create(chef_name='Chef', cooking_experience=3, speciality='Dosa')
+        meal_kit = MealKit.objects.create(chef=chef, meal_name='Dosa', price=Decimal('8.00'), ingredients='rice')
+        cls.day = timezone.localdate() + timedelta(days=1)
+        morning = day_start(cls.day) + timedelta(hours=9)
+        addresses = ['1 MG Road, 560001', '9 Brigade Rd 560002', '4 Church St, 560001', '7 Hosur Rd, 560100', 'Somewhere unknown']
+        for address in addresses:
+            order = Order.objects.create(customer=customer, meal_kit=meal_kit, quantity=1)
+            Delivery.objects.create(order=order, delivery_date=morning, delivery_address=address)
+        # Another day's delivery is left alone
+        order = Order.objects.create(customer=customer, meal_kit=meal_kit, quantity=1)
+        Delivery.objects.create(order=order, delivery_date=morning + timedelta(days=1), delivery_address='5 Ring Rd 560001')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_route_heuristics(self):
+        rng = random.Random(3)
+        points = [(rng.uniform(0, 20), rng.uniform(0, 20)) for _ in range(300)]
+        order = nearest_neighbour_order(points, 0)
+        self.assertEqual(sorted(order), list(range(300)))
+        # Same as the plain quadratic search
+        current, remaining, expected = 0, set(range(1, 300)), [0]
+        while remaining:
+            current = min(remaining, key=lambda index: (math.dist(points[current], points[index]), index))
+            remaining.discard(current)
+            expected.append(current)
+        self.assertEqual(path_length(points, order), path_length(points, expected))
+        improved = two_opt(points, order[:40])
+        self.assertEqual(sorted(improved), sorted(order[:40]))
+        self.assertEqual(improved[0], order[0])
+        self.assertLessEqual(path_length(points, improved), path_length(points, order[:40]))
+
+    def test_plan_read_and_update_routes(self):
+        response = self.client.post('/api/dispatch/plan/', {'date': self.day.isoformat(), 'max_stops': 2}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        routes = response.data['routes']
+        # Unzoned, central split in two, south
+        self.assertEqual([(route['zone'], len(route['stops'])) for route in routes], [('', 1), ('central', 2), ('central', 1), ('south', 1)])
+        delivery = Delivery.objects.get(delivery_address='7 Hosur Rd, 560100')
+        self.assertEqual((delivery.zone, delivery.latitude, delivery.geocoded_address), ('south', 12.850, delivery.delivery_address))
+        # Planned deliveries are not planned again
+        response = self.client.post('/api/dispatch/plan/', {'date': self.day.isoformat()}, format='json')
+        self.assertEqual(response.data['routes'], [])
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/dispatch/routes/', {'date': self.day.isoformat()})
+        self.assertEqual([stop['id'] for route in response.data['routes'] for stop in route['stops']],
+                         [stop for route in routes for stop in route['stops']])
+
+        route = routes[1]
+        response = self.client.post(f"/api/dispatch/routes/{route['id']}/status/", {'delivery_status': 'in_progress'}, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        self.assertEqual(set(Delivery.objects.filter(pk__in=route['stops']).values_list('delivery_status', flat=True)), {'in_progress'})
+
+    def test_plan_command_and_postal_code_loading(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('postal_code,zone,latitude,longitude\n560100,east,12.9,77.7\n')
+        self.addCleanup(os.remove, csv_file.name)
+        call_command('load_postal_codes', csv_file.name, stdout=StringIO())
+        self.assertEqual(PostalCodeZone.objects.get(postal_code='560100').zone, 'east')
+
+        out = StringIO()
+        call_command('plan_deliveries', date=self.day, zones=['east'], stdout=out)
+        self.assertIn('Planned 1 routes with 1 stops', out.getvalue())
+
+
+# Opt-in request profiling and the endpoint ranking
+class ProfilingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='profiled', password='x', is_staff=True)
+        customer = Customer.objects.create(customer_name='Diner', gender='other', mobile='1')
+        chef = ChefProfile.objects.create(chef_name='Chef', cooking_experience=3, speciality='Dal')
+        meal_kit = MealKit.objects.create(chef=chef, meal_name='Dal', price=Decimal('9.00'), ingredients='lentils')
+        for _ in range(3):
+            Order.objects.create(customer=customer, meal_kit=meal_kit, quantity=1)
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_path = os.path.join(directory.name, 'profile.log')
+        # The log handler is set up once per process; start from a fresh one
+        self.close_profile_log()
+        self.addCleanup(self.close_profile_log)
+
+    def close_profile_log(self):
+        profile_logger = logging.getLogger(PROFILE_LOGGER)
+        for handler in list(profile_logger.handlers):
+            profile_logger.removeHandler(handler)
+            handler.close()
+
+    def test_profiles_are_disabled_by_default(self):
+        response = self.client.get('/api/orders/')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_requests_are_profiled_and_ranked(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILING_LOG_PATH=self.log_path):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            response = client.get('/api/orders/')
+            client.get('/api/orders/')
+            client.get(f'/api/orders/{Order.objects.first().pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'serialize;dur=', 'app;dur='):
+            self.assertIn(metric, timing)
+
+        profiles = list(read_profiles(self.log_path))
+        self.assertEqual([profile['route'] for profile in profiles], ['/api/orders/', '/api/orders/', '/api/orders/<int:pk>/'])
+        self.assertGreater(profiles[0]['queries'], 0)
+        self.assertGreater(profiles[0]['serialize_ms'], 0)
+        self.assertEqual(profiles[0]['response_bytes'], len(response.content))
+
+        rows = rank_endpoints(profiles, sort='requests')
+        self.assertEqual([(row['route'], row['requests']) for row in rows], [('/api/orders/', 2), ('/api/orders/<int:pk>/', 1)])
+        out = StringIO()
+        call_command('profile_report', log=self.log_path, stdout=out)
+        self.assertIn('GET /api/orders/<int:pk>/', out.getvalue())
+
+    def test_duplicate_queries_are_counted(self):
+        profile = RequestProfile()
+        execute = lambda sql, params, many, context: None
+        for params in [(1,), (1,), (2,)]:
+            profile.record_query(execute, 'SELECT 1 WHERE id = %s', params, False, {})
+        self.assertEqual(profile.duplicate_queries, 1)
+        self.assertEqual(profile.most_repeated, ('SELECT 1 WHERE id = %s', 3))
+
+
+class MetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='scraped', password='secret', is_staff=True)
+        cls.customer = Customer.objects.create(customer_name='Diner', gender='other', mobile='1')
+        chef = ChefProfile.objects.create(chef_name='Chef', cooking_experience=3, speciality='Dal')
+        cls.meal_kit = MealKit.objects.create(chef=chef, meal_name='Dal', price=Decimal('9.00'), ingredients='lentils')
+
+    # Value of one sample line of the /metrics output, 0 when absent
+    def scrape(self, sample, **headers):
+        response = self.client.get('/metrics', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        for line in response.content.decode().splitlines():
+            if line.startswith(sample + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_requests_are_exported_per_url_name(self):
+        sample = 'http_request_duration_seconds_count{method="GET",url_name="order-list",status="2xx"}'
+        before = self.scrape(sample)
+        queries = self.scrape('db_queries_total{alias="default"}')
+        self.client.get('/api/orders/')
+        self.client.get('/api/orders/')
+        self.assertEqual(self.scrape(sample), before + 2)
+        self.assertGreater(self.scrape('db_queries_total{alias="default"}'), queries)
+
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('# TYPE http_request_duration_seconds histogram', response.content.decode())
+
+    def test_logins_and_orders_are_counted(self):
+        failures = self.scrape('auth_logins_total{result="failure"}')
+        self.client.post('/api/login/', {'username': 'scraped', 'password': 'wrong'})
+        self.assertEqual(self.scrape('auth_logins_total{result="failure"}'), failures + 1)
+
+        orders = self.scrape('orders_created_total')
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(customer=self.customer, meal_kit=self.meal_kit, quantity=1)
+        self.assertEqual(self.scrape('orders_created_total'), orders + 1)
+
+    def test_token_is_required_when_configured(self):
+        with override_settings(METRICS_TOKEN='scrape-me'):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            self.assertGreaterEqual(self.scrape('orders_created_total', authorization='Bearer scrape-me'), 0)
+
+    def test_worker_files_are_added_up(self):
+        registry = Registry()
+        requests = Counter('test_requests_total', 'Requests.', ['view'], registry=registry)
+        latency = Histogram('test_latency_seconds', 'Latency.', buckets=(0.1, 1.0), registry=registry)
+        requests.inc('home', amount=2)
+        latency.observe(0.5)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # The last values of two other workers; pid 0 is never a live worker
+        for pid in (0, os.getpid()):
+            with open(os.path.join(directory.name, f'{pid}-worker.json'), 'w') as file:
+                json.dump({'pid': pid, 'metrics': {
+                    'test_requests_total': {'["home"]': 3},
+                    'test_latency_seconds': {'[]': [1, 0, 1, 2.05]},
+                }}, file)
+
+        with override_settings(METRICS_DIR=directory.name):
+            output = registry.expose()
+        self.assertIn('test_requests_total{view="home"} 8.0', output)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 2', output)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 3', output)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 5', output)
+        self.assertIn('test_latency_seconds_count 5', output)
+
+
+class FastSerializationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='fast', password='x', is_staff=True)
+        # Nulls, non-ASCII text and line separators that JSON escapes differently
+        customers = [
+            Customer.objects.create(customer_name='Zoë', gender='female', mobile='1', address='Flat 2\u2028Pune 411001'),
+            Customer.objects.create(customer_name=None, gender='other', mobile='2', age=None),
+        ]
+        chef = ChefProfile.objects.create(chef_name='Chef', cooking_experience=3, speciality='Dal')
+        meal_kit = MealKit.objects.create(
+            chef=chef, meal_name='Dal', price=Decimal('9.50'), ingredients='lentils', preparation_time=timedelta(minutes=45),
+        )
+        for index in range(5):
+            order = Order.objects.create(
+                customer=customers[index % 2], meal_kit=meal_kit, quantity=index or None,
+                total_amount=Decimal('12.30') if index % 2 else None,
+            )
+            Payment.objects.create(order=order, amount=Decimal('12.30'), payment_method='card')
+
+    def get_both(self, url):
+        responses = []
+        for enabled in (False, True):
+            with override_settings(FAST_SERIALIZATION_ENABLED=enabled):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            responses.append((response.content, len(queries)))
+        return responses
+
+    def test_output_matches_the_serializers(self):
+        for url in [
+            '/api/orders/?page_size=10',
+            '/api/orders/?ordering=total_amount&page=2&page_size=2',
+            '/api/orders/?pagination=cursor&page_size=3',
+            '/api/orders/?fields=id,customer.customer_name,meal_kit.chef.chef_name',
+            '/api/orders/?expand=meal_kit&omit=status',
+            '/api/payments/?page_size=10',
+            '/api/payments/?ordering=-amount&pagination=cursor&page_size=4',
+        ]:
+            with self.subTest(url=url):
+                (slow, slow_queries), (fast, fast_queries) = self.get_both(url)
+                self.assertEqual(fast, slow)
+                self.assertEqual(fast_queries, slow_queries)
+
+        # The cursor of a fast page opens the same next page
+        first = self.client.get('/api/orders/?pagination=cursor&page_size=2').json()
+        (slow, _), (fast, _) = self.get_both(first['next'])
+        self.assertEqual(fast, slow)
+
+    def test_unsupported_serializers_fall_back(self):
+        class LabelledOrderSerializer(OrderSerializer):
+            label = serializers.SerializerMethodField()
+
+            def get_label(self, order):
+                return str(order)
+
+        self.assertIsNotNone(get_row_plan(OrderSerializer))
+        self.assertIsNone(get_row_plan(LabelledOrderSerializer))
+
+
+class CatalogFeedTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='shopper', password='x', is_customer=True)
+        cls.customer = Customer.objects.create(user=cls.user, customer_name='Shopper', gender='other', mobile='1')
+        cls.chef = ChefProfile.objects.create(chef_name='Asha', cooking_experience=5, speciality='Curry')
+        other_chef = ChefProfile.objects.create(chef_name='Ravi', cooking_experience=2, speciality='Dosa')
+        cls.curry = MealKit.objects.create(chef=cls.chef, meal_name='Curry', price=Decimal('12.00'), ingredients='spice')
+        cls.dal = MealKit.objects.create(chef=cls.chef, meal_name='Dal', price=Decimal('8.00'), ingredients='lentils')
+        cls.dosa = MealKit.objects.create(chef=other_chef, meal_name='Dosa', price=Decimal('6.00'), ingredients='rice', is_available=False)
+        company = Company.objects.create(company_name='Tiffins', email='t@example.com', food_type=Company.VEG, category=Company.LUNCH)
+        SubscriptionPlan.objects.create(company=company, description='Weekly', price=Decimal('50'), meals_per_week=3)
+
+    def setUp(self):
+        super().setUp()
+        # Snapshot ids repeat between rolled back tests; forget the loaded one
+        catalog._loaded = None
+        catalog.refresh_catalog_feed(full=True)
+
+    def get_feed(self, **headers):
+        response = self.client.get('/api/catalog-feed/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response, json.loads(response.content)
+
+    def test_feed_combines_meal_kits_chefs_ratings_and_plans(self):
+        response, feed = self.get_feed()
+        self.assertEqual([row['meal_name'] for row in feed['meal_kits']], ['Curry', 'Dal', 'Dosa'])
+        dosa = feed['meal_kits'][2]
+        self.assertEqual(dosa['chef']['chef_name'], 'Ravi')
+        self.assertFalse(dosa['is_available'])
+        self.assertEqual(dosa['rating_summary'], {'average': 0.0, 'count': 0, 'histogram': {str(star): 0 for star in range(1, 6)}})
+        self.assertEqual(feed['subscription_plans'][0]['company']['company_name'], 'Tiffins')
+        self.assertEqual(response['X-Catalog-Version'], str(feed['version']))
+
+        # Gzip clients get the stored bytes; a known ETag is answered with 304
+        compressed = self.client.get('/api/catalog-feed/', headers={'accept-encoding': 'gzip, br'})
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), response.content)
+        not_modified = self.client.get('/api/catalog-feed/', headers={'if-none-match': response['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Served from memory until a new version is published
+        with self.assertNumQueries(0):
+            self.get_feed()
+
+    def test_first_request_queues_the_build_once(self):
+        CatalogSnapshot.objects.all().delete()
+        get_response_cache().delete_many([catalog.VERSION_CACHE_KEY, catalog.FIRST_BUILD_CACHE_KEY])
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(catalog, 'enqueue', wraps=catalog.enqueue) as enqueue:
+            responses = [self.client.get('/api/catalog-feed/') for _ in range(2)]
+        self.assertEqual([response.status_code for response in responses], [503, 503])
+        self.assertEqual(responses[0]['Retry-After'], str(catalog.FIRST_BUILD_RETRY_AFTER))
+        enqueue.assert_called_once_with(catalog.FIRST_BUILD_JOB)
+
+        _, feed = self.get_feed()
+        self.assertEqual([row['meal_name'] for row in feed['meal_kits']], ['Curry', 'Dal', 'Dosa'])
+
+    def test_changes_rebuild_only_their_rows(self):
+        _, first = self.get_feed()
+        untouched = CatalogFeedRow.objects.get(meal_kit_id=self.dosa.pk).updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.curry.price = Decimal('13.50')
+            self.curry.save()
+        self.assertEqual(CatalogFeedRow.objects.get(meal_kit_id=self.dosa.pk).updated_at, untouched)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(customer=self.customer, meal_kit=self.dal, rating=4, comment='Good', review_date=timezone.now())
+            self.dosa.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chef.chef_name = 'Asha K'
+            self.chef.save()
+
+        _, feed = self.get_feed()
+        self.assertGreater(feed['version'], first['version'])
+        rows = {row['meal_name']: row for row in feed['meal_kits']}
+        self.assertEqual(list(rows), ['Curry', 'Dal'])
+        self.assertEqual(rows['Curry']['price'], '13.50')
+        self.assertEqual(rows['Dal']['rating_summary']['histogram']['4'], 1)
+        self.assertEqual({row['chef']['chef_name'] for row in rows.values()}, {'Asha K'})
+        self.assertFalse(CatalogFeedDirty.objects.exists())
+        self.assertFalse(CatalogFeedRow.objects.filter(meal_kit_id=self.dosa.pk).exists())
+        self.assertIsNone(catalog.refresh_catalog_feed())
+        self.assertLessEqual(CatalogSnapshot.objects.count(), catalog.SNAPSHOTS_KEPT + 1)
+
+        # A review changes the chef rating shown on the chef's other rows too
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(customer=self.customer, meal_kit=self.curry, rating=5, review_date=timezone.now())
+        _, feed = self.get_feed()
+        self.assertEqual({(row['chef']['rating'], row['chef']['review_count']) for row in feed['meal_kits']}, {(4.5, 2)})
+
+        # A full rebuild renders every row again
+        CatalogFeedRow.objects.filter(meal_kit_id=self.curry.pk).delete()
+        out = StringIO()
+        call_command('refresh_catalog_feed', full=True, stdout=out)
+        self.assertIn('Rebuilt 2 catalog rows', out.getvalue())
+        self.assertEqual(CatalogFeedRow.objects.count(), 2)
+
+
+class FacetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='browser', password='x', is_customer=True)
+        cls.asha = ChefProfile.objects.create(chef_name='Asha', cooking_experience=5, speciality='Curry')
+        cls.ravi = ChefProfile.objects.create(chef_name='Ravi', cooking_experience=2, speciality='Dosa')
+        for chef, name, price, servings, minutes, available in [
+            (cls.asha, 'Curry', '12.00', 2, 40, True),
+            (cls.asha, 'Dal', '8.00', 2, 20, True),
+            (cls.asha, 'Biryani', '24.00', 4, 90, False),
+            (cls.ravi, 'Dosa', '6.00', 1, 10, True),
+            (cls.ravi, 'Idli', '5.00', None, None, True),
+        ]:
+            MealKit.objects.create(
+                chef=chef, meal_name=name, price=Decimal(price), servings=servings, ingredients='rice',
+                preparation_time=timedelta(minutes=minutes) if minutes else None, is_available=available,
+            )
+        Company.objects.create(company_name='Greens', email='g@example.com', food_type=Company.VEG, category=Company.LUNCH)
+        Company.objects.create(company_name='Grill', email='r@example.com', food_type=Company.NON_VEG, category=Company.DINNER)
+
+    def counts(self, facet):
+        return {entry['value']: entry['count'] for entry in facet}
+
+    def test_meal_kit_facets_count_under_the_other_selections(self):
+        response = self.client.get('/api/meal-kits/', {'facets': 'all', 'price': 'under-10,10-20', 'is_available': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 4)
+        facets = response.json()['facets']
+        # A facet's own selection does not narrow its counts
+        self.assertEqual(self.counts(facets['price']), {'under-10': 3, '10-20': 1, '20-50': 0, '50-plus': 0})
+        self.assertEqual(self.counts(facets['is_available']), {'true': 4, 'false': 0})
+        self.assertEqual(self.counts(facets['servings']), {'2': 2, '1': 1})
+        self.assertEqual(self.counts(facets['preparation_time']), {'under-15': 1, '15-30': 1, '30-60': 1, '60-plus': 0})
+        self.assertEqual(facets['chef'][0], {'value': str(self.asha.pk), 'label': 'Asha', 'count': 2, 'selected': False})
+        self.assertTrue(facets['price'][0]['selected'])
+
+        # Without ?facets= the response keeps its shape
+        self.assertNotIn('facets', self.client.get('/api/meal-kits/', {'chef': self.ravi.pk}).json())
+        self.assertEqual(self.client.get('/api/meal-kits/', {'chef': self.ravi.pk}).json()['count'], 2)
+
+    def test_all_facets_are_counted_in_one_query(self):
+        selection = {MEAL_KIT_FACETS[0]: {'under-10'}}
+        with self.assertNumQueries(1):
+            facets = count_facets(MealKit.objects.all(), MEAL_KIT_FACETS, selection)
+        self.assertEqual(self.counts(facets['chef']), {str(self.asha.pk): 1, str(self.ravi.pk): 2})
+
+    def test_company_facets_and_invalid_values(self):
+        response = self.client.get('/api/companies/', {'facets': 'food_type,category', 'category': 'dinner'})
+        self.assertEqual([company['company_name'] for company in response.json()['results']], ['Grill'])
+        self.assertEqual(self.counts(response.json()['facets']['food_type']), {'veg': 0, 'non_veg': 1, 'both': 0})
+        self.assertEqual(self.counts(response.json()['facets']['category']), {'breakfast': 0, 'lunch': 1, 'dinner': 1})
+
+        self.assertEqual(self.client.get('/api/companies/', {'food_type': 'vegan'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/meal-kits/', {'facets': 'colour'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/meal-kits/', {'chef': 'asha'}).status_code, 400)
@@ -0,0 +1,162 @@
+# Import the modules needed to revoke refresh tokens cheaply and prune old ones
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import get_response_cache
+from .metrics import BLACKLIST_CHECKS, TOKEN_REFRESHES
+
+# Prefix of the shared cache keys holding a token's revocation state
+REVOCATION_KEY_PREFIX = 'token-revoked'
+
+# Rows deleted per statement by the pruning
+PRUNE_BATCH_SIZE = 5000
+
+
+# Revoked token ids by expiry: a bounded in-process TTL set in front of the
+# shared cache, in front of the BlacklistedToken table
+class RevocationCache:
+    def __init__(self, max_size=100_000):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # jti -> expiry as a UNIX timestamp, oldest first
+        self.revoked = OrderedDict()
+
+    def _key(self, jti):
+        return f'{REVOCATION_KEY_PREFIX}:{jti}'
+
+    def _remember(self, jti, expires_at):
+        with self.lock:
+            self.revoked[jti] = expires_at
+            self.revoked.move_to_end(jti)
+            if len(self.revoked) > self.max_size:
+                # Drop expired entries first, then the oldest ones
+                now = time.time()
+                for key in [key for key, expiry in self.revoked.items() if expiry <= now]:
+                    del self.revoked[key]
+                while len(self.revoked) > self.max_size:
+                    self.revoked.popitem(last=False)
+
+    # Record a revocation in this process and in the shared cache
+    def add(self, jti, expires_at):
+        remaining = expires_at - time.time()
+        if remaining <= 0:
+            return
+        self._remember(jti, expires_at)
+        get_response_cache().set(self._key(jti), True, int(remaining) + 1)
+
+    # Whether the token is revoked; the database is only asked on a cache miss
+    def is_revoked(self, jti, expires_at):
+        expiry = self.revoked.get(jti)
+        if expiry is not None and expiry > time.time():
+            BLACKLIST_CHECKS.inc('memory')
+            return True
+
+        cache = get_response_cache()
+        state = cache.get(self._key(jti))
+        if state is not None:
+            BLACKLIST_CHECKS.inc('cache')
+            if state:
+                self._remember(jti, expires_at)
+            return state
+
+        BLACKLIST_CHECKS.inc('database')
+        revoked = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        if revoked:
+            self.add(jti, expires_at)
+        else:
+            # Only a cache shared by every worker sees their revocations, so
+            # caching "not revoked" is configured per deployment
+            timeout = min(getattr(settings, 'TOKEN_REVOCATION_CACHE_TIMEOUT', 0), int(expires_at - time.time()))
+            if timeout > 0:
+                # add() never replaces the True a concurrent revocation just wrote
+                cache.add(self._key(jti), False, timeout)
+        return revoked
+
+    def clear(self):
+        with self.lock:
+            self.revoked.clear()
+
+
+# Revocations known to this process
+revocations = RevocationCache()
+
+
+# Claim of an access token naming the refresh token of its session, so that a
+# logout presenting only the access token revokes that refresh token
+SESSION_CLAIM = 'refresh_jti'
+
+
+# Refresh token whose access tokens carry SESSION_CLAIM
+class SessionRefreshToken(RefreshToken):
+    @property
+    def access_token(self):
+        access = super().access_token
+        access[SESSION_CLAIM] = self[api_settings.JTI_CLAIM]
+        return access
+
+
+# Refresh token whose blacklist check goes through `revocations`
+class RevocationCheckedRefreshToken(SessionRefreshToken):
+    def check_blacklist(self):
+        if revocations.is_revoked(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            raise TokenError(_('Token is blacklisted'))
+
+
+# Token refresh that checks revocations through the cache
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocationCheckedRefreshToken
+
+    def validate(self, attrs):
+        try:
+            data = super().validate(attrs)
+        except Exception:
+            TOKEN_REFRESHES.inc('failure')
+            raise
+        if 'refresh' in data:
+            # A rotated session continues with the new refresh token
+            data['access'] = str(self.token_class(data['refresh'], verify=False).access_token)
+        TOKEN_REFRESHES.inc('success')
+        return data
+
+
+# Delete outstanding tokens (and their blacklist entries) that expired before
+# `before`, walking the table in primary key order `batch_size` rows at a time;
+# returns the number of (outstanding, blacklisted) rows deleted
+def prune_expired_tokens(before=None, batch_size=PRUNE_BATCH_SIZE, pause=0.0):
+    before = before or timezone.now()
+    # A token created after this can not have expired by `before`
+    cutoff = before - api_settings.REFRESH_TOKEN_LIFETIME
+    outstanding = blacklisted = 0
+    last = 0
+    while True:
+        # A primary key range scan: expires_at has no index on a large table
+        rows = list(
+            OutstandingToken.objects.filter(pk__gt=last).order_by('pk').values_list('pk', 'created_at', 'expires_at')[:batch_size]
+        )
+        if not rows:
+            break
+        last = rows[-1][0]
+        expired = [pk for pk, created_at, expires_at in rows if expires_at < before]
+        if expired:
+            with transaction.atomic():
+                deleted, per_model = OutstandingToken.objects.filter(pk__in=expired).delete()
+            outstanding += per_model.get(OutstandingToken._meta.label, 0)
+            blacklisted += per_model.get(BlacklistedToken._meta.label, 0)
+        # Rows are inserted in creation order, so once the last row of a batch was
+        # created after the cutoff no later row can have expired yet
+        if rows[-1][1] is not None and rows[-1][1] >= cutoff:
+            break
+        if pause:
+            time.sleep(pause)
+    return outstanding, blacklisted
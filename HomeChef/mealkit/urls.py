@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from .async_views import *
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from rest_framework.permissions import AllowAny
@@ -71,6 +72,11 @@ urlpatterns = [
     path('meal-kits/', MealKitListView.as_view(), name='meal-kit-list'),
     # URL pattern for meal kit detail view
     path('meal-kits/<int:pk>/', MealKitDetailView.as_view(), name='meal-kit-detail'),
+    # URL pattern for bulk creating and updating meal kits
+    path('meal-kits/bulk/', MealKitBulkView.as_view(), name='meal-kit-bulk'),
+
+    # URL pattern for the combined catalog feed of meal kits, chefs, ratings and plans
+    path('catalog-feed/', CatalogFeedView.as_view(), name='catalog-feed'),
 
     # URL pattern for listing gift cards
     path('gift-cards/', GiftCardListView.as_view(), name='gift-card-list'),
@@ -81,11 +87,22 @@ urlpatterns = [
     path('cart/', CartItemListView.as_view(), name='cart-item-list'),
     # URL pattern for cart item detail view
     path('cart/<int:pk>/', CartItemDetailView.as_view(), name='cart-item-detail'),
+    # URL pattern for bulk creating and updating cart items
+    path('cart/bulk/', CartItemBulkView.as_view(), name='cart-item-bulk'),
+    # URL pattern for checking out the whole cart
+    path('cart/checkout/', CartCheckoutView.as_view(), name='cart-checkout'),
+
+    # URL pattern for booking a chef service
+    path('chef-bookings/', ChefBookingView.as_view(), name='chef-booking'),
+    # URL pattern for searching free chefs by service type and time
+    path('chef-availability/', ChefAvailabilityView.as_view(), name='chef-availability'),
 
     # URL pattern for listing orders
     path('orders/', OrderListView.as_view(), name='order-list'),
     # URL pattern for order detail view
     path('orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
+    # URL pattern for bulk creating and updating orders
+    path('orders/bulk/', OrderBulkView.as_view(), name='order-bulk'),
 
     # URL pattern for listing reviews
     path('reviews/', ReviewListView.as_view(), name='review-list'),
@@ -96,12 +113,39 @@ urlpatterns = [
     path('deliveries/', DeliveryListView.as_view(), name='delivery-list'),
     # URL pattern for delivery detail view
     path('deliveries/<int:pk>/', DeliveryDetailView.as_view(), name='delivery-detail'),
+    # URL pattern for bulk creating and updating deliveries
+    path('deliveries/bulk/', DeliveryBulkView.as_view(), name='delivery-bulk'),
+    # URL pattern for planning the routes of a day's deliveries
+    path('dispatch/plan/', DispatchPlanView.as_view(), name='dispatch-plan'),
+    # URL pattern for reading the planned routes of a day
+    path('dispatch/routes/', DispatchRoutesView.as_view(), name='dispatch-routes'),
+    # URL pattern for updating the status of every delivery on a route
+    path('dispatch/routes/<int:pk>/status/', DispatchRouteStatusView.as_view(), name='dispatch-route-status'),
 
     # URL pattern for listing payments
     path('payments/', PaymentListView.as_view(), name='payment-list'),
     # URL pattern for payment detail view
     path('payments/<int:pk>/', PaymentDetailView.as_view(), name='payment-detail'),
 
+    # URL pattern for the database connection pool metrics
+    path('db-pool-stats/', DatabasePoolStatsView.as_view(), name='db-pool-stats'),
+
+    # URL pattern for the grouped sales figures
+    path('analytics/sales/', SalesAnalyticsView.as_view(), name='sales-analytics'),
+
+    # URL pattern for streaming table exports, e.g. exports/orders.csv
+    path('exports/<slug:dataset>.<slug:file_format>', DataExportView.as_view(), name='data-export'),
+
+    # URL patterns for the async catalog views served under ASGI
+    path('async/meal-kits/', AsyncMealKitListView.as_view(), name='meal-kit-list-async'),
+    path('async/meal-kits/<int:pk>/', AsyncMealKitDetailView.as_view(), name='meal-kit-detail-async'),
+    path('async/chef-profiles/', AsyncChefProfileListView.as_view(), name='chef-profile-list-async'),
+    path('async/chef-profiles/<int:pk>/', AsyncChefProfileDetailView.as_view(), name='chef-profile-detail-async'),
+    path('async/companies/', AsyncCompanyListView.as_view(), name='company-list-async'),
+    path('async/companies/<int:pk>/', AsyncCompanyDetailView.as_view(), name='company-detail-async'),
+    path('async/subscription-plans/', AsyncSubscriptionPlanListView.as_view(), name='subscription-plan-list-async'),
+    path('async/subscription-plans/<int:pk>/', AsyncSubscriptionPlanDetailView.as_view(), name='subscription-plan-detail-async'),
+
     # URL pattern for Swagger UI documentation
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     # URL pattern for ReDoc documentation
@@ -1,19 +1,49 @@
 # Import necessary modules and classes from rest_framework and other packages
+import os
+
 from rest_framework import generics, status
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken ,BlacklistedToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from .models import *
+from .auth import authenticate_login, get_login_user_type, issue_tokens, revoke_session
+from .tokens import RevocationCheckedRefreshToken
 from .serializers import *
+from .mixins import EagerLoadingMixin
+from .fastpath import FastListMixin
+from .cache import CachedResponseMixin
+from .catalog import FIRST_BUILD_RETRY_AFTER, accepts_gzip, etag_matches, get_catalog_snapshot
+from .bulk import BulkCreateUpdateAPIView
+from .pagination import KeysetSwitchMixin
+from .search import MEAL_KIT_SEARCH_WEIGHTS, MealKitSearchFilter
+from .facets import COMPANY_FACETS, MEAL_KIT_FACETS, FacetedListMixin, FacetFilter
+from .db.pool import get_pool_stats
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS_REGISTRY
+from .permissions import HasMetricsToken
+from .analytics import parse_date_range, parse_sales_query, sales_report
+from .checkout import CheckoutConflict, checkout_cart
+from .dispatch import ROUTE_MAX_STOPS, parse_delivery_day, plan_routes, set_route_status
+from .bookings import BookingConflict, available_services, book_service, parse_availability_query
+from .exports import EXPORT_CONTENT_TYPES, EXPORTS, ExportContentNegotiation, aiter_chunks, iter_export
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
+from django.core.handlers.asgi import ASGIRequest
 
+from django.db.models import Prefetch
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import NotFound, PermissionDenied
+from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.pagination import PageNumberPagination
 
 # Custom Pagination Class
-class CustomPagination(PageNumberPagination):
+# Views may set `pagination_mode = 'cursor'` and clients may pass `?pagination=cursor`
+# (or a `cursor`) to switch to keyset pagination; `?count=exact|approximate|none`
+# controls how the total count is computed
+class CustomPagination(KeysetSwitchMixin, PageNumberPagination):
     # Set default page size
     page_size = 2
     # Allow clients to override the page size using the `page_size` query parameter
@@ -43,28 +73,26 @@ class CustomerRegisterView(generics.CreateAPIView):
 class UserLoginView(APIView):
     # Allow any user to access this view
     permission_classes = [AllowAny]
+    # Credentials come in the body; do not decode any Authorization header
+    authentication_classes = []
 
     def post(self, request, *args, **kwargs):
         # Get username and password from the request data
         username = request.data.get('username')
         password = request.data.get('password')
-        # Find the user by username
-        user = User.objects.filter(username=username).first()
+        # Find the user and verify the password with one query
+        user = authenticate_login(username, password)
 
         if user is not None:
             # Check the type of user and generate JWT tokens
-            if user.is_customer or user.is_company or user.is_chef:
-                refresh = RefreshToken.for_user(user)
-                if user.is_customer:
-                    user_type = 'customer'
-                elif user.is_company:
-                    user_type = 'company'
-                else:
-                    user_type = 'chef'
+            user_type = get_login_user_type(user)
+            if user_type is not None:
+                # The outstanding-token row is written in batches after the response
+                refresh, access = issue_tokens(user)
                 # Return the JWT tokens and user type
                 return Response({
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
+                    'refresh': refresh,
+                    'access': access,
                     'user_type': user_type
                 })
             else:
@@ -77,8 +105,16 @@ class UserLoginView(APIView):
 class Logout(APIView):
     def post(self,request):
         try:
-            token=OutstandingToken.objects.filter(user=request.user).latest('created_at')
-            BlacklistedToken.objects.create(token=token)
+            refresh = request.data.get('refresh')
+            if refresh:
+                # Revoke the refresh token the client presents
+                token = RevocationCheckedRefreshToken(refresh)
+                if str(token.payload.get(api_settings.USER_ID_CLAIM)) != str(request.user.pk):
+                    raise TokenError('Token belongs to another user')
+                token.blacklist()
+            else:
+                # Revoke the refresh token of the session the access token belongs to
+                revoke_session(request.user, request.auth)
             return Response({"message": "Successfully logged out."}, status=status.HTTP_200_OK)
         
         except Exception as e:
@@ -86,7 +122,7 @@ class Logout(APIView):
     
 
 # Customer List View
-class CustomerListView(generics.ListAPIView):
+class CustomerListView(EagerLoadingMixin, generics.ListAPIView):
     # Define the queryset to retrieve all Customer objects
     queryset = Customer.objects.all()
     # Use CustomerSerializer to serialize the queryset
@@ -101,42 +137,50 @@ class CustomerListView(generics.ListAPIView):
     filterset_fields = ['customer_name']
 
 # Customer Detail View
-class CustomerDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CustomerDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Customer objects
     queryset = Customer.objects.all()
     # Use CustomerSerializer to serialize the queryset
     serializer_class = CustomerSerializer
 
 # Company List View
-class CompanyListCreateView(generics.ListCreateAPIView):
+class CompanyListCreateView(CachedResponseMixin, FacetedListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all Company objects
     queryset = Company.objects.all()
     # Use CompanyRegisterSerializer to serialize the queryset
     serializer_class = CompanyRegisterSerializer
+    # Cache responses until one of these models changes
+    cache_models = [Company]
     # Use the custom pagination class
     pagination_class = CustomPagination
-    # Add filter backends for searching, ordering, and filtering
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    # Add filter backends for searching, ordering, filtering and facets
+    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter, FacetFilter]
     # Define search fields
     search_fields = ['food_type', 'category']
     # Define ordering fields
     ordering_fields = ['company_name', 'food_type']
     # Define filterset fields
     filterset_fields = ['company_name']
+    # Define the facets selectable with e.g. ?food_type=veg and counted with ?facets=all
+    facets = COMPANY_FACETS
 
 # Company Detail View
-class CompanyDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CompanyDetailView(CachedResponseMixin, EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Company objects
     queryset = Company.objects.all()
     # Use CompanySerializer to serialize the queryset
     serializer_class = CompanySerializer
+    # Cache responses until one of these models changes
+    cache_models = [Company]
 
 # ChefProfile List View
-class ChefProfileListCreateView(generics.ListCreateAPIView):
+class ChefProfileListCreateView(CachedResponseMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all ChefProfile objects
     queryset = ChefProfile.objects.all()
     # Use ChefProfileSerializer to serialize the queryset
     serializer_class = ChefProfileRegisterSerializer
+    # Cache responses until one of these models changes
+    cache_models = [ChefProfile]
     # Use the custom pagination class
     pagination_class = CustomPagination
     # Add filter backends for searching, ordering, and filtering
@@ -144,23 +188,27 @@ class ChefProfileListCreateView(generics.ListCreateAPIView):
     # Define search fields
     search_fields = ['chef_name', 'cooking_experience', 'speciality']
     # Define ordering fields
-    ordering_fields = ['chef_name', 'rating']
+    ordering_fields = ['chef_name', 'rating', 'review_count']
     # Define filterset fields
     filterset_fields = ['speciality']
 
 # ChefProfile Detail View
-class ChefProfileDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ChefProfileDetailView(CachedResponseMixin, EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all ChefProfile objects
     queryset = ChefProfile.objects.all()
     # Use ChefProfileSerializer to serialize the queryset
     serializer_class = ChefProfileSerializer
+    # Cache responses until one of these models changes
+    cache_models = [ChefProfile]
 
 # Subscription Plan List View
-class SubscriptionPlanListView(generics.ListCreateAPIView):
+class SubscriptionPlanListView(CachedResponseMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all SubscriptionPlan objects
     queryset = SubscriptionPlan.objects.all()
     # Use SubscriptionPlanSerializer to serialize the queryset
     serializer_class = SubscriptionPlanSerializer
+    # Cache responses until one of these models changes
+    cache_models = [SubscriptionPlan, Company]
     # Use the custom pagination class
     pagination_class = CustomPagination
     # Add filter backends for searching, ordering, and filtering
@@ -173,14 +221,16 @@ class SubscriptionPlanListView(generics.ListCreateAPIView):
     filterset_fields = ['price']
 
 # Subscription Plan Detail View
-class SubscriptionPlanDetailView(generics.RetrieveUpdateDestroyAPIView):
+class SubscriptionPlanDetailView(CachedResponseMixin, EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all SubscriptionPlan objects
     queryset = SubscriptionPlan.objects.all()
     # Use SubscriptionPlanSerializer to serialize the queryset
     serializer_class = SubscriptionPlanSerializer
+    # Cache responses until one of these models changes
+    cache_models = [SubscriptionPlan, Company]
 
 # Subscription List View
-class SubscriptionListView(generics.ListCreateAPIView):
+class SubscriptionListView(EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all Subscription objects
     queryset = Subscription.objects.all()
     # Use SubscriptionSerializer to serialize the queryset
@@ -194,41 +244,80 @@ class SubscriptionListView(generics.ListCreateAPIView):
     # Define ordering fields
     ordering_fields = ['start_date', 'end_date']
     # Define filterset fields
-    filterset_fields = ['start_date', 'end_date']
+    filterset_fields = ['start_date', 'end_date', 'is_active']
 
 # Subscription Detail View
-class SubscriptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+class SubscriptionDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Subscription objects
     queryset = Subscription.objects.all()
     # Use SubscriptionSerializer to serialize the queryset
     serializer_class = SubscriptionSerializer
 
 # Meal Kit List View
-class MealKitListView(generics.ListCreateAPIView):
+class MealKitListView(CachedResponseMixin, FacetedListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all MealKit objects
     queryset = MealKit.objects.all()
     # Use MealKitSerializer to serialize the queryset
     serializer_class = MealKitSerializer
+    # Cache responses until one of these models changes
+    cache_models = [MealKit, ChefProfile]
     # Use the custom pagination class
     pagination_class = CustomPagination
-    # Add filter backends for searching, ordering, and filtering
-    filter_backends = [DjangoFilterBackend, OrderingFilter, SearchFilter]
+    # Add filter backends for ranked full-text searching, ordering, filtering and facets
+    filter_backends = [DjangoFilterBackend, OrderingFilter, MealKitSearchFilter, FacetFilter]
     # Define search fields
-    search_fields = ['meal_name', 'ingredients', 'company__company_name']
+    search_fields = list(MEAL_KIT_SEARCH_WEIGHTS)
     # Define ordering fields
-    ordering_fields = ['meal_name', 'price']
+    ordering_fields = ['meal_name', 'price', 'rating', 'review_count']
     # Define filterset fields
     filterset_fields = ['meal_name']
+    # Define the facets selectable with e.g. ?price=10-20&chef=3 and counted with ?facets=all
+    facets = MEAL_KIT_FACETS
+
+# Catalog Feed View
+# Every meal kit with its chef, rating summary and availability, and the active
+# subscription plans, in one response served from the newest prebuilt snapshot
+# without reading the catalog tables (see mealkit/catalog.py)
+class CatalogFeedView(APIView):
+    def get(self, request, *args, **kwargs):
+        snapshot = get_catalog_snapshot()
+        if snapshot is None:
+            return Response(
+                {'detail': 'The catalog feed is being built, try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(FIRST_BUILD_RETRY_AFTER)},
+            )
+        if etag_matches(request.headers.get('If-None-Match', ''), snapshot.etag):
+            response = HttpResponseNotModified()
+        elif accepts_gzip(request):
+            # Sent as stored, compressed once when the snapshot was built
+            response = HttpResponse(snapshot.compressed, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(snapshot.content, content_type='application/json')
+        response['ETag'] = f'W/"{snapshot.etag}"'
+        response['X-Catalog-Version'] = str(snapshot.version)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
 
 # Meal Kit Detail View
-class MealKitDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MealKitDetailView(CachedResponseMixin, EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all MealKit objects
     queryset = MealKit.objects.all()
     # Use MealKitSerializer to serialize the queryset
     serializer_class = MealKitSerializer
+    # Cache responses until one of these models changes
+    cache_models = [MealKit, ChefProfile]
+
+# Meal Kit Bulk View
+class MealKitBulkView(BulkCreateUpdateAPIView):
+    # Define the queryset used to look up meal kits being updated
+    queryset = MealKit.objects.all()
+    # Use MealKitBulkSerializer to validate and write the items
+    serializer_class = MealKitBulkSerializer
 
 # Gift Card List View
-class GiftCardListView(generics.ListCreateAPIView):
+class GiftCardListView(EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all GiftCard objects
     queryset = GiftCard.objects.all()
     # Use GiftCardSerializer to serialize the queryset
@@ -240,19 +329,19 @@ class GiftCardListView(generics.ListCreateAPIView):
     # Define search fields
     search_fields = ['card_number', 'amount', 'customer__customer_name']
     # Define ordering fields
-    ordering_fields = ['amount', 'expiry_date']
+    ordering_fields = ['gift_amount', 'expiry_date']
     # Define filterset fields
     filterset_fields = ['expiry_date']
 
 # Gift Card Detail View
-class GiftCardDetailView(generics.RetrieveUpdateDestroyAPIView):
+class GiftCardDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all GiftCard objects
     queryset = GiftCard.objects.all()
     # Use GiftCardSerializer to serialize the queryset
     serializer_class = GiftCardSerializer
 
 # Cart Item List View
-class CartItemListView(generics.ListCreateAPIView):
+class CartItemListView(EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all CartItem objects
     queryset = CartItem.objects.all()
     # Use CartItemSerializer to serialize the queryset
@@ -269,14 +358,99 @@ class CartItemListView(generics.ListCreateAPIView):
     filterset_fields = ['quantity']
 
 # Cart Item Detail View
-class CartItemDetailView(generics.RetrieveUpdateDestroyAPIView):
+class CartItemDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all CartItem objects
     queryset = CartItem.objects.all()
     # Use CartItemSerializer to serialize the queryset
     serializer_class = CartItemSerializer
 
+# Cart Item Bulk View
+class CartItemBulkView(BulkCreateUpdateAPIView):
+    # Define the queryset used to look up cart items being updated
+    queryset = CartItem.objects.all()
+    # Use CartItemBulkSerializer to validate and write the items
+    serializer_class = CartItemBulkSerializer
+
+# Cart Checkout View
+# POST {"payment_method": ..., "delivery_address"?: ..., "delivery_date"?: ...} turns the
+# requesting customer's whole cart into orders, payments and deliveries in one transaction
+class CartCheckoutView(APIView):
+    def post(self, request, *args, **kwargs):
+        customer = Customer.objects.filter(user=request.user).first()
+        if customer is None:
+            raise PermissionDenied('Only customers can check out.')
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            result = checkout_cart(customer, **serializer.validated_data)
+        except CheckoutConflict:
+            # Another order of this customer was created at the same moment; nothing was written
+            return Response({'detail': 'Checkout conflicted with another order, please retry.'}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'orders': [
+                {'id': order.pk, 'meal_kit': order.meal_kit_id, 'quantity': order.quantity, 'total_amount': order.total_amount}
+                for order in result.orders
+            ],
+            'total_amount': result.total_amount,
+            'gift_card_credit': result.gift_card_credit,
+        }, status=status.HTTP_201_CREATED)
+
+# Chef Booking View
+# POST {"service": ..., "service_date": ..., "event_type": ...} books a chef service for the
+# requesting customer, or answers 409 when the chef is already booked at that time
+class ChefBookingView(APIView):
+    def post(self, request, *args, **kwargs):
+        customer = Customer.objects.filter(user=request.user).first()
+        if customer is None:
+            raise PermissionDenied('Only customers can book chefs.')
+        serializer = ChefBookingSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            booking = book_service(customer, **serializer.validated_data)
+        except BookingConflict as exc:
+            conflict = exc.args[0]
+            return Response({
+                'detail': 'The chef is already booked at that time.',
+                'booked_from': conflict.service_date,
+                'booked_until': conflict.service_end,
+            }, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'id': booking.pk,
+            'service': booking.service_id,
+            'chef': booking.chef_id,
+            'service_date': booking.service_date,
+            'service_end': booking.service_end,
+            'total_price': booking.total_price,
+            'status': booking.status,
+        }, status=status.HTTP_201_CREATED)
+
+# Chef Availability View
+# ?service_type=party_chef&date=YYYY-MM-DD lists the available services whose chef is free
+# long enough that day, with the free ranges; ?start= (ISO 8601) instead of ?date= asks
+# for the service's whole duration from that time
+class ChefAvailabilityView(APIView):
+    def get(self, request, *args, **kwargs):
+        service_type, start, end = parse_availability_query(request.query_params)
+        results = available_services(service_type, start, end)
+        return Response({
+            'service_type': service_type,
+            'start': start,
+            'end': end,
+            'results': [
+                {
+                    'service': service.pk,
+                    'chef': service.chef_id,
+                    'chef_name': service.chef.chef_name,
+                    'price': service.price,
+                    'duration': service.duration,
+                    'free': [{'start': slot_start, 'end': slot_end} for slot_start, slot_end in slots],
+                }
+                for service, slots in results
+            ],
+        })
+
 # Order List View
-class OrderListView(generics.ListCreateAPIView):
+class OrderListView(FastListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all Order objects
     queryset = Order.objects.all()
     # Use OrderSerializer to serialize the queryset
@@ -288,19 +462,28 @@ class OrderListView(generics.ListCreateAPIView):
     # Define search fields
     search_fields = ['customer__customer_name', 'total_amount']
     # Define ordering fields
-    ordering_fields = ['total_amount', 'status']
+    ordering_fields = ['total_amount', 'status', 'order_date']
+    # Define the default ordering for cursor pagination
+    keyset_ordering = ['-order_date', '-id']
     # Define filterset fields
-    filterset_fields = ['status']
+    filterset_fields = ['status', 'customer']
 
 # Order Detail View
-class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
+class OrderDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Order objects
     queryset = Order.objects.all()
     # Use OrderSerializer to serialize the queryset
     serializer_class = OrderSerializer
 
+# Order Bulk View
+class OrderBulkView(BulkCreateUpdateAPIView):
+    # Define the queryset used to look up orders being updated
+    queryset = Order.objects.all()
+    # Use OrderBulkSerializer to validate and write the items
+    serializer_class = OrderBulkSerializer
+
 # Review List View
-class ReviewListView(generics.ListCreateAPIView):
+class ReviewListView(EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all Review objects
     queryset = Review.objects.all()
     # Use ReviewSerializer to serialize the queryset
@@ -317,14 +500,14 @@ class ReviewListView(generics.ListCreateAPIView):
     filterset_fields = ['rating']
 
 # Review Detail View
-class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ReviewDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Review objects
     queryset = Review.objects.all()
     # Use ReviewSerializer to serialize the queryset
     serializer_class = ReviewSerializer
 
 # Delivery List View
-class DeliveryListView(generics.ListCreateAPIView):
+class DeliveryListView(EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all Delivery objects
     queryset = Delivery.objects.all()
     # Use DeliverySerializer to serialize the queryset
@@ -337,18 +520,27 @@ class DeliveryListView(generics.ListCreateAPIView):
     search_fields = ['delivery_date', 'delivery_status']
     # Define ordering fields
     ordering_fields = ['delivery_date', 'delivery_status']
+    # Define the default ordering for cursor pagination
+    keyset_ordering = ['-delivery_date', '-id']
     # Define filterset fields
     filterset_fields = ['delivery_status']
 
 # Delivery Detail View
-class DeliveryDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DeliveryDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Delivery objects
     queryset = Delivery.objects.all()
     # Use DeliverySerializer to serialize the queryset
     serializer_class = DeliverySerializer
 
+# Delivery Bulk View
+class DeliveryBulkView(BulkCreateUpdateAPIView):
+    # Define the queryset used to look up deliveries being updated
+    queryset = Delivery.objects.all()
+    # Use DeliveryBulkSerializer to validate and write the items
+    serializer_class = DeliveryBulkSerializer
+
 # Payment List View
-class PaymentListView(generics.ListCreateAPIView):
+class PaymentListView(FastListMixin, EagerLoadingMixin, generics.ListCreateAPIView):
     # Define the queryset to retrieve all Payment objects
     queryset = Payment.objects.all()
     # Use PaymentSerializer to serialize the queryset
@@ -361,12 +553,145 @@ class PaymentListView(generics.ListCreateAPIView):
     search_fields = ['payment_date', 'amount', 'customer__customer_name']
     # Define ordering fields
     ordering_fields = ['payment_date', 'amount']
+    # Define the default ordering for cursor pagination
+    keyset_ordering = ['-payment_date', '-id']
     # Define filterset fields
     filterset_fields = ['payment_date']
 
 # Payment Detail View
-class PaymentDetailView(generics.RetrieveUpdateDestroyAPIView):
+class PaymentDetailView(EagerLoadingMixin, generics.RetrieveUpdateDestroyAPIView):
     # Define the queryset to retrieve all Payment objects
     queryset = Payment.objects.all()
     # Use PaymentSerializer to serialize the queryset
     serializer_class = PaymentSerializer
+
+# Database Pool Stats View
+class DatabasePoolStatsView(APIView):
+    # Only staff may read the pool metrics
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        # Checkouts, wait time and pool size of this worker process
+        return Response({'pid': os.getpid(), 'pools': get_pool_stats()})
+
+# Metrics View
+# Prometheus text format; with METRICS_DIR set, the totals of every worker process
+class MetricsView(APIView):
+    # The scraper sends the METRICS_TOKEN instead of a user's JWT
+    authentication_classes = []
+    # Check the scraper's token
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(METRICS_REGISTRY.expose(), content_type=METRICS_CONTENT_TYPE)
+
+# Sales Analytics View
+# ?source=order|payment|booking|subscription, ?group_by=day|week|month|status|meal_kit|chef|company
+# (comma separated), ?start=/?end= (YYYY-MM-DD, inclusive); grouped in SQL over the daily
+# rollup kept by `manage.py refresh_sales_rollup`, or over the source table with ?live=true
+class SalesAnalyticsView(APIView):
+    # Only staff may read sales figures
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        query = parse_sales_query(request.query_params)
+        results, totals = sales_report(query)
+        return Response({
+            'source': query.source,
+            'group_by': query.group_by,
+            'live': query.live,
+            'results': results,
+            'totals': totals,
+        })
+
+# Data Export View
+# GET exports/<orders|payments|deliveries|subscriptions>.<csv|ndjson>?start=&end= streams
+# every matching row, oldest first, fetching EXPORT_CHUNK_SIZE rows per query
+class DataExportView(APIView):
+    # Only staff may export whole tables
+    permission_classes = [IsAdminUser]
+    # Accept text/csv or application/x-ndjson without a 406
+    content_negotiation_class = ExportContentNegotiation
+
+    def get(self, request, dataset, file_format, *args, **kwargs):
+        if dataset not in EXPORTS or file_format not in EXPORT_CONTENT_TYPES:
+            raise NotFound('Unknown export.')
+        start, end = parse_date_range(request.query_params)
+        chunks = iter_export(dataset, file_format, start, end)
+        # Under ASGI the chunks must come from an async iterator to be streamed
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=EXPORT_CONTENT_TYPES[file_format])
+        # Name the download after the table and the requested range
+        filename = '-'.join([dataset] + [day.isoformat() for day in (start, end) if day])
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+        return response
+
+# Dispatch Plan View
+# POST {"date": "YYYY-MM-DD", "zones"?: [...], "max_stops"?: 40} groups that day's unrouted
+# pending deliveries by zone and stores ordered routes of at most max_stops stops
+class DispatchPlanView(APIView):
+    # Only staff may plan deliveries
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        serializer = DispatchPlanSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        plans = plan_routes(
+            serializer.validated_data['date'],
+            serializer.validated_data.get('zones'),
+            serializer.validated_data.get('max_stops', ROUTE_MAX_STOPS),
+        )
+        return Response({
+            'routes': [
+                {'id': route.pk, 'zone': route.zone, 'distance': route.distance, 'stops': [delivery.pk for delivery in stops]}
+                for route, stops in plans
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+# Dispatch Routes View
+# ?date=YYYY-MM-DD lists the routes planned for that day with their stops in order
+class DispatchRoutesView(APIView):
+    # Only staff may read the routes
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        day = parse_delivery_day(request.query_params)
+        routes = DeliveryRoute.objects.filter(delivery_day=day).order_by('zone', 'pk').prefetch_related(
+            Prefetch('deliveries', queryset=Delivery.objects.order_by('route_position'))
+        )
+        return Response({
+            'date': day,
+            'routes': [
+                {
+                    'id': route.pk,
+                    'zone': route.zone,
+                    'distance': route.distance,
+                    'stops': [
+                        {
+                            'id': delivery.pk,
+                            'order': delivery.order_id,
+                            'delivery_address': delivery.delivery_address,
+                            'latitude': delivery.latitude,
+                            'longitude': delivery.longitude,
+                            'delivery_status': delivery.delivery_status,
+                        }
+                        for delivery in route.deliveries.all()
+                    ],
+                }
+                for route in routes
+            ],
+        })
+
+# Dispatch Route Status View
+# POST {"delivery_status": ...} sets the status of every delivery on the route at once
+class DispatchRouteStatusView(APIView):
+    # Only staff may update routes
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk, *args, **kwargs):
+        route = get_object_or_404(DeliveryRoute, pk=pk)
+        serializer = RouteStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        deliveries = set_route_status(route, serializer.validated_data['delivery_status'])
+        return Response({'id': route.pk, 'delivery_status': serializer.validated_data['delivery_status'], 'updated': len(deliveries)})